@@ -0,0 +1,68 @@
+"""
+Per-request auth overhead: python-jose vs the HMAC fast path vs a token cache hit.
+
+    python benchmarks/bench_auth_overhead.py --iterations 20000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jose import jwt  # noqa: E402
+
+from src.database.models import User  # noqa: E402
+from src.services.auth import Auth  # noqa: E402
+from src.services.cache import LRUCache, user_cache  # noqa: E402
+from src.services.tokens import HMACJWT  # noqa: E402
+
+
+def per_call_us(func, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return round((time.perf_counter() - started) / iterations * 1e6, 2)
+
+
+async def per_call_us_async(func, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await func()
+    return round((time.perf_counter() - started) / iterations * 1e6, 2)
+
+
+async def main(args):
+    auth = Auth()
+    token = await auth.create_access_token({'sub': 'bench@example.com'})
+    user_cache.local.set('bench@example.com', user_cache.dumps(User(id=1, email='bench@example.com')), ttl=3600)
+    hmac_backend = HMACJWT()
+
+    async def current_user(cache_tokens: bool):
+        if not cache_tokens:
+            auth.token_cache.clear()
+        return await auth.get_current_user(token, None)
+
+    auth.token_cache = LRUCache(maxsize=16, ttl=0)
+    results = {
+        'iterations': args.iterations,
+        'jose_decode_us': per_call_us(lambda: jwt.decode(token, auth.SECRET_KEY, algorithms=['HS256']),
+                                      args.iterations),
+        'hmac_decode_us': per_call_us(lambda: hmac_backend.decode(token, auth.SECRET_KEY, algorithms=['HS256']),
+                                      args.iterations),
+    }
+    auth.jwt_backend = jwt
+    results['get_current_user_jose_us'] = await per_call_us_async(lambda: current_user(False), args.iterations)
+    auth.jwt_backend = hmac_backend
+    results['get_current_user_hmac_us'] = await per_call_us_async(lambda: current_user(False), args.iterations)
+    results['get_current_user_token_cache_hit_us'] = await per_call_us_async(lambda: current_user(True),
+                                                                             args.iterations)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=10000)
+    asyncio.run(main(parser.parse_args()))
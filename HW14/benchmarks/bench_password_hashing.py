@@ -0,0 +1,71 @@
+"""
+Login throughput under concurrency: inline bcrypt vs the bounded PasswordHasher pool.
+
+Besides logins/s, reports the worst event-loop stall seen by a heartbeat task while
+the logins run - that is the latency every other endpoint in the worker would see.
+
+    python benchmarks/bench_password_hashing.py --concurrency 32 --logins 64 --workers 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.password import PasswordHasher, pwd_context  # noqa: E402
+
+
+async def heartbeat(stop: asyncio.Event, interval: float = 0.005) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst
+
+
+async def run(verify, concurrency: int, logins: int, hashed: str) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(heartbeat(stop))
+
+    async def one():
+        async with semaphore:
+            await verify('123456789', hashed)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    return {'logins': logins, 'seconds': round(elapsed, 3), 'logins_per_s': round(logins / elapsed, 1),
+            'max_event_loop_stall_ms': round(await monitor * 1000, 1)}
+
+
+async def main(args):
+    hashed = pwd_context.hash('123456789')
+
+    async def inline(password, hashed_password):
+        return pwd_context.verify_and_update(password, hashed_password)
+
+    hasher = PasswordHasher(args.executor, args.workers, max_queue=args.logins)
+    results = {
+        'concurrency': args.concurrency,
+        'workers': args.workers,
+        'executor': args.executor,
+        'before_inline': await run(inline, args.concurrency, args.logins, hashed),
+        'after_pool': await run(hasher.verify_and_update, args.concurrency, args.logins, hashed),
+    }
+    hasher.shutdown()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--logins', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4)
+    parser.add_argument('--executor', choices=['thread', 'process'], default='thread')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,90 @@
+"""
+Cost of fetching and serializing one large contacts list.
+
+"before" is the response_model path: ORM objects, ContactResponse validation per row,
+jsonable_encoder and json.dumps. "after" selects only the response columns as row tuples
+and writes them with orjson (as_rows=True + serialize(), what the list/search routes use).
+Both are measured with and without the database fetch.
+
+    python benchmarks/bench_serialization.py --contacts 10000 --iterations 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine  # noqa: E402
+
+from src.database.models import Base, Contact, User, get_birthday_key  # noqa: E402
+from src.repository.contacts import get_contacts  # noqa: E402
+from src.routes.contacts import serialize  # noqa: E402
+from src.schemas import ContactResponse  # noqa: E402
+
+
+def response_model(contacts) -> bytes:
+    return json.dumps(jsonable_encoder([ContactResponse.from_orm(contact) for contact in contacts])).encode()
+
+
+async def per_call_ms(func, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await func()
+    return round((time.perf_counter() - started) / iterations * 1e3, 2)
+
+
+async def main(args):
+    engine = create_async_engine('sqlite+aiosqlite://')
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSession(engine, expire_on_commit=False) as db:
+        user = User(id=1, username='bench', email='bench@example.com', password='x')
+        db.add(user)
+        await db.flush()
+        await db.execute(insert(Contact), [
+            dict(first_name=f'First{i}', last_name=f'Last{i}', email=f'contact{i}@example.com',
+                 phone_number=f'{i:010d}', birthday=date(1990, 1 + i % 12, 1 + i % 28), other_data='bench',
+                 birthday_key=get_birthday_key(date(1990, 1 + i % 12, 1 + i % 28)), user_id=1)
+            for i in range(args.contacts)])
+        await db.commit()
+
+        contacts = await get_contacts(user, db)
+        rows = await get_contacts(user, db, as_rows=True)
+        assert json.loads(response_model(contacts)) == json.loads(serialize(rows))
+
+        async def before():
+            db.expunge_all()
+            return response_model(await get_contacts(user, db))
+
+        async def after():
+            return serialize(await get_contacts(user, db, as_rows=True))
+
+        async def before_serialize_only():
+            return response_model(contacts)
+
+        async def after_serialize_only():
+            return serialize(rows)
+
+        results = {
+            'contacts': args.contacts,
+            'iterations': args.iterations,
+            'before_fetch_and_serialize_ms': await per_call_ms(before, args.iterations),
+            'after_fetch_and_serialize_ms': await per_call_ms(after, args.iterations),
+            'before_serialize_only_ms': await per_call_ms(before_serialize_only, args.iterations),
+            'after_serialize_only_ms': await per_call_ms(after_serialize_only, args.iterations),
+        }
+    await engine.dispose()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--contacts', type=int, default=10000)
+    parser.add_argument('--iterations', type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,127 @@
+"""
+Throughput of the contacts endpoints served over TCP: one uvicorn process against gunicorn
+with several uvicorn workers (python serve.py --workers N).
+
+Seeds a SQLite database, starts each server configuration as a subprocess, waits for it to
+answer and drives the list, search and birthdays endpoints at a fixed concurrency from this
+process. Rate limiting is off; Redis is whatever REDIS_HOST points to (the caches treat an
+unreachable Redis as misses). The load generator shares the machine with the server, so
+compare configurations on the same host, with more CPUs than workers.
+
+    python benchmarks/bench_serve.py --workers 1 4 --requests 2000 --concurrency 64
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+import httpx  # noqa: E402
+
+from bench_api import percentile, seed  # noqa: E402
+from src.conf.gunicorn_conf import cpu_count  # noqa: E402
+from src.services.auth import auth_service  # noqa: E402
+
+
+async def wait_ready(client: httpx.AsyncClient, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'server exited with {process.returncode}')
+        try:
+            if (await client.get('/')).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise TimeoutError('server did not start')
+
+
+async def load(client: httpx.AsyncClient, paths: list[str], headers: list[dict], concurrency: int,
+               requests: int) -> dict:
+    counter = itertools.count()
+    latencies, errors = [], 0
+
+    async def worker():
+        nonlocal errors
+        while (i := next(counter)) < requests:
+            started = time.perf_counter()
+            response = await client.get(paths[i % len(paths)], headers=headers[i % len(headers)])
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        'requests': requests,
+        'errors': errors,
+        'rps': round(requests / elapsed, 1),
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+    }
+
+
+async def bench(args, workers: int, emails: list[str]) -> dict:
+    env = dict(os.environ, SQLALCHEMY_DATABASE_URL=args.sync_url, SQLALCHEMY_ASYNC_DATABASE_URL=args.async_url,
+               RATE_LIMIT_ENABLED='false')
+    bind = f'127.0.0.1:{args.port}'
+    process = subprocess.Popen([sys.executable, 'serve.py', '--workers', str(workers), '--bind', bind], cwd=ROOT,
+                               env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    headers = [{'Authorization': f"Bearer {await auth_service.create_access_token(data={'sub': email})}"}
+               for email in emails]
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=f'http://{bind}', limits=limits, timeout=60) as client:
+            await wait_ready(client, process)
+            endpoints = {
+                'contacts_list': ['/api/contacts/?limit=50'],
+                'contacts_search': [f'/api/contacts/search/keyword=Last{i}' for i in range(args.contacts)],
+                'contacts_birthdays': ['/api/contacts/birthdays/7'],
+            }
+            results = {}
+            for name, paths in endpoints.items():
+                await load(client, paths, headers, args.concurrency, args.concurrency)  # warm up
+                results[name] = await load(client, paths, headers, args.concurrency, args.requests)
+            return results
+    finally:
+        process.terminate()
+        process.wait(30)
+
+
+async def main(args):
+    emails = seed(args.sync_url, args.users, args.contacts)
+    results = {'cpus': cpu_count(), 'concurrency': args.concurrency, 'servers': {}}
+    for workers in args.workers:
+        name = 'uvicorn' if workers == 1 else f'gunicorn_{workers}_workers'
+        results['servers'][name] = await bench(args, workers, emails)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    db_file = os.path.join(tempfile.gettempdir(), 'hw14_bench_serve.db')
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sync-url', default=f'sqlite:///{db_file}')
+    parser.add_argument('--async-url', default=f'sqlite+aiosqlite:///{db_file}')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, cpu_count()])
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--contacts', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    asyncio.run(main(parser.parse_args()))
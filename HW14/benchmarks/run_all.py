@@ -0,0 +1,50 @@
+"""
+Run every benchmark with small, fixed settings and collect the reports into one JSON file.
+
+Each script runs in its own process so module-level state (engines, caches) does not leak
+between them. Compare two commits by running this on each and diffing the outputs:
+
+    python benchmarks/run_all.py --output bench-$(git rev-parse --short HEAD).json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+BENCHMARKS = {
+    'api': ['bench_api.py', '--requests', '300', '--login-requests', '20'],
+    'auth_overhead': ['bench_auth_overhead.py', '--iterations', '5000'],
+    'password_hashing': ['bench_password_hashing.py', '--logins', '16'],
+    'serialization': ['bench_serialization.py', '--iterations', '3'],
+    'db_concurrency': ['bench_db_concurrency.py', '--requests', '300'],
+    'startup': ['bench_startup.py', '--runs', '3'],
+    'serve': ['bench_serve.py', '--requests', '300'],
+}
+
+
+def main(args):
+    results = {}
+    for name, command in BENCHMARKS.items():
+        if args.only and name not in args.only:
+            continue
+        completed = subprocess.run([sys.executable, os.path.join(HERE, command[0]), *command[1:]],
+                                   capture_output=True, text=True)
+        if completed.returncode:
+            results[name] = {'error': completed.stderr.strip().splitlines()[-1:]}
+        else:
+            results[name] = json.loads(completed.stdout)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', nargs='*', choices=sorted(BENCHMARKS))
+    parser.add_argument('--output')
+    main(parser.parse_args())
@@ -1,23 +1,91 @@
-import redis.asyncio as redis
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from datetime import timedelta
 
 from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 from starlette.middleware.cors import CORSMiddleware
-from fastapi_limiter import FastAPILimiter
+from starlette.staticfiles import StaticFiles
 
 from src.conf.config import settings
-from src.database.db import get_db
+from src.database.db import AsyncSessionLocal, dispose_engines, get_db, pool_metrics, replicas, warm_pool
+from src.repository import contacts as repository_contacts
+from src.services.background import background_tasks
+from src.services.cache import close_redis, redis_client
+from src.services.email import precompile_templates
+from src.services.gravatar import gravatar_checker
+from src.services.metrics import MetricsMiddleware, registry, startup_duration
+from src.services.password import password_hasher
+from src.services.rate_limit import RateLimitHeadersMiddleware
+from src.services.upload_avatar import avatar_service, configure_cloudinary
 from src.routes import contacts, auth, users
 
-app = FastAPI()
 
+async def startup_step(step: str, func, *args):
+    started = time.perf_counter()
+    try:
+        result = func(*args)
+        if hasattr(result, '__await__'):
+            await result
+    except Exception as e:
+        # a dependency that is down at boot should not keep the app from starting
+        logging.warning('Startup step %s failed: %s', step, e)
+    finally:
+        startup_duration.set(time.perf_counter() - started, step)
+
+
+async def purge_tombstones_once(interval: float) -> bool:
+    """Purge unless another worker already did within ``interval``; returns whether this one did."""
+    if not await redis_client.set('contacts:tombstones:purge', 1, nx=True, ex=max(int(interval), 1)):
+        return False
+    async with AsyncSessionLocal() as db:
+        now = await repository_contacts.database_now(db)
+        before = now - timedelta(days=settings.contacts_tombstone_retention_days)
+        await repository_contacts.purge_tombstones(db, before)
+    return True
+
+
+async def purge_tombstones(interval: float):
+    """Drop change feed tombstones past their retention; clients with older cursors sync from scratch."""
+    while True:
+        try:
+            await purge_tombstones_once(interval)
+        except Exception as e:
+            logging.warning('Purging tombstones failed: %s', e)
+        await asyncio.sleep(interval)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    await startup_step('cloudinary', configure_cloudinary)
+    await startup_step('templates', precompile_templates)
+    await startup_step('redis', redis_client.ping)
+    await startup_step('db_pool', warm_pool, settings.db_pool_warm)
+    await startup_step('replicas', replicas.check)
+    periodic = [asyncio.create_task(purge_tombstones(settings.contacts_tombstone_purge_interval_seconds))]
+    if replicas:
+        periodic.append(asyncio.create_task(replicas.run(settings.db_replica_check_interval)))
+    startup_duration.set(time.perf_counter() - started, 'total')
+    logging.info('Startup took %.1f ms', (time.perf_counter() - started) * 1000)
+    yield
+    for task in periodic:
+        task.cancel()
+    cancelled = await background_tasks.drain(settings.shutdown_timeout)
+    if cancelled:
+        logging.warning('Cancelled %s background tasks on shutdown', cancelled)
+    password_hasher.shutdown()
+    avatar_service.shutdown()
+    await gravatar_checker.close()
+    await close_redis()
+    await dispose_engines()
 
-@app.on_event("startup")
-async def startup():
-    r = await redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0)
-    await FastAPILimiter.init(r)
 
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -27,6 +95,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(RateLimitHeadersMiddleware)
+
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware, server_timing=settings.server_timing)
+
 
 @app.get('/')
 async def root():
@@ -34,18 +107,32 @@ async def root():
 
 
 @app.get('/api/healthchecker')
-def healthchecker(db: Session = Depends(get_db)):
+async def healthchecker(db: AsyncSession = Depends(get_db)):
     try:
-        request = db.execute(text('SELECT 1')).fetchone()
+        request = (await db.execute(text('SELECT 1'))).fetchone()
         if request is None:
             raise HTTPException(status_code=500, detail='Database is nor configured correctly')
         return {'message': 'Welcome to FastAPI'}
-    except Exception as e:
-        print(e)
+    except Exception:
+        logging.exception('Healthcheck failed')
         raise HTTPException(status_code=500, detail='Error connecting to the database')
 
 
+@app.get('/api/metrics/pool')
+async def pool_metrics_view():
+    return pool_metrics.snapshot()
+
+
+@app.get('/metrics', include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type='text/plain; version=0.0.4')
+
+
 app.include_router(auth.router, prefix='/api')
 app.include_router(contacts.router, prefix='/api')
 app.include_router(users.router, prefix='/api')
 
+if settings.avatar_storage == 'local':
+    app.mount(settings.avatar_local_url, StaticFiles(directory=settings.avatar_local_dir, check_dir=False),
+              name='avatars')
+
@@ -0,0 +1,39 @@
+"""'Contacts search index'
+
+Revision ID: 4e6c7717bd74
+Revises: da4e42bfd3e5
+Create Date: 2023-06-03 16:05:42.731016
+
+"""
+from alembic import op
+
+from src.database.models import CONTACTS_FTS_DDL
+
+
+# revision identifiers, used by Alembic.
+revision = '4e6c7717bd74'
+down_revision = 'da4e42bfd3e5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute(
+            "CREATE INDEX ix_contacts_search_trgm ON contacts USING gin "
+            "((first_name || ' ' || last_name || ' ' || email) gin_trgm_ops)"
+        )
+    elif op.get_bind().dialect.name == 'sqlite':
+        for statement in CONTACTS_FTS_DDL:
+            op.execute(statement)
+        op.execute("INSERT INTO contacts_fts(contacts_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_contacts_search_trgm', table_name='contacts')
+    elif op.get_bind().dialect.name == 'sqlite':
+        for trigger in ('contacts_fts_ai', 'contacts_fts_ad', 'contacts_fts_au'):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS contacts_fts")
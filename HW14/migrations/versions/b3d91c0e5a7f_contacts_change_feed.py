@@ -0,0 +1,37 @@
+"""'Contacts change feed'
+
+Revision ID: b3d91c0e5a7f
+Revises: f6415eb65b2e
+Create Date: 2023-06-12 09:41:27.318406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3d91c0e5a7f'
+down_revision = 'f6415eb65b2e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("UPDATE contacts SET updated_at = coalesce(created_at, now()) WHERE updated_at IS NULL")
+    op.create_index('ix_contacts_user_id_updated_at', 'contacts', ['user_id', 'updated_at', 'id'], unique=False)
+    op.create_table('contact_tombstones',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('contact_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_contact_tombstones_user_id_deleted_at', 'contact_tombstones',
+                    ['user_id', 'deleted_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contact_tombstones_user_id_deleted_at', table_name='contact_tombstones')
+    op.drop_table('contact_tombstones')
+    op.drop_index('ix_contacts_user_id_updated_at', table_name='contacts')
@@ -0,0 +1,23 @@
+"""'Contact tombstones deleted_at index'
+
+Revision ID: c4e2a9d17b86
+Revises: b3d91c0e5a7f
+Create Date: 2023-06-14 10:02:51.604127
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e2a9d17b86'
+down_revision = 'b3d91c0e5a7f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_contact_tombstones_deleted_at', 'contact_tombstones', ['deleted_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contact_tombstones_deleted_at', table_name='contact_tombstones')
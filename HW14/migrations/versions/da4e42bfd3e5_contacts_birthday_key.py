@@ -0,0 +1,30 @@
+"""'Contacts birthday key'
+
+Revision ID: da4e42bfd3e5
+Revises: 629a7faf9ee0
+Create Date: 2023-06-02 11:40:17.218394
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'da4e42bfd3e5'
+down_revision = '629a7faf9ee0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('contacts', sa.Column('birthday_key', sa.Integer(), nullable=True))
+    op.execute(
+        "UPDATE contacts SET birthday_key = "
+        "CAST(EXTRACT(MONTH FROM birthday) AS INTEGER) * 100 + CAST(EXTRACT(DAY FROM birthday) AS INTEGER)"
+    )
+    op.create_index('ix_contacts_user_id_birthday_key', 'contacts', ['user_id', 'birthday_key'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_user_id_birthday_key', table_name='contacts')
+    op.drop_column('contacts', 'birthday_key')
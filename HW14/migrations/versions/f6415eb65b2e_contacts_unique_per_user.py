@@ -0,0 +1,33 @@
+"""'Contacts unique per user'
+
+Revision ID: f6415eb65b2e
+Revises: 4e6c7717bd74
+Create Date: 2023-06-05 10:12:48.550271
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6415eb65b2e'
+down_revision = '4e6c7717bd74'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.drop_index('ix_contacts_email', table_name='contacts')
+    op.drop_index('ix_contacts_phone_number', table_name='contacts')
+    op.create_index(op.f('ix_contacts_email'), 'contacts', ['email'], unique=False)
+    op.create_index(op.f('ix_contacts_phone_number'), 'contacts', ['phone_number'], unique=False)
+    op.create_unique_constraint('uq_contacts_user_id_email', 'contacts', ['user_id', 'email'])
+    op.create_unique_constraint('uq_contacts_user_id_phone_number', 'contacts', ['user_id', 'phone_number'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_contacts_user_id_phone_number', 'contacts', type_='unique')
+    op.drop_constraint('uq_contacts_user_id_email', 'contacts', type_='unique')
+    op.drop_index('ix_contacts_phone_number', table_name='contacts')
+    op.drop_index('ix_contacts_email', table_name='contacts')
+    op.create_index(op.f('ix_contacts_phone_number'), 'contacts', ['phone_number'], unique=True)
+    op.create_index(op.f('ix_contacts_email'), 'contacts', ['email'], unique=True)
@@ -0,0 +1,46 @@
+"""
+Serve the API: gunicorn managing uvicorn workers (uvloop + httptools), configured by
+src/conf/gunicorn_conf.py and the WEB_* settings.
+
+    python serve.py
+    python serve.py --workers 4 --bind 0.0.0.0:8080
+    python serve.py --workers 1    # a single uvicorn process, without gunicorn
+"""
+import argparse
+
+import uvicorn
+from gunicorn.app.base import BaseApplication
+
+from src.conf import gunicorn_conf
+
+
+class Server(BaseApplication):
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings:
+                self.cfg.set(key, value)
+
+    def load(self):
+        from main import app
+        return app
+
+
+def main(args):
+    if args.workers == 1:
+        host, _, port = args.bind.rpartition(':')
+        uvicorn.run('main:app', host=host, port=int(port), loop='uvloop', http='httptools',
+                    backlog=gunicorn_conf.backlog, timeout_keep_alive=gunicorn_conf.keepalive)
+        return
+    options = {key: value for key, value in vars(gunicorn_conf).items() if not key.startswith('_')}
+    Server({**options, 'bind': args.bind, 'workers': args.workers}).run()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bind', default=gunicorn_conf.bind)
+    parser.add_argument('--workers', type=int, default=gunicorn_conf.workers)
+    main(parser.parse_args())
@@ -0,0 +1,49 @@
+"""
+Gunicorn settings for serving the API with uvicorn workers. serve.py uses them, and so can gunicorn itself:
+
+    gunicorn -c src/conf/gunicorn_conf.py main:app
+"""
+import os
+
+from uvicorn.workers import UvicornWorker
+
+from src.conf.config import settings
+
+
+def cpu_count() -> int:
+    """CPUs this process may run on; unlike os.cpu_count() this respects container CPU sets."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class Worker(UvicornWorker):
+    CONFIG_KWARGS = {'loop': 'uvloop', 'http': 'httptools', 'lifespan': 'on'}
+
+
+bind = f"{settings.web_host}:{settings.web_port}"
+# async workers each serve many requests at once, so one per CPU is enough
+workers = settings.web_workers or cpu_count()
+worker_class = 'src.conf.gunicorn_conf.Worker'
+# import the app once in the master; workers fork with the code already loaded
+preload_app = True
+keepalive = settings.web_keepalive
+backlog = settings.web_backlog
+timeout = settings.web_timeout
+# longer than the lifespan's own drain, so that it can finish
+graceful_timeout = int(settings.shutdown_timeout) + 5
+max_requests = settings.web_max_requests
+max_requests_jitter = settings.web_max_requests // 10
+
+
+def post_fork(server, worker):
+    """Drop connections inherited from the master; each worker opens (and warms, in the lifespan) its own."""
+    from src.database.db import async_engine, engine, replicas
+    from src.services.cache import redis_client
+
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+    for replica in replicas.engines:
+        replica.sync_engine.dispose(close=False)
+    redis_client.connection_pool.reset()
@@ -1,17 +1,88 @@
-from sqlalchemy import create_engine
+import asyncio
+from contextlib import AsyncExitStack
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker
 
 from src.conf.config import settings
+from src.database.pool import PoolMetrics, TimedAsyncAdaptedQueuePool
+from src.database.replicas import RecentWrites, ReplicaSet, RoutingSession
+from src.services.metrics import instrument_engine, registry
 
 
 SQLALCHEMY_DATABASE_URL = settings.sqlalchemy_database_url
+SQLALCHEMY_ASYNC_DATABASE_URL = settings.sqlalchemy_async_database_url
+
+
+def engine_options() -> dict:
+    return dict(
+        echo=settings.db_echo,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+    )
+
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, echo=True, max_overflow=5)
+# Sync engine: kept as a fallback for alembic migrations and scripts
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options())
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(SQLALCHEMY_ASYNC_DATABASE_URL, poolclass=TimedAsyncAdaptedQueuePool,
+                                   **engine_options())
+pool_metrics = PoolMetrics().attach(async_engine.pool)
+registry.add_collector(pool_metrics.render)
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+
+# Optional read replicas for the read-only repository calls; without them everything uses async_engine
+replicas = ReplicaSet([create_async_engine(url, poolclass=TimedAsyncAdaptedQueuePool, **engine_options())
+                       for url in settings.sqlalchemy_async_replica_urls], settings.db_replica_check_timeout)
+recent_writes = RecentWrites(settings.db_replica_sticky_seconds)
+for replica in replicas.engines:
+    instrument_engine(replica.sync_engine)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, sync_session_class=RoutingSession,
+                                       replicas=replicas, recent_writes=recent_writes,
+                                       autoflush=False, expire_on_commit=False)
+
+
+async def warm_pool(connections: int) -> int:
+    """Open up to ``connections`` pooled connections at startup so the first requests don't pay for connecting."""
+    connections = min(connections, settings.db_pool_size)
+    if connections <= 0:
+        return 0
+    async with AsyncExitStack() as stack:
+        opened = await asyncio.gather(*(stack.enter_async_context(async_engine.connect()) for _ in range(connections)))
+        for conn in opened:
+            await conn.execute(text('SELECT 1'))
+    return len(opened)
+
+
+async def dispose_engines():
+    await async_engine.dispose()
+    await replicas.dispose()
+    engine.dispose()
+
+
+async def use_primary_if_recent_write(email: str, db: AsyncSession):
+    """Tie the session to ``email``'s request: its writes are remembered, and if it wrote recently reads stay on the primary."""
+    if not replicas:
+        return
+    db.info['user'] = email
+    if await recent_writes.contains(email):
+        db.info['primary'] = True
+
 
 # Dependency
-def get_db():
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def get_sync_db():
     db = SessionLocal()
     try:
         yield db
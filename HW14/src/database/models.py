@@ -1,23 +1,63 @@
-from sqlalchemy import Column, Integer, String, DateTime, func, Date, ForeignKey, Boolean
-from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy import Column, Integer, String, DateTime, func, Date, ForeignKey, Boolean, Index, DDL, event, \
+    UniqueConstraint
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.orm import declarative_base, relationship, validates
 
 Base = declarative_base()
 
+# SQLite stores func.now() defaults as "YYYY-MM-DD HH:MM:SS" text; bound datetimes are written the same way
+# so that both compare correctly, which the keyset cursors over updated_at rely on
+Timestamp = DateTime().with_variant(
+    sqlite.DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"), 'sqlite')
+
+
+def get_birthday_key(birthday) -> int:
+    # month * 100 + day, comparable across years (Feb 29 sorts between Feb 28 and Mar 1)
+    return birthday.month * 100 + birthday.day
+
 
 class Contact(Base):
     __tablename__ = 'contacts'
     id = Column(Integer, primary_key=True, index=True)
     first_name = Column(String, nullable=False, index=True)
     last_name = Column(String, nullable=False, index=True)
-    email = Column(String, nullable=False, unique=True, index=True)
-    phone_number = Column(String, nullable=False, unique=True, index=True)
+    email = Column(String, nullable=False, index=True)
+    phone_number = Column(String, nullable=False, index=True)
     birthday = Column(Date, nullable=False, index=True)
+    birthday_key = Column(Integer, nullable=True)
     other_data = Column(String, nullable=True)
-    created_at = Column(DateTime, default=func.now())
-    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    created_at = Column(Timestamp, default=func.now())
+    updated_at = Column(Timestamp, default=func.now(), onupdate=func.now())
     user_id = Column(ForeignKey('users.id', ondelete='CASCADE'), default=None)
     user = relationship('User', backref="contacts")
 
+    __table_args__ = (
+        Index('ix_contacts_user_id_birthday_key', 'user_id', 'birthday_key'),
+        Index('ix_contacts_user_id_updated_at', 'user_id', 'updated_at', 'id'),
+        UniqueConstraint('user_id', 'email', name='uq_contacts_user_id_email'),
+        UniqueConstraint('user_id', 'phone_number', name='uq_contacts_user_id_phone_number'),
+    )
+
+    @validates('birthday')
+    def validate_birthday(self, key, birthday):
+        self.birthday_key = get_birthday_key(birthday) if birthday else None
+        return birthday
+
+
+class ContactTombstone(Base):
+    """A deleted contact, kept for a while so that the change feed can tell clients about the deletion."""
+    __tablename__ = 'contact_tombstones'
+    id = Column(Integer, primary_key=True)
+    contact_id = Column(Integer, nullable=False)
+    user_id = Column(ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    deleted_at = Column(Timestamp, default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index('ix_contact_tombstones_user_id_deleted_at', 'user_id', 'deleted_at', 'id'),
+        # for purging expired tombstones across all users
+        Index('ix_contact_tombstones_deleted_at', 'deleted_at'),
+    )
+
 
 class User(Base):
     __tablename__ = "users"
@@ -29,3 +69,26 @@ class User(Base):
     avatar = Column(String(255), nullable=True)
     refresh_token = Column(String(255), nullable=True)
     confirmed = Column(Boolean, default=False)
+
+
+# Full-text search over contacts: SQLite keeps an FTS5 trigram index in sync via triggers,
+# Postgres uses a pg_trgm GIN index created by migration
+CONTACTS_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS contacts_fts USING fts5("
+    "first_name, last_name, email, content='contacts', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS contacts_fts_ai AFTER INSERT ON contacts BEGIN "
+    "INSERT INTO contacts_fts(rowid, first_name, last_name, email) "
+    "VALUES (new.id, new.first_name, new.last_name, new.email); END",
+    "CREATE TRIGGER IF NOT EXISTS contacts_fts_ad AFTER DELETE ON contacts BEGIN "
+    "INSERT INTO contacts_fts(contacts_fts, rowid, first_name, last_name, email) "
+    "VALUES ('delete', old.id, old.first_name, old.last_name, old.email); END",
+    "CREATE TRIGGER IF NOT EXISTS contacts_fts_au AFTER UPDATE ON contacts BEGIN "
+    "INSERT INTO contacts_fts(contacts_fts, rowid, first_name, last_name, email) "
+    "VALUES ('delete', old.id, old.first_name, old.last_name, old.email); "
+    "INSERT INTO contacts_fts(rowid, first_name, last_name, email) "
+    "VALUES (new.id, new.first_name, new.last_name, new.email); END",
+]
+
+for statement in CONTACTS_FTS_DDL:
+    event.listen(Contact.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+event.listen(Contact.__table__, 'before_drop', DDL("DROP TABLE IF EXISTS contacts_fts").execute_if(dialect='sqlite'))
@@ -0,0 +1,105 @@
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from src.services.metrics import Histogram, render_histogram
+
+CHECKOUT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class PoolMetrics:
+    """Connection pool counters fed by SQLAlchemy pool events, plus a checkout latency histogram."""
+
+    def __init__(self):
+        self.checkout_latency = Histogram(CHECKOUT_BUCKETS)
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.pool = None
+
+    def attach(self, pool):
+        self.pool = pool
+        pool.metrics = self
+        event.listen(pool, 'connect', self.on_connect)
+        event.listen(pool, 'checkout', self.on_checkout)
+        event.listen(pool, 'checkin', self.on_checkin)
+        event.listen(pool, 'invalidate', self.on_invalidate)
+        return self
+
+    def on_connect(self, dbapi_connection, connection_record):
+        self.connects += 1
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self.checkouts += 1
+        self.checked_out += 1
+        self.max_checked_out = max(self.max_checked_out, self.checked_out)
+
+    def on_checkin(self, dbapi_connection, connection_record):
+        self.checked_out = max(self.checked_out - 1, 0)
+
+    def on_invalidate(self, dbapi_connection, connection_record, exception):
+        self.invalidations += 1
+
+    def snapshot(self) -> dict:
+        result = {
+            'checked_out': self.checked_out,
+            'max_checked_out': self.max_checked_out,
+            'checkouts': self.checkouts,
+            'connects': self.connects,
+            'invalidations': self.invalidations,
+            'timeouts': self.timeouts,
+            'checkout_latency_seconds': self.checkout_latency.snapshot(),
+        }
+        if isinstance(self.pool, QueuePool):
+            result.update(size=self.pool.size(), checked_in=self.pool.checkedin(), overflow=self.pool.overflow())
+        return result
+
+    def render(self) -> list[str]:
+        """Prometheus exposition lines, registered as a collector of the metrics registry."""
+        lines = []
+        for name, kind, value in (('db_pool_checked_out', 'gauge', self.checked_out),
+                                  ('db_pool_checkouts_total', 'counter', self.checkouts),
+                                  ('db_pool_connects_total', 'counter', self.connects),
+                                  ('db_pool_invalidations_total', 'counter', self.invalidations),
+                                  ('db_pool_timeouts_total', 'counter', self.timeouts)):
+            lines += [f'# TYPE {name} {kind}', f'{name} {value}']
+        lines.append('# TYPE db_pool_checkout_duration_seconds histogram')
+        lines += render_histogram('db_pool_checkout_duration_seconds', self.checkout_latency)
+        return lines
+
+
+class TimedPoolMixin:
+    """Times how long callers wait for a connection - pool events only fire once one is handed out."""
+    metrics: PoolMetrics | None = None
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            if self.metrics is not None:
+                self.metrics.timeouts += 1
+            raise
+        finally:
+            if self.metrics is not None:
+                self.metrics.checkout_latency.observe(time.perf_counter() - started)
+
+    def recreate(self):
+        # event listeners are carried over to the new pool by SQLAlchemy, only the back-reference moves
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        if self.metrics is not None:
+            self.metrics.pool = pool
+        return pool
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
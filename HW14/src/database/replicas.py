@@ -0,0 +1,163 @@
+import asyncio
+import itertools
+import logging
+
+from redis.exceptions import RedisError
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session
+
+from src.services.background import background_tasks
+from src.services.cache import LRUCache, redis_client
+from src.services.metrics import Counter, registry
+
+# bind_arguments for reads that may be served by a replica: db.execute(stmt, bind_arguments=REPLICA)
+REPLICA = {'replica': True}
+
+routed_reads = registry.register(Counter(
+    'db_routed_reads_total', 'Replica-eligible reads by the database they were sent to.', ('target',)))
+
+
+class ReplicaSet:
+    """
+    Read replicas picked round-robin, skipping the ones that failed their last health check.
+
+    ``check`` pings every replica; a replica is also taken out as soon as one of its connections
+    is reported disconnected, and comes back with the next successful check.
+    """
+
+    def __init__(self, engines: list[AsyncEngine], check_timeout: float = 2):
+        self.engines = engines
+        self.healthy = [True] * len(engines)
+        self.check_timeout = check_timeout
+        self._counter = itertools.count()
+        self._index = {engine.sync_engine: i for i, engine in enumerate(engines)}
+        for engine in engines:
+            event.listen(engine.sync_engine, 'handle_error', self.on_error)
+
+    def __bool__(self):
+        return bool(self.engines)
+
+    def choose(self) -> Engine | None:
+        for _ in range(len(self.engines)):
+            i = next(self._counter) % len(self.engines)
+            if self.healthy[i]:
+                return self.engines[i].sync_engine
+        return None
+
+    def set_healthy(self, i: int, healthy: bool):
+        if self.healthy[i] != healthy:
+            url = self.engines[i].url.render_as_string(hide_password=True)
+            logging.warning('Replica %s is %s', url, 'up' if healthy else 'down')
+        self.healthy[i] = healthy
+
+    def on_error(self, context):
+        if context.is_disconnect and context.engine in self._index:
+            self.set_healthy(self._index[context.engine], False)
+
+    async def ping(self, engine: AsyncEngine):
+        async with engine.connect() as conn:
+            await conn.execute(text('SELECT 1'))
+
+    async def check(self):
+        results = await asyncio.gather(*(asyncio.wait_for(self.ping(engine), self.check_timeout)
+                                         for engine in self.engines), return_exceptions=True)
+        for i, result in enumerate(results):
+            self.set_healthy(i, not isinstance(result, BaseException))
+
+    async def run(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await self.check()
+
+    async def dispose(self):
+        for engine in self.engines:
+            await engine.dispose()
+
+
+class RecentWrites:
+    """
+    Users who committed a write within the last ``window`` seconds.
+
+    Their reads go to the primary until replication has caught up with their own writes. Marks
+    are kept in-process and in Redis, so the next request sees them whichever worker serves it.
+    """
+    redis = redis_client
+
+    def __init__(self, window: float, size: int = 10000):
+        self.window = window
+        self.local = LRUCache(maxsize=size, ttl=window)
+
+    @staticmethod
+    def key(email: str) -> str:
+        return f"db:recent_write:{email}"
+
+    def mark(self, email: str):
+        self.local.set(email, True)
+        background_tasks.spawn(self.publish(email))
+
+    async def publish(self, email: str):
+        try:
+            await self.redis.set(self.key(email), 1, px=int(self.window * 1000))
+        except RedisError as e:
+            logging.warning(e)
+
+    async def contains(self, email: str) -> bool:
+        if self.local.get(email):
+            return True
+        try:
+            return bool(await self.redis.exists(self.key(email)))
+        except RedisError as e:
+            logging.warning(e)
+            # can't tell, so read from the primary
+            return True
+
+
+class RoutingSession(Session):
+    """
+    Session that sends reads executed with ``bind_arguments=REPLICA`` to a replica.
+
+    Writes always go to the primary, and so does every read once the session has written or
+    when ``info['primary']`` is set. ``info['user']`` names whose request this is: a commit that
+    wrote marks that user in ``recent_writes``.
+    """
+
+    def __init__(self, *args, replicas: ReplicaSet | None = None, recent_writes: RecentWrites | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.replicas = replicas
+        self.recent_writes = recent_writes
+
+    def get_bind(self, mapper=None, *, clause=None, replica: bool = False, **kwargs):
+        if replica and self.replicas:
+            engine = None if self.info.get('primary') else self.replicas.choose()
+            routed_reads.inc('primary' if engine is None else 'replica')
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper, clause=clause, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _on_execute(state):
+    if state.is_insert or state.is_update or state.is_delete:
+        state.session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _on_flush(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _on_commit(session):
+    if not session.info.pop('wrote', False):
+        return
+    session.info['primary'] = True
+    user = session.info.get('user')
+    if user and session.replicas and session.recent_writes is not None:
+        session.recent_writes.mark(user)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _on_rollback(session):
+    session.info.pop('wrote', None)
@@ -1,76 +1,319 @@
-from sqlalchemy import and_
-from sqlalchemy.orm import Session
-from src.database.models import Contact, User
-from src.schemas import ContactModel
-from datetime import date
+from sqlalchemy import Integer, and_, any_, bindparam, case, column, delete, func, insert, literal, \
+    literal_column, or_, select, table, tuple_, update as update_
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.database.models import Contact, ContactTombstone, User, get_birthday_key
+from src.database.replicas import REPLICA
+from src.schemas import ContactFilter, ContactModel, ContactResponse
+from src.services.cache import contacts_cache
+import base64
+from datetime import date, datetime, timedelta
+from typing import NamedTuple
 
+# Just the columns ContactResponse exposes, in its field order
+RESPONSE_COLUMNS = tuple(getattr(Contact, name) for name in ContactResponse.__fields__)
 
-async def get_contacts(user: User, db: Session):
-    contacts = db.query(Contact).filter(and_(Contact.user_id == user.id)).all()
-    return contacts
 
+def _select(as_rows: bool):
+    """Select ORM objects, or with ``as_rows`` plain row tuples of RESPONSE_COLUMNS for read-only responses."""
+    return select(*RESPONSE_COLUMNS) if as_rows else select(Contact)
 
-async def get_contact_by_id(user: User, contact_id: int, db: Session):
-    contact = db.query(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id)).first()
-    return contact
 
+async def get_contacts(user: User, db: AsyncSession, limit: int | None = None, after: int | None = None,
+                       as_rows: bool = False):
+    query = _select(as_rows).filter(and_(Contact.user_id == user.id)).order_by(Contact.id)
+    if after is not None:
+        query = query.filter(Contact.id > after)
+    if limit is not None:
+        query = query.limit(limit)
+    contacts = await db.execute(query, bind_arguments=REPLICA)
+    return contacts.all() if as_rows else contacts.scalars().all()
 
-async def get_contact_by_email(user: User, email: str, db: Session):
-    contact = db.query(Contact).filter(and_(Contact.user_id == user.id, email == email)).first()
-    return contact
 
+async def stream_contacts(user: User, db: AsyncSession, after: int | None = None, batch_size: int = 500,
+                          as_rows: bool = False):
+    query = _select(as_rows).filter(and_(Contact.user_id == user.id)).order_by(Contact.id)
+    if after is not None:
+        query = query.filter(Contact.id > after)
+    result = await db.stream(query.execution_options(yield_per=batch_size), bind_arguments=REPLICA)
+    if not as_rows:
+        result = result.scalars()
+    async for partition in result.partitions():
+        for contact in partition:
+            yield contact
+
+
+async def get_contact_by_id(user: User, contact_id: int, db: AsyncSession):
+    contact = await db.execute(select(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id)))
+    return contact.scalars().first()
+
+
+async def get_contact_by_email(user: User, email: str, db: AsyncSession):
+    contact = await db.execute(select(Contact).filter(and_(Contact.user_id == user.id, Contact.email == email)))
+    return contact.scalars().first()
+
+
+async def get_contact_by_phone(user: User, phone_number: str, db: AsyncSession):
+    contact = await db.execute(select(Contact).filter(and_(Contact.user_id == user.id, Contact.phone_number == phone_number)))
+    return contact.scalars().first()
+
+
+def _values(body: ContactModel) -> dict:
+    return dict(body.dict(), birthday_key=get_birthday_key(body.birthday))
 
-async def get_contact_by_phone(user: User, phone_number: str, db: Session):
-    contact = db.query(Contact).filter(and_(Contact.user_id == user.id, phone_number == phone_number)).first()
-    return contact
 
+def conflict_field(error: IntegrityError) -> str | None:
+    """Name the per-user unique constraint ("email" or "phone_number") an insert/update ran into."""
+    message = str(error.orig)
+    for field in ('phone_number', 'email'):
+        if field in message:
+            return field
+    return None
 
-async def create(user: User, body: ContactModel, db: Session):
-    contact = Contact(**body.dict(), user_id=user.id)
-    db.add(contact)
-    db.commit()
+
+async def create(user: User, body: ContactModel, db: AsyncSession):
+    # One INSERT ... RETURNING; duplicates are rejected by the (user_id, email/phone_number) constraints
+    try:
+        contact = await db.execute(insert(Contact).values(**_values(body), user_id=user.id).returning(Contact))
+        contact = contact.scalars().one()
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise
+    await contacts_cache.bump(user.id)
     return contact
 
 
-async def update(user: User, contact_id: int, body: ContactModel, db: Session):
-    contact = db.query(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id)).first()
+async def get_existing_keys(user: User, emails: list[str], phone_numbers: list[str], db: AsyncSession):
+    """Return the (emails, phone_numbers) among the given ones that the user already has, in one query."""
+    rows = await db.execute(select(Contact.email, Contact.phone_number).filter(
+        Contact.user_id == user.id, or_(Contact.email.in_(emails), Contact.phone_number.in_(phone_numbers))))
+    existing_emails, existing_phones = set(), set()
+    for email, phone_number in rows:
+        existing_emails.add(email)
+        existing_phones.add(phone_number)
+    return existing_emails, existing_phones
+
+
+async def create_many(user: User, bodies: list[ContactModel], db: AsyncSession) -> int:
+    if not bodies:
+        return 0
+    rows = [dict(body.dict(), birthday_key=get_birthday_key(body.birthday), user_id=user.id) for body in bodies]
+    await db.execute(insert(Contact), rows)
+    await db.commit()
+    await contacts_cache.bump(user.id)
+    return len(rows)
+
+
+async def update(user: User, contact_id: int, body: ContactModel, db: AsyncSession):
+    try:
+        contact = await db.execute(update_(Contact)
+                                   .filter(and_(Contact.id == contact_id, Contact.user_id == user.id))
+                                   .values(**_values(body))
+                                   .returning(Contact))
+        contact = contact.scalars().first()
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise
     if contact:
-        contact.first_name = body.first_name
-        contact.last_name = body.last_name
-        contact.email = body.email
-        contact.phone_number = body.phone_number
-        contact.birthday = body.birthday
-        contact.other_data = body.other_data
-        db.commit()
+        await contacts_cache.bump(user.id)
     return contact
 
 
-async def remove(user: User, contact_id: int, db: Session):
-    contact = db.query(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id)).first()
+async def remove(user: User, contact_id: int, db: AsyncSession):
+    contact = await db.execute(delete(Contact)
+                               .filter(and_(Contact.id == contact_id, Contact.user_id == user.id))
+                               .returning(Contact))
+    contact = contact.scalars().first()
     if contact:
-        db.delete(contact)
-        db.commit()
+        await _add_tombstones(user, [contact.id], db)
+    await db.commit()
+    if contact:
+        await contacts_cache.bump(user.id)
     return contact
 
 
-async def search_contact(user: User, keyword: str, db: Session):
-    contacts = db.query(Contact).filter(and_(Contact.user_id == user.id,
-                                             (Contact.first_name.ilike(f"%{keyword}%")) |
-                                             (Contact.last_name.ilike(f"%{keyword}%")) |
-                                             (Contact.email.ilike(f"%{keyword}%"))
-                                             )).all()
-    return contacts
+def _batch_condition(user: User, db: AsyncSession, ids: list[int] | None, contact_filter: ContactFilter | None):
+    condition = Contact.user_id == user.id
+    if ids is not None:
+        if db.get_bind().dialect.name == 'postgresql':
+            # one array parameter: the same statement (and prepared plan) whatever the number of ids
+            return and_(condition, Contact.id == any_(bindparam('ids', ids, type_=ARRAY(Integer))))
+        return and_(condition, Contact.id.in_(ids))
+    conditions = [condition]
+    if contact_filter.keyword is not None:
+        keyword = f"%{contact_filter.keyword}%"
+        conditions.append(or_(Contact.first_name.ilike(keyword), Contact.last_name.ilike(keyword),
+                              Contact.email.ilike(keyword)))
+    for field in ('email', 'phone_number', 'birthday'):
+        value = getattr(contact_filter, field)
+        if value is not None:
+            conditions.append(getattr(Contact, field) == value)
+    if contact_filter.created_before is not None:
+        conditions.append(Contact.created_at < contact_filter.created_before)
+    if contact_filter.created_after is not None:
+        conditions.append(Contact.created_at >= contact_filter.created_after)
+    return and_(*conditions)
+
+
+async def update_many(user: User, values: dict, db: AsyncSession, ids: list[int] | None = None,
+                      contact_filter: ContactFilter | None = None) -> list[int]:
+    """Apply ``values`` to the user's contacts given by ``ids`` or ``contact_filter`` in one UPDATE; return the updated ids."""
+    if 'birthday' in values:
+        values = dict(values, birthday_key=get_birthday_key(values['birthday']))
+    try:
+        updated = await db.execute(update_(Contact)
+                                   .where(_batch_condition(user, db, ids, contact_filter))
+                                   .values(**values)
+                                   .returning(Contact.id)
+                                   .execution_options(synchronize_session=False))
+        updated = updated.scalars().all()
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise
+    if updated:
+        await contacts_cache.bump(user.id)
+    return updated
+
+
+async def remove_many(user: User, db: AsyncSession, ids: list[int] | None = None,
+                      contact_filter: ContactFilter | None = None) -> list[int]:
+    """Delete the user's contacts given by ``ids`` or ``contact_filter`` in one DELETE; return the deleted ids."""
+    deleted = await db.execute(delete(Contact)
+                               .where(_batch_condition(user, db, ids, contact_filter))
+                               .returning(Contact.id)
+                               .execution_options(synchronize_session=False))
+    deleted = deleted.scalars().all()
+    await _add_tombstones(user, deleted, db)
+    await db.commit()
+    if deleted:
+        await contacts_cache.bump(user.id)
+    return deleted
+
+
+async def _add_tombstones(user: User, contact_ids: list[int], db: AsyncSession):
+    if contact_ids:
+        await db.execute(insert(ContactTombstone), [dict(contact_id=contact_id, user_id=user.id)
+                                                    for contact_id in contact_ids])
+
+
+class ChangesCursor(NamedTuple):
+    """Where a client is in the change feed: the last (updated_at, id) of contacts and of tombstones it has seen."""
+    updated_at: datetime
+    contact_id: int
+    deleted_at: datetime
+    tombstone_id: int
+
+    def encode(self) -> str:
+        raw = f"{self.updated_at.isoformat()}|{self.contact_id}|{self.deleted_at.isoformat()}|{self.tombstone_id}"
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    @classmethod
+    def decode(cls, cursor: str) -> 'ChangesCursor':
+        """Raise ValueError for anything that is not a cursor we issued."""
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            updated_at, contact_id, deleted_at, tombstone_id = raw.split('|')
+            result = cls(datetime.fromisoformat(updated_at), int(contact_id), datetime.fromisoformat(deleted_at),
+                         int(tombstone_id))
+        except (UnicodeDecodeError, ValueError) as e:
+            raise ValueError('Invalid cursor') from e
+        # issued cursors carry naive database timestamps; an offset could not be compared with them
+        if result.updated_at.tzinfo is not None or result.deleted_at.tzinfo is not None:
+            raise ValueError('Invalid cursor')
+        return result
+
+
+async def database_now(db: AsyncSession) -> datetime:
+    """The database clock, in the form func.now() column defaults are stored in."""
+    now = func.now() if db.get_bind().dialect.name == 'sqlite' else func.localtimestamp()
+    return await db.scalar(select(now))
+
+
+async def get_changes(user: User, db: AsyncSession, since: ChangesCursor | None, until: datetime, limit: int):
+    """
+    Contacts created or updated and contacts deleted after ``since``, up to ``until``.
+
+    Both are keyset-paged over (updated_at, id) and (deleted_at, id), served by the
+    (user_id, updated_at, id) indexes, so a sync reads only what changed. Returns
+    (changed rows, deleted contact ids, next cursor, has_more). A stream that is exhausted moves
+    its position to ``until``, which excludes nothing: rows at ``until`` were not returned yet.
+    """
+    changed = select(*RESPONSE_COLUMNS).filter(Contact.user_id == user.id, Contact.updated_at < until)
+    deleted = select(ContactTombstone.id, ContactTombstone.contact_id, ContactTombstone.deleted_at).filter(
+        ContactTombstone.user_id == user.id, ContactTombstone.deleted_at < until)
+    if since is not None:
+        changed = changed.filter(tuple_(Contact.updated_at, Contact.id) >
+                                 tuple_(literal(since.updated_at, Contact.updated_at.type), since.contact_id))
+        deleted = deleted.filter(tuple_(ContactTombstone.deleted_at, ContactTombstone.id) >
+                                 tuple_(literal(since.deleted_at, ContactTombstone.deleted_at.type),
+                                        since.tombstone_id))
+    changed = (await db.execute(changed.order_by(Contact.updated_at, Contact.id).limit(limit + 1))).all()
+    deleted = (await db.execute(deleted.order_by(ContactTombstone.deleted_at, ContactTombstone.id)
+                                .limit(limit + 1))).all()
+
+    more_changed, more_deleted = len(changed) > limit, len(deleted) > limit
+    changed, deleted = changed[:limit], deleted[:limit]
+    contacts_position = (changed[-1].updated_at, changed[-1].id) if more_changed else (until, 0)
+    tombstones_position = (deleted[-1].deleted_at, deleted[-1].id) if more_deleted else (until, 0)
+    cursor = ChangesCursor(*contacts_position, *tombstones_position)
+    return changed, [row.contact_id for row in deleted], cursor, more_changed or more_deleted
+
+
+async def purge_tombstones(db: AsyncSession, before: datetime) -> int:
+    result = await db.execute(delete(ContactTombstone).filter(ContactTombstone.deleted_at < before))
+    await db.commit()
+    return result.rowcount
+
+
+contacts_fts = table('contacts_fts', column('rowid'), column('rank'), column('contacts_fts'))
+
+
+def _search_document():
+    # the separators must render as literals, not bind parameters, to match ix_contacts_search_trgm
+    space = literal_column("' '")
+    return Contact.first_name + space + Contact.last_name + space + Contact.email
+
+
+async def search_contact(user: User, keyword: str, db: AsyncSession, limit: int = 50, offset: int = 0,
+                         as_rows: bool = False):
+    dialect = db.get_bind().dialect.name
+    query = _select(as_rows).filter(Contact.user_id == user.id)
+    if dialect == 'postgresql':
+        # pg_trgm: substring match or fuzzy word match, both served by ix_contacts_search_trgm
+        document = _search_document()
+        query = query.filter(or_(document.ilike(f"%{keyword}%"), literal(keyword).op('<%', precedence=100)(document)))
+        query = query.order_by(func.word_similarity(keyword, document).desc(), Contact.id)
+    elif dialect == 'sqlite' and len(keyword) >= 3:
+        # FTS5 trigram index, ranked by bm25
+        match = '"' + keyword.replace('"', '""') + '"'
+        query = query.join(contacts_fts, contacts_fts.c.rowid == Contact.id)
+        query = query.filter(contacts_fts.c.contacts_fts.op('MATCH')(match)).order_by(contacts_fts.c.rank, Contact.id)
+    else:
+        query = query.filter((Contact.first_name.ilike(f"%{keyword}%")) |
+                             (Contact.last_name.ilike(f"%{keyword}%")) |
+                             (Contact.email.ilike(f"%{keyword}%"))).order_by(Contact.id)
+    contacts = await db.execute(query.limit(limit).offset(offset), bind_arguments=REPLICA)
+    return contacts.all() if as_rows else contacts.scalars().all()
 
 
-async def upcoming_birthdays(user: User, days: int, db: Session):
-    contacts_with_birthdays = []
+async def upcoming_birthdays(user: User, days: int, db: AsyncSession, limit: int = 100, as_rows: bool = False):
     today = date.today()
-    current_year = today.year
-    contacts = db.query(Contact).filter(and_(Contact.user_id == user.id)).all()
-    for contact in contacts:
-        td = contact.birthday.replace(year=current_year) - today
-        if 0 <= td.days <= days:
-            contacts_with_birthdays.append(contact)
-        else:
-            continue
-    return contacts_with_birthdays
+    start = get_birthday_key(today)
+    end = get_birthday_key(today + timedelta(days=min(days, 365)))
+    query = _select(as_rows).filter(Contact.user_id == user.id)
+    if days >= 365:
+        window = None
+    elif start <= end:
+        window = Contact.birthday_key.between(start, end)
+    else:
+        # The window wraps over the new year: late December .. early January
+        window = or_(Contact.birthday_key >= start, Contact.birthday_key <= end)
+    if window is not None:
+        query = query.filter(window)
+    query = query.order_by(case((Contact.birthday_key >= start, 0), else_=1), Contact.birthday_key, Contact.id)
+    contacts = await db.execute(query.limit(limit), bind_arguments=REPLICA)
+    return contacts.all() if as_rows else contacts.scalars().all()
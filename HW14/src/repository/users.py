@@ -1,42 +1,41 @@
-import logging
-from libgravatar import Gravatar
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import User
+from src.database.replicas import REPLICA
 from src.schemas import UserModel
+from src.services.cache import user_cache
+from src.services.gravatar import gravatar_url
 
 
-async def get_user_by_email(email: str, db: Session) -> User | None:
-    return db.query(User).filter(User.email == email).first()
+async def get_user_by_email(email: str, db: AsyncSession, replica: bool = False) -> User | None:
+    user = await db.execute(select(User).filter(User.email == email), bind_arguments=REPLICA if replica else None)
+    return user.scalars().first()
 
 
-async def create_user(body: UserModel, db: Session) -> User:
-    avatar = None
-    try:
-        g = Gravatar(body.email)
-        avatar = g.get_image()
-    except Exception as e:
-        logging.error(e)
-    new_user = User(**body.dict(), avatar=avatar)
+async def create_user(body: UserModel, db: AsyncSession) -> User:
+    new_user = User(**body.dict(), avatar=gravatar_url(body.email))
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     return new_user
 
 
-async def update_token(user: User, token: str | None, db: Session):
-    user.refresh_token = token
-    db.commit()
+async def update_password(user: User, password: str, db: AsyncSession) -> None:
+    user.password = password
+    await db.commit()
 
 
-async def confirmed_email(email: str, db: Session) -> None:
+async def confirmed_email(email: str, db: AsyncSession) -> None:
     user = await get_user_by_email(email, db)
     user.confirmed = True
-    db.commit()
+    await db.commit()
+    await user_cache.invalidate(email)
 
 
-async def update_avatar(email, url: str, db: Session) -> User:
+async def update_avatar(email, url: str, db: AsyncSession) -> User:
     user = await get_user_by_email(email, db)
     user.avatar = url
-    db.commit()
+    await db.commit()
+    await user_cache.invalidate(email)
     return user
@@ -1,58 +1,205 @@
+import hashlib
+import json
+from datetime import date, timedelta
 from typing import List
-from sqlalchemy.orm import Session
+
+import orjson
+from sqlalchemy.engine import Row
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import User
 from src.services.auth import auth_service
 from src.database.db import get_db
-from src.schemas import ContactModel, ContactResponse
-from fastapi_limiter.depends import RateLimiter
-
-from fastapi import APIRouter, Depends, HTTPException, Path, status
+from src.conf.config import settings
+from src.schemas import BatchResponse, ContactBatch, ContactBatchUpdate, ContactChanges, ContactModel, ContactResponse, \
+    ImportResponse
+from src.services import contacts_io
+from src.services.cache import contacts_cache
+from src.services.rate_limit import RateLimit
+from src.services.serialization import ORJSONResponse, dumps_row, dumps_rows
+
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from src.repository import contacts as repository_contacts
 
-router = APIRouter(prefix='/contacts', tags=['contacts'])
-
-
-@router.get('/', response_model=List[ContactResponse], dependencies=[Depends(RateLimiter(times=2, seconds=2))])
-async def get_contacts(db: Session = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
-    contacts = await repository_contacts.get_contacts(current_user, db)
-    return contacts
-
-
-@router.get('/{contact_id}', response_model=ContactResponse, dependencies=[Depends(RateLimiter(times=2, seconds=2))])
-async def get_contact(contact_id: int = Path(ge=1), db: Session = Depends(get_db),
+router = APIRouter(prefix='/contacts', tags=['contacts'], default_response_class=ORJSONResponse)
+
+
+def serialize(payload) -> bytes:
+    # Row tuples selected with as_rows=True are trusted DB output and skip pydantic entirely
+    if isinstance(payload, Row):
+        return dumps_row(payload)
+    if isinstance(payload, list) and payload and isinstance(payload[0], Row):
+        return dumps_rows(payload)
+    if isinstance(payload, list):
+        payload = [ContactResponse.from_orm(contact) for contact in payload]
+    else:
+        payload = ContactResponse.from_orm(payload)
+    return json.dumps(jsonable_encoder(payload), ensure_ascii=False, separators=(',', ':')).encode()
+
+
+async def cached_response(request: Request, user: User, produce, *key_parts: str) -> Response:
+    """
+    Serve a contacts read through the per-user versioned cache.
+
+    ``produce`` runs only on a miss and returns (contacts, headers). The ETag is derived from the
+    user's cache version and the request, so a matching If-None-Match is answered with 304
+    before touching the database or serializing anything.
+    """
+    key = hashlib.sha1('|'.join((request.url.path, str(request.query_params)) + key_parts).encode()).hexdigest()
+    version = await contacts_cache.version(user.id)
+    if version is None:
+        contacts, headers = await produce()
+        return ORJSONResponse(serialize(contacts), headers=headers)
+    etag = f'W/"{user.id}-{version}-{key[:16]}"'
+    if etag in request.headers.get('if-none-match', ''):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    data = await contacts_cache.get(user.id, version, key)
+    if data is None:
+        contacts, headers = await produce()
+        data = json.dumps(headers).encode() + b'\n' + serialize(contacts)
+        await contacts_cache.set(user.id, version, key, data)
+    headers, body = data.split(b'\n', 1)
+    return ORJSONResponse(body, headers={**json.loads(headers), 'ETag': etag})
+
+
+def conflict_exception(error: IntegrityError) -> HTTPException:
+    field = repository_contacts.conflict_field(error)
+    detail = {'email': 'Email is exists', 'phone_number': 'Phone number is exists'}.get(field, 'Contact is exists')
+    return HTTPException(status_code=status.HTTP_409_CONFLICT, detail=detail)
+
+
+@router.get('/', response_model=List[ContactResponse], dependencies=[Depends(RateLimit('read'))])
+async def get_contacts(request: Request, limit: int = Query(100, ge=1, le=1000), after: int | None = Query(None, ge=0),
+                       stream: bool = False, db: AsyncSession = Depends(get_db),
+                       current_user: User = Depends(auth_service.get_current_user)):
+    if stream:
+        async def ndjson():
+            async for row in repository_contacts.stream_contacts(current_user, db, after, as_rows=True):
+                yield dumps_row(row) + b'\n'
+
+        return StreamingResponse(ndjson(), media_type='application/x-ndjson')
+
+    async def produce():
+        contacts = await repository_contacts.get_contacts(current_user, db, limit, after, as_rows=True)
+        headers = {'X-Next-Cursor': str(contacts[-1].id)} if len(contacts) == limit else {}
+        return contacts, headers
+
+    return await cached_response(request, current_user, produce)
+
+
+@router.get('/export', dependencies=[Depends(RateLimit('bulk', exact=True))])
+async def export_contacts(format: str = Query('ndjson', regex='^(csv|ndjson)$'), db: AsyncSession = Depends(get_db),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    media_type = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+    return StreamingResponse(contacts_io.export_contacts(current_user, db, format), media_type=media_type)
+
+
+@router.post('/import', response_model=ImportResponse, dependencies=[Depends(RateLimit('bulk', exact=True))])
+async def import_contacts(request: Request, format: str | None = Query(None, regex='^(csv|ndjson)$'),
+                          db: AsyncSession = Depends(get_db),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    if format is None:
+        format = 'csv' if 'csv' in request.headers.get('content-type', '') else 'ndjson'
+    return await contacts_io.import_contacts(current_user, request.stream(), format, db, settings.import_chunk_size)
+
+
+@router.get('/changes', response_model=ContactChanges, dependencies=[Depends(RateLimit('read'))])
+async def contact_changes(since: str | None = Query(None),
+                          limit: int = Query(settings.contacts_changes_page_size, ge=1, le=1000),
+                          db: AsyncSession = Depends(get_db),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    """
+    Incremental sync: contacts created or updated, and ids of contacts deleted, since the ``since`` cursor.
+
+    Start without a cursor and pass the returned one next time; apply ``deleted`` before ``changed``
+    and call again while ``has_more``. A cursor older than the tombstone retention gets 410 and the
+    client has to sync from scratch.
+    """
+    try:
+        cursor = repository_contacts.ChangesCursor.decode(since) if since else None
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid cursor')
+    # on the primary: a lagging replica would hand out a cursor past changes it hasn't applied yet
+    now = await repository_contacts.database_now(db)
+    if cursor and cursor.deleted_at < now - timedelta(days=settings.contacts_tombstone_retention_days):
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail='Cursor expired, sync from scratch')
+    until = now - timedelta(seconds=settings.contacts_changes_settle_seconds)
+    changed, deleted, next_cursor, has_more = await repository_contacts.get_changes(current_user, db, cursor, until,
+                                                                                    limit)
+    return ORJSONResponse(orjson.dumps({'changed': [row._asdict() for row in changed], 'deleted': deleted,
+                                        'cursor': next_cursor.encode(), 'has_more': has_more}))
+
+
+def batch_response(body: ContactBatch, done: list[int], status_name: str) -> dict:
+    """Per-id results: every requested id in order, or for a filter every matched id."""
+    done_ids = set(done)
+    ids = list(dict.fromkeys(body.ids)) if body.ids is not None else sorted(done)
+    results = [{'id': contact_id, 'status': status_name if contact_id in done_ids else 'not_found'}
+               for contact_id in ids]
+    return {'matched': len(done), 'results': results}
+
+
+# Declared before the /{contact_id} routes, which would otherwise match /batch
+@router.patch('/batch', response_model=BatchResponse, dependencies=[Depends(RateLimit('bulk', exact=True))])
+async def update_contacts(body: ContactBatchUpdate, db: AsyncSession = Depends(get_db),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    try:
+        updated = await repository_contacts.update_many(current_user, body.values.dict(exclude_unset=True), db,
+                                                        body.ids, body.filter)
+    except IntegrityError as e:
+        raise conflict_exception(e)
+    return batch_response(body, updated, 'updated')
+
+
+@router.delete('/batch', response_model=BatchResponse, dependencies=[Depends(RateLimit('bulk', exact=True))])
+async def delete_contacts(body: ContactBatch, db: AsyncSession = Depends(get_db),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    deleted = await repository_contacts.remove_many(current_user, db, body.ids, body.filter)
+    return batch_response(body, deleted, 'deleted')
+
+
+@router.get('/{contact_id}', response_model=ContactResponse, dependencies=[Depends(RateLimit('read'))])
+async def get_contact(request: Request, contact_id: int = Path(ge=1), db: AsyncSession = Depends(get_db),
                       current_user: User = Depends(auth_service.get_current_user)):
-    contact = await repository_contacts.get_contact_by_id(current_user, contact_id, db)
-    if contact is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Contact not found!')
-    return contact
+    async def produce():
+        contact = await repository_contacts.get_contact_by_id(current_user, contact_id, db)
+        if contact is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Contact not found!')
+        return contact, {}
+
+    return await cached_response(request, current_user, produce)
 
 
 @router.post('/', response_model=ContactResponse, status_code=status.HTTP_201_CREATED,
-             dependencies=[Depends(RateLimiter(times=1, seconds=5))])
-async def create_contact(body: ContactModel, db: Session = Depends(get_db),
+             dependencies=[Depends(RateLimit('write', exact=True))])
+async def create_contact(body: ContactModel, db: AsyncSession = Depends(get_db),
                          current_user: User = Depends(auth_service.get_current_user)):
-    contact_email = await repository_contacts.get_contact_by_email(current_user, body.email, db)
-    contact_phone_number = await repository_contacts.get_contact_by_phone(current_user, body.phone_number, db)
-    if contact_email:
-        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Email is exists')
-    if contact_phone_number:
-        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Phone number is exists')
-    contact = await repository_contacts.create(current_user, body, db)
+    try:
+        contact = await repository_contacts.create(current_user, body, db)
+    except IntegrityError as e:
+        raise conflict_exception(e)
     return contact
 
 
-@router.put('/{contact_id}', response_model=ContactResponse, dependencies=[Depends(RateLimiter(times=1, seconds=5))])
-async def update_contact(body: ContactModel, contact_id: int = Path(ge=1), db: Session = Depends(get_db),
+@router.put('/{contact_id}', response_model=ContactResponse,
+            dependencies=[Depends(RateLimit('write', exact=True))])
+async def update_contact(body: ContactModel, contact_id: int = Path(ge=1), db: AsyncSession = Depends(get_db),
                          current_user: User = Depends(auth_service.get_current_user)):
-    contact = await repository_contacts.update(current_user, contact_id, body, db)
+    try:
+        contact = await repository_contacts.update(current_user, contact_id, body, db)
+    except IntegrityError as e:
+        raise conflict_exception(e)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Contact not found!')
     return contact
 
 
-@router.delete('/{contact_id}', response_model=ContactResponse, dependencies=[Depends(RateLimiter(times=1, seconds=5))])
-async def delete_contact(contact_id: int = Path(ge=1), db: Session = Depends(get_db),
+@router.delete('/{contact_id}', response_model=ContactResponse,
+               dependencies=[Depends(RateLimit('write', exact=True))])
+async def delete_contact(contact_id: int = Path(ge=1), db: AsyncSession = Depends(get_db),
                          current_user: User = Depends(auth_service.get_current_user)):
     contact = await repository_contacts.remove(current_user, contact_id, db)
     if contact is None:
@@ -61,22 +208,31 @@ async def delete_contact(contact_id: int = Path(ge=1), db: Session = Depends(get
 
 
 @router.get('/search/keyword={keyword}', response_model=List[ContactResponse],
-            dependencies=[Depends(RateLimiter(times=1, seconds=1))])
-async def search(keyword: str, db: Session = Depends(get_db),
+            dependencies=[Depends(RateLimit('search'))])
+async def search(request: Request, keyword: str, limit: int = Query(50, ge=1, le=500),
+                 offset: int = Query(0, ge=0), db: AsyncSession = Depends(get_db),
                  current_user: User = Depends(auth_service.get_current_user)):
-    contacts = await repository_contacts.search_contact(current_user, keyword, db)
-    if len(contacts) == 0:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                            detail=f'Contacts with keyword: {keyword} not found!')
-    return contacts
+    async def produce():
+        contacts = await repository_contacts.search_contact(current_user, keyword, db, limit, offset, as_rows=True)
+        if len(contacts) == 0:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                detail=f'Contacts with keyword: {keyword} not found!')
+        return contacts, {}
+
+    return await cached_response(request, current_user, produce)
 
 
 @router.get('/birthdays/{days}', response_model=List[ContactResponse],
-            dependencies=[Depends(RateLimiter(times=1, seconds=1))])
-async def upcoming_birthdays_list(days: int, db: Session = Depends(get_db),
+            dependencies=[Depends(RateLimit('search'))])
+async def upcoming_birthdays_list(request: Request, days: int = Path(ge=0), limit: int = Query(100, ge=1, le=1000),
+                                  db: AsyncSession = Depends(get_db),
                                   current_user: User = Depends(auth_service.get_current_user)):
-    birthdays = await repository_contacts.upcoming_birthdays(current_user, days, db)
-    if len(birthdays) == 0:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                            detail=f'There are no birthdays for {days} days')
-    return birthdays
+    async def produce():
+        birthdays = await repository_contacts.upcoming_birthdays(current_user, days, db, limit, as_rows=True)
+        if len(birthdays) == 0:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                detail=f'There are no birthdays for {days} days')
+        return birthdays, {}
+
+    # the window moves every day without any write, so the date is part of the key
+    return await cached_response(request, current_user, produce, date.today().isoformat())
@@ -1,11 +1,11 @@
 from fastapi import APIRouter, Depends, UploadFile, File
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
 from src.database.models import User
 from src.repository import users as repository_users
 from src.services.auth import auth_service
-from src.services.upload_avatar import UploadService
+from src.services.upload_avatar import UploadService, avatar_service
 from src.schemas import UserResponse
 
 router = APIRouter(prefix="/users", tags=["users"])
@@ -18,9 +18,8 @@ async def read_users_me(current_user: User = Depends(auth_service.get_current_us
 
 @router.patch('/avatar', response_model=UserResponse)
 async def update_avatar_user(file: UploadFile = File(), current_user: User = Depends(auth_service.get_current_user),
-                             db: Session = Depends(get_db)):
+                             db: AsyncSession = Depends(get_db)):
     public_id = UploadService.create_name_avatar(current_user.email, prefix='web10')
-    r = UploadService.upload(file.file, public_id)
-    src_url = UploadService.get_url_avatar(public_id, r.get('version'))
+    src_url = await avatar_service.upload(file, public_id)
     user = await repository_users.update_avatar(current_user.email, src_url, db)
     return {'user': user}
@@ -1,7 +1,7 @@
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime, date
 
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, EmailStr, Field, root_validator, validator
 
 
 class ContactModel(BaseModel):
@@ -20,7 +20,7 @@ class ContactResponse(BaseModel):
     email: EmailStr
     phone_number: str
     birthday: date
-    other_data: str = 'Other data'
+    other_data: Optional[str] = 'Other data'
     created_at: datetime
     updated_at: datetime
 
@@ -28,6 +28,86 @@ class ContactResponse(BaseModel):
         orm_mode = True
 
 
+class ContactPatch(BaseModel):
+    first_name: Optional[str] = Field(max_length=50)
+    last_name: Optional[str] = Field(max_length=50)
+    email: Optional[EmailStr]
+    phone_number: Optional[str] = Field(max_length=20)
+    birthday: Optional[date] = Field(description="Дата в форматі 'YYYY-MM-DD'")
+    other_data: Optional[str] = Field(max_length=20)
+
+    @validator('first_name', 'last_name', 'email', 'phone_number', 'birthday', pre=True)
+    def not_null(cls, value):
+        if value is None:
+            raise ValueError('may not be null')
+        return value
+
+
+class ContactFilter(BaseModel):
+    """Contacts matching every given condition."""
+    keyword: Optional[str] = Field(min_length=1, description="Частина імені, прізвища або email")
+    email: Optional[EmailStr]
+    phone_number: Optional[str]
+    birthday: Optional[date]
+    created_before: Optional[datetime]
+    created_after: Optional[datetime]
+
+    @root_validator
+    def not_empty(cls, values):
+        if all(value is None for value in values.values()):
+            raise ValueError('filter needs at least one condition')
+        return values
+
+
+class ContactBatch(BaseModel):
+    """Contacts to act on: either a list of ids or a filter."""
+    ids: Optional[List[int]] = Field(min_items=1, max_items=1000)
+    filter: Optional[ContactFilter]
+
+    @root_validator
+    def ids_or_filter(cls, values):
+        if (values.get('ids') is None) == (values.get('filter') is None):
+            raise ValueError('give either ids or filter')
+        return values
+
+
+class ContactBatchUpdate(ContactBatch):
+    values: ContactPatch
+
+    @root_validator(skip_on_failure=True)
+    def has_values(cls, values):
+        if not values['values'].dict(exclude_unset=True):
+            raise ValueError('nothing to update')
+        return values
+
+
+class BatchResult(BaseModel):
+    id: int
+    status: str
+
+
+class BatchResponse(BaseModel):
+    matched: int
+    results: List[BatchResult]
+
+
+class ContactChanges(BaseModel):
+    changed: List[ContactResponse]
+    deleted: List[int]
+    cursor: str
+    has_more: bool
+
+
+class ImportRowError(BaseModel):
+    row: int
+    detail: str
+
+
+class ImportResponse(BaseModel):
+    imported: int = 0
+    errors: List[ImportRowError] = []
+
+
 class UserModel(BaseModel):
     username: str
     email: EmailStr
@@ -1,32 +1,40 @@
-import pickle
+import time
 from typing import Optional
 
-import redis
 from jose import JWTError, jwt
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.db import get_db
+from src.database.db import get_db, use_primary_if_recent_write
 from src.repository import users as repository_users
 from src.conf.config import settings
+from src.services.cache import LRUCache, user_cache
+from src.services.password import password_hasher
+from src.services.sessions import refresh_sessions
+from src.services.tokens import get_jwt_backend
 # from src.conf import messages
 
 
 class Auth:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    password_hasher = password_hasher
     SECRET_KEY = settings.jwt_secret_key
     ALGORITHM = settings.jwt_algorithm
+    jwt_backend = get_jwt_backend(settings.jwt_algorithm, settings.jwt_fast_path)
+    # verified access token -> email, kept until the token expires
+    token_cache = LRUCache(maxsize=settings.token_cache_size, ttl=0)
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
-    r = redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0)
 
-    def verify_password(self, plain_password, hashed_password):
-        return self.pwd_context.verify(plain_password, hashed_password)
+    async def verify_password(self, plain_password, hashed_password):
+        valid, _ = await self.password_hasher.verify_and_update(plain_password, hashed_password)
+        return valid
 
-    def get_password_hash(self, password: str):
-        return self.pwd_context.hash(password)
+    async def verify_and_update_password(self, plain_password, hashed_password):
+        return await self.password_hasher.verify_and_update(plain_password, hashed_password)
+
+    async def get_password_hash(self, password: str):
+        return await self.password_hasher.hash(password)
 
     # define a function to generate a new access token
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
@@ -45,48 +53,68 @@ class Auth:
         if expires_delta:
             expire = datetime.utcnow() + timedelta(seconds=expires_delta)
         else:
-            expire = datetime.utcnow() + timedelta(days=7)
+            expire = datetime.utcnow() + timedelta(seconds=settings.refresh_token_ttl)
         to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "refresh_token"})
         encoded_refresh_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
         return encoded_refresh_token
 
-    async def decode_refresh_token(self, refresh_token: str):
+    async def decode_refresh_token(self, refresh_token: str) -> dict:
         try:
-            payload = jwt.decode(refresh_token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            if payload['scope'] == 'refresh_token':
-                email = payload['sub']
-                return email
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid scope for token')
+            payload = self.jwt_backend.decode(refresh_token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
         except JWTError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
+        if payload.get('scope') != 'refresh_token':
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid scope for token')
+        if not payload.get('jti') or not payload.get('fam'):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid refresh token')
+        return payload
+
+    async def create_tokens(self, email: str, jti: str, family: str) -> dict:
+        access_token = await self.create_access_token(data={"sub": email})
+        refresh_token = await self.create_refresh_token(data={"sub": email, "jti": jti, "fam": family},
+                                                        expires_delta=settings.refresh_token_ttl)
+        return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+
+    async def start_session(self, email: str) -> dict:
+        jti, family = await refresh_sessions.start(email, settings.refresh_token_ttl)
+        return await self.create_tokens(email, jti, family)
 
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    async def rotate_session(self, refresh_token: str) -> dict:
+        payload = await self.decode_refresh_token(refresh_token)
+        email = payload['sub']
+        jti = await refresh_sessions.rotate(email, payload['jti'], payload['fam'], settings.refresh_token_ttl)
+        if jti is None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+        return await self.create_tokens(email, jti, payload['fam'])
+
+    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
         credentials_exception = HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-        try:
-            # Decode JWT
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            if payload['scope'] == 'access_token':
-                email = payload["sub"]
-                if email is None:
+        email = self.token_cache.get(token)
+        if email is None:
+            try:
+                # Decode JWT
+                payload = self.jwt_backend.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+                if payload['scope'] == 'access_token':
+                    email = payload["sub"]
+                    if email is None:
+                        raise credentials_exception
+                else:
                     raise credentials_exception
-            else:
+            except JWTError as e:
                 raise credentials_exception
-        except JWTError as e:
-            raise credentials_exception
-        user = self.r.get(f"user:{email}")
+            self.token_cache.set(token, email, ttl=payload.get('exp', 0) - time.time())
+        await use_primary_if_recent_write(email, db)
+        user = await user_cache.get(email)
         if user is None:
-            user = await repository_users.get_user_by_email(email, db)
+            user = await repository_users.get_user_by_email(email, db, replica=True)
             if user is None:
                 raise credentials_exception
-            self.r.set(f"user:{email}", pickle.dumps(user))
-            self.r.expire(f"user:{email}", 900)
-        else:
-            user = pickle.loads(user)
+            await user_cache.set(user)
         return user
 
     def create_email_token(self, data: dict):
@@ -98,7 +126,7 @@ class Auth:
 
     async def get_email_from_token(self, token: str):
         try:
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            payload = self.jwt_backend.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
             email = payload["sub"]
             return email
         except JWTError as e:
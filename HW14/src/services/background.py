@@ -0,0 +1,39 @@
+import asyncio
+import logging
+
+
+class BackgroundTasks:
+    """
+    Fire-and-forget tasks that outlive the request which started them.
+
+    The event loop only keeps weak references to tasks, so they are held here until done; on
+    shutdown ``drain`` gives them ``timeout`` seconds to finish and cancels the rest.
+    """
+
+    def __init__(self):
+        self.tasks: set[asyncio.Task] = set()
+
+    def spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self._done)
+        return task
+
+    def _done(self, task: asyncio.Task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.error("Background task failed", exc_info=task.exception())
+
+    async def drain(self, timeout: float) -> int:
+        """Wait for running tasks; return how many had to be cancelled."""
+        if not self.tasks:
+            return 0
+        _, pending = await asyncio.wait(set(self.tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        return len(pending)
+
+
+background_tasks = BackgroundTasks()
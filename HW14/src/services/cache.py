@@ -0,0 +1,215 @@
+import asyncio
+import json
+import logging
+import secrets
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+from src.database.models import User
+from src.services.background import background_tasks
+from src.services.metrics import instrument_redis
+
+
+class LRUCache:
+    """In-process LRU cache whose entries expire ``ttl`` seconds after being set."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: float | None = None):
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+
+# The one Redis connection pool of the process, shared by caches, sessions, the outbox and the rate limiter
+redis_client = instrument_redis(redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0))
+
+
+async def close_redis():
+    await redis_client.close(close_connection_pool=True)
+
+
+class UserCache:
+    """
+    Two-tier cache of authenticated users: an in-process LRU in front of Redis.
+
+    Only a JSON snapshot of the fields routes need is stored, never the password or refresh token.
+    Redis failures are logged and treated as cache misses.
+    """
+    fields = ('id', 'username', 'email', 'avatar', 'confirmed')
+    redis = redis_client
+    local = LRUCache(maxsize=settings.user_cache_size, ttl=settings.user_cache_local_ttl)
+
+    @staticmethod
+    def key(email: str) -> str:
+        return f"user:{email}"
+
+    def dumps(self, user: User) -> bytes:
+        snapshot = {field: getattr(user, field) for field in self.fields}
+        snapshot['created_at'] = user.created_at.isoformat() if user.created_at else None
+        return json.dumps(snapshot).encode()
+
+    @staticmethod
+    def loads(data: bytes) -> User:
+        snapshot = json.loads(data)
+        if snapshot['created_at']:
+            snapshot['created_at'] = datetime.fromisoformat(snapshot['created_at'])
+        return User(**snapshot)
+
+    async def get(self, email: str) -> User | None:
+        data = self.local.get(email)
+        if data is None:
+            try:
+                data = await self.redis.get(self.key(email))
+            except RedisError as e:
+                logging.warning(e)
+                return None
+            if data is None:
+                return None
+            self.local.set(email, data)
+        return self.loads(data)
+
+    async def set(self, user: User) -> None:
+        data = self.dumps(user)
+        self.local.set(user.email, data)
+        try:
+            await self.redis.set(self.key(user.email), data, ex=settings.user_cache_ttl)
+        except RedisError as e:
+            logging.warning(e)
+
+    async def invalidate(self, email: str) -> None:
+        self.local.delete(email)
+        try:
+            await self.redis.delete(self.key(email))
+        except RedisError as e:
+            logging.warning(e)
+
+
+user_cache = UserCache()
+
+
+class ContactsCache:
+    """
+    Per-user versioned cache of serialized contact responses.
+
+    Every entry is keyed by the user's current version, and every contact write replaces that
+    version with a new random one, so stale entries are never read again and simply expire.
+    The version itself always comes from Redis, so all workers agree on it; payloads also live
+    in an optional in-process tier. When Redis is unavailable the cache is bypassed.
+
+    The version key expires with the payloads: if the write to it fails, the old version (and
+    every ETag built from it) is gone within ``ttl`` anyway. Meanwhile this process bypasses the
+    cache for that user and keeps retrying the bump in the background.
+    """
+    redis = redis_client
+    local = LRUCache(maxsize=settings.contacts_cache_local_size, ttl=settings.contacts_cache_ttl)
+
+    def __init__(self, enabled: bool = True, ttl: int = settings.contacts_cache_ttl):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.pending_bumps: set[int] = set()
+
+    @staticmethod
+    def version_key(user_id: int) -> str:
+        return f"contacts:version:{user_id}"
+
+    @staticmethod
+    def key(user_id: int, version: str, key: str) -> str:
+        return f"contacts:{user_id}:{version}:{key}"
+
+    @staticmethod
+    def new_version() -> str:
+        return secrets.token_hex(8)
+
+    async def version(self, user_id: int) -> str | None:
+        if not self.enabled or user_id in self.pending_bumps:
+            return None
+        version_key = self.version_key(user_id)
+        try:
+            version = await self.redis.get(version_key)
+            if version is None:
+                version = self.new_version()
+                if not await self.redis.set(version_key, version, ex=self.ttl, nx=True):
+                    version = await self.redis.get(version_key)
+        except RedisError as e:
+            logging.warning(e)
+            return None
+        return version.decode() if isinstance(version, bytes) else version
+
+    async def get(self, user_id: int, version: str, key: str) -> bytes | None:
+        cache_key = self.key(user_id, version, key)
+        data = self.local.get(cache_key)
+        if data is None:
+            try:
+                data = await self.redis.get(cache_key)
+            except RedisError as e:
+                logging.warning(e)
+                return None
+            if data is not None and self.local.maxsize:
+                self.local.set(cache_key, data)
+        return data
+
+    async def set(self, user_id: int, version: str, key: str, data: bytes) -> None:
+        cache_key = self.key(user_id, version, key)
+        if self.local.maxsize:
+            self.local.set(cache_key, data)
+        try:
+            await self.redis.set(cache_key, data, ex=settings.contacts_cache_ttl)
+        except RedisError as e:
+            logging.warning(e)
+
+    async def _bump(self, user_id: int) -> bool:
+        try:
+            await self.redis.set(self.version_key(user_id), self.new_version(), ex=self.ttl)
+        except RedisError as e:
+            logging.warning(e)
+            return False
+        return True
+
+    async def bump(self, user_id: int) -> None:
+        if not self.enabled or await self._bump(user_id):
+            return
+        if user_id not in self.pending_bumps:
+            self.pending_bumps.add(user_id)
+            background_tasks.spawn(self.retry_bump(user_id))
+
+    async def retry_bump(self, user_id: int, delay: float = 0.1, max_delay: float = 5) -> None:
+        # past the deadline the old version key has expired by itself
+        deadline = time.monotonic() + self.ttl
+        try:
+            while time.monotonic() < deadline:
+                await asyncio.sleep(delay)
+                if await self._bump(user_id):
+                    return
+                delay = min(delay * 2, max_delay)
+        finally:
+            self.pending_bumps.discard(user_id)
+
+
+contacts_cache = ContactsCache(settings.contacts_cache_enabled)
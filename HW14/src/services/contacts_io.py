@@ -0,0 +1,180 @@
+import csv
+import io
+import json
+from collections import deque
+from typing import AsyncIterator
+
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import User
+from src.repository import contacts as repository_contacts
+from src.schemas import ContactModel, ContactResponse, ImportResponse, ImportRowError
+
+CSV_FIELDS = ('first_name', 'last_name', 'email', 'phone_number', 'birthday', 'other_data')
+# a quoted field may span lines, but a quote that is never closed must not swallow the rest of the file
+CSV_MAX_RECORD_LINES = 100
+
+
+def _decode(line: bytes) -> str | None:
+    try:
+        return line.decode('utf-8-sig').rstrip('\r')
+    except UnicodeDecodeError:
+        return None
+
+
+async def iter_lines(stream: AsyncIterator[bytes]) -> AsyncIterator[str | None]:
+    """Decoded lines without their terminators; None for a line that is not valid UTF-8."""
+    buffer = b''
+    async for chunk in stream:
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            yield _decode(line)
+    if buffer:
+        yield _decode(buffer)
+
+
+class _LineFeed:
+    """Input of the csv reader; lines are pushed in one complete record at a time."""
+
+    def __init__(self):
+        self.lines = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if not self.lines:
+            raise StopIteration
+        return self.lines.popleft()
+
+
+async def iter_records(stream: AsyncIterator[bytes]) -> AsyncIterator[list[str] | str]:
+    """CSV records, or an error message for each record that could not be read."""
+    feed = _LineFeed()
+    reader = csv.reader(feed, strict=True)
+    pending: list[str] = []
+    async for line in iter_lines(stream):
+        if line is None:
+            pending.clear()
+            yield 'Invalid UTF-8'
+            continue
+        if not pending and not line.strip():
+            continue
+        pending.append(line + '\n')
+        feed.lines.extend(pending)
+        try:
+            values = next(reader)
+        except csv.Error as e:
+            feed.lines.clear()
+            if 'unexpected end of data' in str(e) and len(pending) < CSV_MAX_RECORD_LINES:
+                # inside a quoted field: read the record again once the next line arrives
+                continue
+            yield f'Invalid CSV: {e}'
+        else:
+            yield values
+        pending.clear()
+    if pending:
+        yield 'Invalid CSV: unterminated quoted field'
+
+
+async def iter_rows(stream: AsyncIterator[bytes], fmt: str) -> AsyncIterator[tuple[int, dict | str]]:
+    """Yield (row number, parsed row) - or (row number, error message) for rows that could not be parsed."""
+    number = 0
+    if fmt == 'csv':
+        header = None
+        async for values in iter_records(stream):
+            if header is None and isinstance(values, list):
+                header = [value.strip() for value in values]
+                continue
+            number += 1
+            if isinstance(values, str):
+                yield number, values
+            elif len(values) != len(header):
+                yield number, f'Expected {len(header)} columns, got {len(values)}'
+            else:
+                yield number, {key: value or None for key, value in zip(header, values)}
+        return
+    async for line in iter_lines(stream):
+        if line is not None and not line.strip():
+            continue
+        number += 1
+        if line is None:
+            yield number, 'Invalid UTF-8'
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield number, f'Invalid JSON: {e}'
+            continue
+        yield number, row if isinstance(row, dict) else 'Expected a JSON object'
+
+
+async def import_contacts(user: User, stream: AsyncIterator[bytes], fmt: str, db: AsyncSession,
+                          chunk_size: int = 1000) -> ImportResponse:
+    """
+    Validate and insert contacts chunk by chunk.
+
+    Each chunk costs one duplicate-check query and one multi-row insert; bad or duplicate rows
+    are reported in ``errors`` and never abort the rest of the import.
+    """
+    result = ImportResponse()
+    seen_emails, seen_phones = set(), set()
+    chunk: list[tuple[int, ContactModel]] = []
+
+    async def flush():
+        existing_emails, existing_phones = await repository_contacts.get_existing_keys(
+            user, [body.email for _, body in chunk], [body.phone_number for _, body in chunk], db)
+        bodies = []
+        for number, body in chunk:
+            if body.email in existing_emails or body.email in seen_emails:
+                result.errors.append(ImportRowError(row=number, detail='Email is exists'))
+            elif body.phone_number in existing_phones or body.phone_number in seen_phones:
+                result.errors.append(ImportRowError(row=number, detail='Phone number is exists'))
+            else:
+                seen_emails.add(body.email)
+                seen_phones.add(body.phone_number)
+                bodies.append((number, body))
+        try:
+            result.imported += await repository_contacts.create_many(user, [body for _, body in bodies], db)
+        except IntegrityError:
+            await db.rollback()
+            result.errors.extend(ImportRowError(row=number, detail='Conflicts with an existing contact')
+                                 for number, _ in bodies)
+        chunk.clear()
+
+    async for number, row in iter_rows(stream, fmt):
+        if isinstance(row, str):
+            result.errors.append(ImportRowError(row=number, detail=row))
+            continue
+        try:
+            chunk.append((number, ContactModel(**row)))
+        except ValidationError as e:
+            result.errors.append(ImportRowError(row=number, detail='; '.join(
+                f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors())))
+            continue
+        if len(chunk) >= chunk_size:
+            await flush()
+    if chunk:
+        await flush()
+    result.errors.sort(key=lambda error: error.row)
+    return result
+
+
+async def export_contacts(user: User, db: AsyncSession, fmt: str) -> AsyncIterator[str]:
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CSV_FIELDS)
+        async for contact in repository_contacts.stream_contacts(user, db):
+            writer.writerow([getattr(contact, field) or '' for field in CSV_FIELDS])
+            if buffer.tell() > 64 * 1024:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    else:
+        async for contact in repository_contacts.stream_contacts(user, db):
+            yield ContactResponse.from_orm(contact).json() + '\n'
@@ -1,35 +1,69 @@
+import json
 from pathlib import Path
 
 import logging
 from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
 from fastapi_mail.errors import ConnectionErrors
+from jinja2 import Environment, FileSystemLoader, select_autoescape
 from pydantic import EmailStr
+from redis.exceptions import RedisError
 
 from src.services.auth import auth_service
+from src.services.cache import redis_client
 from src.conf.config import settings
 
+TEMPLATE_FOLDER = Path(__file__).parent / 'templates'
+MAIL_FROM_NAME = "Contact Service from Denis Bilokon"
+SUBJECT = "Confirm your email!"
+
 conf = ConnectionConfig(
     MAIL_USERNAME= settings.mail_username,
     MAIL_PASSWORD=settings.mail_password,
     MAIL_FROM=settings.mail_from,
     MAIL_PORT=settings.mail_port,
     MAIL_SERVER=settings.mail_server,
-    MAIL_FROM_NAME="Contact Service from Denis Bilokon",
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
+    MAIL_FROM_NAME=MAIL_FROM_NAME,
+    MAIL_STARTTLS=settings.mail_starttls,
+    MAIL_SSL_TLS=settings.mail_ssl_tls,
+    USE_CREDENTIALS=settings.mail_use_credentials,
+    VALIDATE_CERTS=settings.mail_validate_certs,
+    TEMPLATE_FOLDER=TEMPLATE_FOLDER,
 )
 
+# Templates are compiled on first use and kept in the environment's cache
+templates = Environment(loader=FileSystemLoader(TEMPLATE_FOLDER), autoescape=select_autoescape(['html']),
+                        auto_reload=False)
 
-async def send_email(email: EmailStr, username: str, host: str):
+
+def precompile_templates():
+    templates.get_template("email_template.html")
+
+
+def render_confirmation(email: str, username: str, host: str) -> str:
+    token_verification = auth_service.create_email_token({"sub": email})
+    return templates.get_template("email_template.html").render(host=host, username=username,
+                                                                token=token_verification)
+
+
+class EmailOutbox:
+    """Redis list of pending emails, drained by the worker in src/services/email_worker.py."""
+    redis = redis_client
+    queue = settings.email_queue
+
+    async def enqueue(self, message: dict) -> None:
+        await self.redis.rpush(self.queue, json.dumps(message))
+
+
+outbox = EmailOutbox()
+
+
+async def send_email_now(email: EmailStr, username: str, host: str):
     try:
-        token_verification = auth_service.create_email_token({"sub": email})
         message = MessageSchema(
-            subject="Confirm your email!",
+            subject=SUBJECT,
             recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
+            template_body={"host": host, "username": username,
+                           "token": auth_service.create_email_token({"sub": email})},
             subtype=MessageType.html
         )
 
@@ -37,3 +71,12 @@ async def send_email(email: EmailStr, username: str, host: str):
         await fm.send_message(message, template_name="email_template.html")
     except ConnectionErrors as err:
         logging.error(err)
+
+
+async def send_email(email: EmailStr, username: str, host: str):
+    """Queue a confirmation email; delivered directly only when the outbox is unavailable."""
+    try:
+        await outbox.enqueue({"email": email, "username": username, "host": str(host), "attempts": 0})
+    except RedisError as err:
+        logging.error(err)
+        await send_email_now(email, username, host)
@@ -0,0 +1,168 @@
+"""
+Email outbox worker.
+
+Run it as a separate process next to the web workers:
+
+    python -m src.services.email_worker
+
+It drains the Redis outbox in batches over one persistent SMTP connection, retries
+failed messages with exponential backoff and parks them in a dead-letter list after
+``email_max_attempts`` attempts.
+
+Jobs are moved to the worker's processing list while they are handled and removed from it
+only once sent, rescheduled or dead-lettered, so nothing is lost when the worker stops
+mid-batch: whatever is left there goes back to the outbox on the next start. Each worker
+process needs its own ``EMAIL_WORKER_NAME``.
+"""
+import asyncio
+import json
+import logging
+import time
+from email.message import EmailMessage
+from email.utils import formataddr
+
+import aiosmtplib
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+from src.services.cache import redis_client
+from src.services.email import MAIL_FROM_NAME, SUBJECT, render_confirmation
+
+
+class EmailWorker:
+    def __init__(self, redis=redis_client, hostname: str = settings.mail_server, port: int = settings.mail_port,
+                 use_tls: bool = settings.mail_ssl_tls, start_tls: bool = settings.mail_starttls,
+                 use_credentials: bool = settings.mail_use_credentials,
+                 validate_certs: bool = settings.mail_validate_certs, batch_size: int = settings.email_batch_size,
+                 max_attempts: int = settings.email_max_attempts, backoff: float = settings.email_retry_backoff,
+                 name: str = settings.email_worker_name):
+        self.redis = redis
+        self.queue = settings.email_queue
+        self.retry_queue = f"{self.queue}:retry"
+        self.dead_queue = f"{self.queue}:dead"
+        self.processing_queue = f"{self.queue}:processing:{name}"
+        self.hostname = hostname
+        self.port = port
+        self.use_tls = use_tls
+        self.start_tls = start_tls
+        self.use_credentials = use_credentials
+        self.validate_certs = validate_certs
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.smtp: aiosmtplib.SMTP | None = None
+        self.running = True
+
+    async def connect(self) -> aiosmtplib.SMTP:
+        if self.smtp is None or not self.smtp.is_connected:
+            self.smtp = aiosmtplib.SMTP(hostname=self.hostname, port=self.port, use_tls=self.use_tls,
+                                        start_tls=self.start_tls, validate_certs=self.validate_certs)
+            await self.smtp.connect()
+            if self.use_credentials:
+                await self.smtp.login(settings.mail_username, settings.mail_password)
+        return self.smtp
+
+    async def close(self):
+        if self.smtp is not None and self.smtp.is_connected:
+            try:
+                await self.smtp.quit()
+            except aiosmtplib.SMTPException:
+                self.smtp.close()
+        self.smtp = None
+
+    @staticmethod
+    def build_message(message: dict) -> EmailMessage:
+        mail = EmailMessage()
+        mail['Subject'] = SUBJECT
+        mail['From'] = formataddr((MAIL_FROM_NAME, settings.mail_from))
+        mail['To'] = message['email']
+        mail.set_content(render_confirmation(message['email'], message['username'], message['host']),
+                         subtype='html')
+        return mail
+
+    async def fetch_batch(self, timeout: float = 1) -> list[bytes]:
+        """Move up to ``batch_size`` jobs from the outbox to the processing list."""
+        first = await self.redis.blmove(self.queue, self.processing_queue, timeout, 'LEFT', 'RIGHT')
+        if first is None:
+            return []
+        batch = [first]
+        if self.batch_size > 1:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for _ in range(self.batch_size - 1):
+                    pipe.lmove(self.queue, self.processing_queue, 'LEFT', 'RIGHT')
+                batch.extend(item for item in await pipe.execute() if item is not None)
+        return batch
+
+    async def recover(self) -> int:
+        """Put jobs left in the processing list by an interrupted run back at the head of the outbox."""
+        recovered = 0
+        while await self.redis.lmove(self.processing_queue, self.queue, 'RIGHT', 'LEFT') is not None:
+            recovered += 1
+        if recovered:
+            logging.warning("Requeued %s unfinished emails", recovered)
+        return recovered
+
+    async def ack(self, item: bytes):
+        await self.redis.lrem(self.processing_queue, 1, item)
+
+    async def promote_due_retries(self):
+        due = await self.redis.zrangebyscore(self.retry_queue, 0, time.time())
+        for item in due:
+            if await self.redis.zrem(self.retry_queue, item):
+                await self.redis.rpush(self.queue, item)
+
+    async def retry_later(self, message: dict, error: Exception):
+        message['attempts'] = message.get('attempts', 0) + 1
+        logging.warning("Email to %s failed (attempt %s): %s", message['email'], message['attempts'], error)
+        if message['attempts'] >= self.max_attempts:
+            await self.redis.rpush(self.dead_queue, json.dumps(message))
+        else:
+            due = time.time() + self.backoff * 2 ** (message['attempts'] - 1)
+            await self.redis.zadd(self.retry_queue, {json.dumps(message): due})
+
+    async def process_batch(self, items: list[bytes]) -> int:
+        sent = 0
+        for item in items:
+            try:
+                message = json.loads(item)
+                mail = self.build_message(message)
+            except Exception:
+                # retrying cannot fix a malformed job or a broken template
+                logging.exception("Cannot build email from %r", item)
+                await self.redis.rpush(self.dead_queue, item)
+                await self.ack(item)
+                continue
+            try:
+                smtp = await self.connect()
+                await smtp.send_message(mail)
+                sent += 1
+            except (aiosmtplib.SMTPException, OSError) as error:
+                await self.close()
+                await self.retry_later(message, error)
+            await self.ack(item)
+        return sent
+
+    async def run(self):
+        recovered = False
+        try:
+            while self.running:
+                try:
+                    if not recovered:
+                        await self.recover()
+                        recovered = True
+                    await self.promote_due_retries()
+                    items = await self.fetch_batch()
+                    if items:
+                        await self.process_batch(items)
+                except RedisError as error:
+                    logging.error(error)
+                    # jobs of an interrupted batch are still in the processing list
+                    recovered = False
+                    await asyncio.sleep(1)
+        finally:
+            await self.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(EmailWorker().run())
@@ -0,0 +1,88 @@
+import hashlib
+import logging
+from functools import lru_cache
+
+import httpx
+from sqlalchemy import update
+
+from src.conf.config import settings
+from src.database.db import AsyncSessionLocal
+from src.database.models import User
+from src.services.background import background_tasks
+from src.services.cache import LRUCache, user_cache
+
+
+@lru_cache(maxsize=4096)
+def gravatar_hash(email: str) -> str:
+    return hashlib.md5(email.strip().lower().encode()).hexdigest()
+
+
+def gravatar_url(email: str, base_url: str = settings.gravatar_url) -> str:
+    """Gravatar image URL for ``email``, computed without any request."""
+    return f"{base_url.rstrip('/')}/{gravatar_hash(email)}"
+
+
+class GravatarChecker:
+    """
+    Finds out after signup whether an address really has a Gravatar.
+
+    Checks run as background tasks, each bounded by ``timeout``. When Gravatar answers 404 the
+    user's avatar is switched, once, to the same URL with an explicit ``d=`` default image, and
+    only if it is still the URL set at signup. Answers are remembered in-process; a timeout or an
+    error leaves the avatar as it is.
+    """
+    session_factory = AsyncSessionLocal
+
+    def __init__(self, base_url: str = settings.gravatar_url, timeout: float = settings.gravatar_check_timeout,
+                 enabled: bool = settings.gravatar_check, default: str = settings.gravatar_default,
+                 size: int = 4096):
+        self.base_url = base_url.rstrip('/')
+        self.default = default
+        self.timeout = timeout
+        self.enabled = enabled
+        self.results = LRUCache(maxsize=size, ttl=24 * 3600)
+        self._client: httpx.AsyncClient | None = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        return self._client
+
+    def schedule(self, email: str, avatar: str | None):
+        if self.enabled and avatar:
+            background_tasks.spawn(self.check(email, avatar))
+
+    async def exists(self, email: str) -> bool | None:
+        digest = gravatar_hash(email)
+        found = self.results.get(digest)
+        if found is None:
+            try:
+                response = await self.client.get(f"{self.base_url}/{digest}", params={'d': '404'})
+            except httpx.HTTPError as e:
+                logging.warning('Gravatar check for %s failed: %r', email, e)
+                return None
+            if response.status_code not in (200, 404):
+                logging.warning('Gravatar check for %s failed: HTTP %s', email, response.status_code)
+                return None
+            found = response.status_code == 200
+            self.results.set(digest, found)
+        return found
+
+    async def check(self, email: str, avatar: str) -> None:
+        if await self.exists(email) is not False:
+            return
+        async with self.session_factory() as db:
+            result = await db.execute(update(User).where(User.email == email, User.avatar == avatar)
+                                      .values(avatar=f"{avatar}?d={self.default}"))
+            await db.commit()
+        if result.rowcount:
+            await user_cache.invalidate(email)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+gravatar_checker = GravatarChecker()
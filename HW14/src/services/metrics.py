@@ -0,0 +1,252 @@
+import bisect
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """Fixed-bucket histogram with Prometheus-style cumulative bucket counts."""
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        result, total = [], 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append(('+Inf' if bound == float('inf') else repr(bound), total))
+        return result
+
+    def snapshot(self) -> dict:
+        return {'buckets': dict(self.cumulative()), 'count': self.count, 'sum': round(self.sum, 6)}
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+def render_histogram(name: str, histogram: Histogram, labels: dict | None = None) -> list[str]:
+    labels = labels or {}
+    lines = [f'{name}_bucket{format_labels({**labels, "le": bound})} {count}'
+             for bound, count in histogram.cumulative()]
+    lines.append(f'{name}_sum{format_labels(labels)} {histogram.sum}')
+    lines.append(f'{name}_count{format_labels(labels)} {histogram.count}')
+    return lines
+
+
+class Metric:
+    """A named family of series, one per label combination, in the Prometheus text format."""
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.series = {}
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        for labelvalues, value in sorted(self.series.items()):
+            lines.extend(self.render_series(dict(zip(self.labelnames, labelvalues)), value))
+        return lines
+
+    def render_series(self, labels: dict, value) -> list[str]:
+        return [f'{self.name}{format_labels(labels)} {value}']
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, *labelvalues, amount: float = 1):
+        self.series[labelvalues] = self.series.get(labelvalues, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value: float, *labelvalues):
+        self.series[labelvalues] = value
+
+
+class LabeledHistogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labelvalues):
+        histogram = self.series.get(labelvalues)
+        if histogram is None:
+            histogram = self.series[labelvalues] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        for labelvalues in sorted(self.series):
+            lines.extend(render_histogram(self.name, self.series[labelvalues], dict(zip(self.labelnames, labelvalues))))
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list[Metric] = []
+        self.collectors = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """``collector`` is called on every scrape and returns extra exposition lines."""
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+http_requests = registry.register(Counter(
+    'http_requests_total', 'HTTP requests by route template and status.', ('method', 'route', 'status')))
+http_latency = registry.register(LabeledHistogram(
+    'http_request_duration_seconds', 'HTTP request latency.', ('method', 'route')))
+http_response_size = registry.register(LabeledHistogram(
+    'http_response_size_bytes', 'HTTP response body size.', ('method', 'route'), SIZE_BUCKETS))
+db_queries_per_request = registry.register(LabeledHistogram(
+    'http_request_db_queries', 'Database queries issued per HTTP request.', ('method', 'route'), COUNT_BUCKETS))
+db_query_latency = registry.register(LabeledHistogram('db_query_duration_seconds', 'Database query latency.'))
+redis_latency = registry.register(LabeledHistogram('redis_command_duration_seconds', 'Redis command latency.'))
+startup_duration = registry.register(Gauge(
+    'app_startup_duration_seconds', 'Time spent in each application startup step.', ('step',)))
+
+
+class RequestStats:
+    """Time spent in the database and Redis while serving the current request."""
+    __slots__ = ('db_queries', 'db_time', 'redis_calls', 'redis_time')
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.redis_calls = 0
+        self.redis_time = 0.0
+
+    def server_timing(self, total: float) -> str:
+        return (f'db;dur={self.db_time * 1000:.2f};desc="{self.db_queries} queries", '
+                f'redis;dur={self.redis_time * 1000:.2f};desc="{self.redis_calls} calls", '
+                f'total;dur={total * 1000:.2f}')
+
+
+current_stats: ContextVar[RequestStats | None] = ContextVar('request_stats', default=None)
+
+
+def instrument_engine(engine):
+    """Time every cursor execution of a (sync) engine; pass ``async_engine.sync_engine`` for async ones."""
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        db_query_latency.observe(elapsed)
+        stats = current_stats.get()
+        if stats is not None:
+            stats.db_queries += 1
+            stats.db_time += elapsed
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(context):
+        started = context.connection.info.get('query_started') if context.connection is not None else None
+        if started:
+            started.pop()
+
+    return engine
+
+
+def instrument_redis(client):
+    """Time commands sent through ``client.execute_command``; pipelines are not included."""
+    execute_command = client.execute_command
+
+    async def timed_execute_command(*args, **options):
+        started = time.perf_counter()
+        try:
+            return await execute_command(*args, **options)
+        finally:
+            elapsed = time.perf_counter() - started
+            redis_latency.observe(elapsed)
+            stats = current_stats.get()
+            if stats is not None:
+                stats.redis_calls += 1
+                stats.redis_time += elapsed
+
+    client.execute_command = timed_execute_command
+    return client
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency, response size and DB query counts per route template.
+
+    With ``server_timing`` enabled every response carries a ``Server-Timing`` header with the
+    time spent in the database and Redis, so N+1 query patterns show up in the browser dev tools.
+    """
+
+    def __init__(self, app, server_timing: bool = False):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        started = time.perf_counter()
+        status_code, size = 500, 0
+
+        async def send_wrapper(message):
+            nonlocal status_code, size
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+                if self.server_timing:
+                    MutableHeaders(scope=message).append('Server-Timing',
+                                                         stats.server_timing(time.perf_counter() - started))
+            elif message['type'] == 'http.response.body':
+                size += len(message.get('body', b''))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_stats.reset(token)
+            route = scope.get('route')
+            labels = (scope['method'], route.path if route is not None else 'unmatched')
+            http_requests.inc(*labels, str(status_code))
+            http_latency.observe(time.perf_counter() - started, *labels)
+            http_response_size.observe(size, *labels)
+            db_queries_per_request.observe(stats.db_queries, *labels)
@@ -0,0 +1,89 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from src.conf.config import settings
+from src.services.metrics import registry
+
+# The first scheme is used for new hashes; hashes in any other scheme are upgraded on login.
+# "argon2" requires the optional argon2-cffi package.
+SCHEMES = ["argon2", "bcrypt"] if settings.password_scheme == "argon2" else ["bcrypt"]
+
+pwd_context = CryptContext(schemes=SCHEMES, deprecated="auto")
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password: str, hashed_password: str) -> tuple[bool, str | None]:
+    return pwd_context.verify_and_update(password, hashed_password)
+
+
+class PasswordHasher:
+    """
+    Runs password hashing off the event loop in a bounded thread or process pool.
+
+    At most ``workers`` hashes run at once; when more than ``max_queue`` calls are
+    waiting, new calls are rejected with 503 instead of piling up.
+    """
+
+    def __init__(self, executor: str = "thread", workers: int = 4, max_queue: int = 64):
+        self.executor_type = executor
+        self.workers = workers
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.rejected = 0
+        self._executor: Executor | None = None
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_type == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password")
+        return self._executor
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of calls waiting for a free worker."""
+        return max(self.in_flight - self.workers, 0)
+
+    async def run(self, func, *args):
+        if self.queue_depth >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server is busy, try again")
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self.in_flight -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self.run(_hash, password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> tuple[bool, str | None]:
+        """Return (valid, new_hash); new_hash is set when the stored hash should be upgraded."""
+        return await self.run(_verify_and_update, password, hashed_password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def render(self) -> list[str]:
+        """Prometheus exposition lines, registered as a collector of the metrics registry."""
+        lines = []
+        for name, kind, value in (('password_hash_queue_depth', 'gauge', self.queue_depth),
+                                  ('password_hash_in_flight', 'gauge', self.in_flight),
+                                  ('password_hash_rejected_total', 'counter', self.rejected)):
+            lines += [f'# TYPE {name} {kind}', f'{name} {value}']
+        return lines
+
+
+password_hasher = PasswordHasher(settings.password_hash_executor, settings.password_hash_workers,
+                                 settings.password_hash_max_queue)
+registry.add_collector(password_hasher.render)
@@ -0,0 +1,218 @@
+import hashlib
+import logging
+import math
+import time
+from functools import lru_cache
+from typing import NamedTuple
+
+from fastapi import Depends, HTTPException, Request, status
+from redis.exceptions import NoScriptError, RedisError
+from starlette.datastructures import MutableHeaders
+
+from src.conf.config import settings
+from src.database.models import User
+from src.services.auth import auth_service
+from src.services.cache import LRUCache, redis_client
+
+# Refill the bucket for the time since the last call, then take up to ``requested`` tokens:
+# all of them or nothing, or with ``partial`` as many as there are. Returns {granted, tokens left}.
+TOKEN_BUCKET = b"""
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local now = tonumber(ARGV[4])
+local partial = tonumber(ARGV[5])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local granted = 0
+if tokens >= requested then
+    granted = requested
+elseif partial == 1 then
+    granted = math.floor(tokens)
+end
+tokens = tokens - granted
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {granted, tostring(tokens)}
+"""
+TOKEN_BUCKET_SHA = hashlib.sha1(TOKEN_BUCKET).hexdigest()
+
+
+class Limit(NamedTuple):
+    times: int
+    seconds: float
+
+    @property
+    def rate(self) -> float:
+        return self.times / self.seconds
+
+
+@lru_cache(maxsize=None)
+def parse_limit(spec: str) -> Limit:
+    """Parse "times/seconds", e.g. "10/60" is a burst of 10 refilled at 10 per minute."""
+    times, seconds = spec.split('/')
+    return Limit(int(times), float(seconds))
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    limit: Limit
+    remaining: int
+    retry_after: int
+
+    def headers(self) -> dict:
+        headers = {'X-RateLimit-Limit': str(self.limit.times), 'X-RateLimit-Remaining': str(self.remaining)}
+        if not self.allowed:
+            headers['Retry-After'] = str(self.retry_after)
+        return headers
+
+
+def result(allowed: bool, limit: Limit, tokens: float) -> RateLimitResult:
+    retry_after = 0 if allowed else math.ceil((1 - tokens) / limit.rate)
+    return RateLimitResult(allowed, limit, max(int(tokens), 0), retry_after)
+
+
+class LocalBucket:
+    __slots__ = ('tokens', 'updated', 'pending', 'synced')
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated = now
+        self.pending = 0
+        self.synced = 0.0
+
+    def refill(self, limit: Limit, now: float):
+        self.tokens = min(limit.times, self.tokens + (now - self.updated) * limit.rate)
+        self.updated = now
+
+
+class RateLimiter:
+    """
+    Token-bucket rate limiter shared by all workers through Redis.
+
+    Exact checks run the bucket script in Redis on every call. Approximate checks are decided
+    against an in-process copy of the bucket; the tokens taken locally are pushed to Redis in one
+    script call every ``sync_interval`` seconds or ``sync_batch`` hits, and the local copy is reset
+    to the shared balance, so other workers' traffic is seen within one interval. When Redis is
+    unavailable checks fail open (exact) or stay local (approximate).
+    """
+    redis = redis_client
+
+    def __init__(self, enabled: bool = True, sync_interval: float = 1.0, sync_batch: int = 10,
+                 local_size: int = 10000):
+        self.enabled = enabled
+        self.sync_interval = sync_interval
+        self.sync_batch = sync_batch
+        self.local = LRUCache(maxsize=local_size, ttl=3600)
+
+    @staticmethod
+    def key(name: str) -> str:
+        return f"ratelimit:{name}"
+
+    async def take(self, name: str, limit: Limit, requested: int, partial: bool) -> tuple[int, float]:
+        args = (limit.times, limit.rate, requested, time.time(), int(partial))
+        try:
+            granted, tokens = await self.redis.evalsha(TOKEN_BUCKET_SHA, 1, self.key(name), *args)
+        except NoScriptError:
+            granted, tokens = await self.redis.eval(TOKEN_BUCKET, 1, self.key(name), *args)
+        return int(granted), float(tokens)
+
+    async def hit_exact(self, name: str, limit: Limit) -> RateLimitResult:
+        try:
+            granted, tokens = await self.take(name, limit, 1, partial=False)
+        except RedisError as e:
+            logging.warning(e)
+            return RateLimitResult(True, limit, limit.times, 0)
+        return result(granted == 1, limit, tokens)
+
+    async def hit(self, name: str, limit: Limit) -> RateLimitResult:
+        now = time.monotonic()
+        bucket = self.local.get(name)
+        if bucket is None:
+            bucket = LocalBucket(limit.times, now)
+            self.local.set(name, bucket)
+        bucket.refill(limit, now)
+        allowed = bucket.tokens >= 1
+        if allowed:
+            bucket.tokens -= 1
+            bucket.pending += 1
+        if bucket.pending >= self.sync_batch or now - bucket.synced >= self.sync_interval:
+            # other workers drained the shared bucket: this hit does not fit after all
+            allowed = await self.sync(name, bucket, limit, now) and allowed
+        return result(allowed, limit, bucket.tokens)
+
+    async def sync(self, name: str, bucket: LocalBucket, limit: Limit, now: float) -> bool:
+        """Push the locally taken tokens to Redis; False if the shared bucket could not cover them all."""
+        pending, bucket.pending, bucket.synced = bucket.pending, 0, now
+        try:
+            granted, tokens = await self.take(name, limit, pending, partial=True)
+        except RedisError as e:
+            logging.warning(e)
+            return True
+        bucket.tokens = tokens
+        return granted == pending
+
+
+rate_limiter = RateLimiter(settings.rate_limit_enabled, settings.rate_limit_sync_interval,
+                           settings.rate_limit_sync_batch)
+
+
+def get_limit(user: User, scope: str) -> Limit:
+    plan = settings.rate_limit_users.get(user.email, settings.rate_limit_default_plan)
+    limits = settings.rate_limit_plans.get(plan) or settings.rate_limit_plans[settings.rate_limit_default_plan]
+    return parse_limit(limits[scope])
+
+
+class RateLimit:
+    """
+    Route dependency limiting the current user by the ``scope`` limit of their plan.
+
+        @router.post('/', dependencies=[Depends(RateLimit('write', exact=True))])
+
+    Over the limit it raises 429 with Retry-After; otherwise the result is left on
+    ``request.state`` for RateLimitHeadersMiddleware.
+    """
+
+    def __init__(self, scope: str, exact: bool = False, limiter: RateLimiter = rate_limiter):
+        self.scope = scope
+        self.exact = exact
+        self.limiter = limiter
+
+    async def __call__(self, request: Request, current_user: User = Depends(auth_service.get_current_user)):
+        if not self.limiter.enabled:
+            return
+        limit = get_limit(current_user, self.scope)
+        name = f"{self.scope}:{current_user.id}"
+        if self.exact:
+            outcome = await self.limiter.hit_exact(name, limit)
+        else:
+            outcome = await self.limiter.hit(name, limit)
+        if not outcome.allowed:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail='Too Many Requests',
+                                headers=outcome.headers())
+        request.state.rate_limit = outcome
+
+
+class RateLimitHeadersMiddleware:
+    """Adds X-RateLimit-* headers to responses of rate limited routes, whatever response class they return."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                outcome = scope.get('state', {}).get('rate_limit')
+                if outcome is not None:
+                    headers = MutableHeaders(scope=message)
+                    for name, value in outcome.headers().items():
+                        headers[name] = value
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,30 @@
+import orjson
+from fastapi.responses import JSONResponse
+from sqlalchemy.engine import Row
+
+
+def dumps_row(row: Row) -> bytes:
+    return orjson.dumps(row._asdict())
+
+
+def dumps_rows(rows: list[Row]) -> bytes:
+    """
+    Serialize rows of response columns straight to JSON.
+
+    The rows come from our own database with exactly the response fields, so there is no
+    per-row pydantic validation and no jsonable_encoder pass; dates are written by orjson in
+    the same ISO format FastAPI would use.
+    """
+    if not rows:
+        return b'[]'
+    fields = rows[0]._fields
+    return orjson.dumps([dict(zip(fields, row)) for row in rows])
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson; already serialized bytes are sent as they are."""
+
+    def render(self, content) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
@@ -0,0 +1,100 @@
+import logging
+import uuid
+
+from fastapi import HTTPException, status
+from redis.exceptions import RedisError
+
+from src.services.cache import redis_client
+
+
+class RefreshSessionStore:
+    """
+    Refresh-token sessions kept in Redis instead of the users table.
+
+    Every login starts a session (a token family), so one user can be signed in on several
+    devices. Each refresh token carries a unique ``jti`` that can be used once: refreshing
+    consumes it and moves the session to a new ``jti``. Presenting a ``jti`` that was already
+    rotated away means the token leaked, so the whole session is revoked. All keys expire
+    together with the refresh token.
+    """
+    redis = redis_client
+
+    @staticmethod
+    def token_key(jti: str) -> str:
+        return f"refresh:token:{jti}"
+
+    @staticmethod
+    def session_key(family: str) -> str:
+        return f"refresh:session:{family}"
+
+    @staticmethod
+    def user_key(email: str) -> str:
+        return f"refresh:user:{email}"
+
+    @staticmethod
+    def unavailable(error: RedisError) -> HTTPException:
+        logging.error(error)
+        return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Session store unavailable")
+
+    async def _store(self, email: str, family: str, jti: str, ttl: int) -> None:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(self.token_key(jti), family, ex=ttl)
+            pipe.set(self.session_key(family), jti, ex=ttl)
+            pipe.sadd(self.user_key(email), family)
+            pipe.expire(self.user_key(email), ttl)
+            await pipe.execute()
+
+    async def start(self, email: str, ttl: int) -> tuple[str, str]:
+        """Open a new session and return its first (jti, family)."""
+        jti, family = uuid.uuid4().hex, uuid.uuid4().hex
+        try:
+            await self._store(email, family, jti, ttl)
+        except RedisError as e:
+            raise self.unavailable(e)
+        return jti, family
+
+    async def rotate(self, email: str, jti: str, family: str, ttl: int) -> str | None:
+        """
+        Consume ``jti`` and return the session's next one.
+
+        Returns None when the token is unknown, expired or revoked. Reusing an already rotated
+        token also revokes its session.
+        """
+        try:
+            owner = await self.redis.getdel(self.token_key(jti))
+            if owner is not None and owner.decode() == family:
+                new_jti = uuid.uuid4().hex
+                await self._store(email, family, new_jti, ttl)
+                return new_jti
+            if await self.redis.exists(self.session_key(family)):
+                logging.warning("Refresh token reuse detected for %s, revoking session", email)
+                await self.revoke(email, family)
+        except RedisError as e:
+            raise self.unavailable(e)
+        return None
+
+    async def revoke(self, email: str, family: str) -> None:
+        try:
+            jti = await self.redis.getdel(self.session_key(family))
+            async with self.redis.pipeline(transaction=True) as pipe:
+                if jti is not None:
+                    pipe.delete(self.token_key(jti.decode()))
+                pipe.srem(self.user_key(email), family)
+                await pipe.execute()
+        except RedisError as e:
+            raise self.unavailable(e)
+
+    async def revoke_all(self, email: str) -> int:
+        """Revoke every session of the user and return how many were open."""
+        try:
+            families = [family.decode() for family in await self.redis.smembers(self.user_key(email))]
+            keys = [self.session_key(family) for family in families]
+            jtis = await self.redis.mget(keys) if keys else []
+            keys += [self.token_key(jti.decode()) for jti in jtis if jti is not None]
+            await self.redis.delete(self.user_key(email), *keys)
+        except RedisError as e:
+            raise self.unavailable(e)
+        return sum(jti is not None for jti in jtis)
+
+
+refresh_sessions = RefreshSessionStore()
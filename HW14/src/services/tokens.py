@@ -0,0 +1,68 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import time
+
+from jose import jwt
+from jose.exceptions import JWTClaimsError, JWTError, ExpiredSignatureError
+
+
+class HMACJWT:
+    """
+    Minimal HS256/HS384/HS512 JWT decoder built on hmac + hashlib.
+
+    Drop-in for ``jose.jwt.decode`` on the hot path: same signature, same exceptions,
+    checks ``alg``, signature, ``exp`` and ``nbf``.
+    """
+    digests = {'HS256': hashlib.sha256, 'HS384': hashlib.sha384, 'HS512': hashlib.sha512}
+
+    @staticmethod
+    def _b64decode(segment: str) -> bytes:
+        return base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4))
+
+    @staticmethod
+    def _numeric_claim(payload: dict, claim: str) -> float | None:
+        value = payload.get(claim)
+        if claim in payload and (isinstance(value, bool) or not isinstance(value, (int, float))):
+            raise JWTClaimsError(f'The {claim} claim must be a number.')
+        return value
+
+    def decode(self, token: str, key: str, algorithms: list[str]) -> dict:
+        try:
+            header_segment, payload_segment, signature_segment = token.split('.')
+            header = json.loads(self._b64decode(header_segment))
+            signature = self._b64decode(signature_segment)
+        except (ValueError, binascii.Error):
+            raise JWTError('Invalid token')
+        if not isinstance(header, dict):
+            raise JWTError('Invalid header string: must be a json object')
+        algorithm = header.get('alg')
+        if not isinstance(algorithm, str) or algorithm not in algorithms or algorithm not in self.digests:
+            raise JWTError('The specified alg value is not allowed')
+        expected = hmac.new(key.encode(), f'{header_segment}.{payload_segment}'.encode(),
+                            self.digests[algorithm]).digest()
+        if not hmac.compare_digest(expected, signature):
+            raise JWTError('Signature verification failed.')
+        try:
+            payload = json.loads(self._b64decode(payload_segment))
+        except (ValueError, binascii.Error):
+            raise JWTError('Invalid payload')
+        if not isinstance(payload, dict):
+            raise JWTError('Invalid payload string: must be a json object')
+        exp = self._numeric_claim(payload, 'exp')
+        nbf = self._numeric_claim(payload, 'nbf')
+        now = time.time()
+        if exp is not None and now > exp:
+            raise ExpiredSignatureError('Signature has expired.')
+        if nbf is not None and now < nbf:
+            raise JWTError('The token is not yet valid (nbf)')
+        return payload
+
+
+def get_jwt_backend(algorithm: str, fast_path: bool = True):
+    """python-jose for everything, except HMAC algorithms when the fast path is enabled."""
+    if fast_path and algorithm in HMACJWT.digests:
+        return HMACJWT()
+    return jwt
@@ -1,12 +1,22 @@
+import asyncio
 import hashlib
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
 import cloudinary
 import cloudinary.uploader
+from fastapi import HTTPException, UploadFile, status
+from PIL import Image, ImageOps, UnidentifiedImageError
 
 from src.conf.config import settings
 
+CHUNK_SIZE = 64 * 1024
 
-class UploadService:
+
+def configure_cloudinary():
+    """Called once at startup; safe to call again."""
     cloudinary.config(
         cloud_name=settings.cloudinary_name,
         api_key=settings.cloudinary_api_key,
@@ -14,6 +24,8 @@ class UploadService:
         secure=True
     )
 
+
+class UploadService:
     @staticmethod
     def create_name_avatar(email: str, prefix: str):
         name = hashlib.sha256(email.encode()).hexdigest()[:12]
@@ -28,3 +40,103 @@ class UploadService:
     def get_url_avatar(public_id, version):
         src_url = cloudinary.CloudinaryImage(public_id).build_url(width=250, height=250, crop='fill', version=version)
         return src_url
+
+
+class CloudinaryStorage:
+    async def save(self, public_id: str, data: bytes, fmt: str) -> str:
+        if not cloudinary.config().cloud_name:
+            configure_cloudinary()
+        r = await asyncio.to_thread(UploadService.upload, io.BytesIO(data), public_id)
+        return UploadService.get_url_avatar(public_id, r.get('version'))
+
+
+class LocalStorage:
+    """Writes avatars to a directory; used offline and in tests instead of Cloudinary."""
+
+    def __init__(self, root: str | Path, base_url: str):
+        self.root = Path(root)
+        self.base_url = base_url.rstrip('/')
+
+    @staticmethod
+    def _write(path: Path, data: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + '.tmp')
+        tmp.write_bytes(data)
+        tmp.replace(path)
+
+    async def save(self, public_id: str, data: bytes, fmt: str) -> str:
+        name = f"{public_id}.{fmt}"
+        await asyncio.to_thread(self._write, self.root / name, data)
+        return f"{self.base_url}/{name}?v={int(time.time())}"
+
+
+def get_storage(backend: str = settings.avatar_storage):
+    if backend == 'local':
+        return LocalStorage(settings.avatar_local_dir, settings.avatar_local_url)
+    if backend == 'cloudinary':
+        return CloudinaryStorage()
+    raise ValueError(f"Unknown avatar storage: {backend}")
+
+
+async def read_limited(file: UploadFile, max_bytes: int) -> bytes:
+    """Read an upload in chunks, rejecting it with 413 as soon as it grows past ``max_bytes``."""
+    buffer = bytearray()
+    while chunk := await file.read(CHUNK_SIZE):
+        buffer.extend(chunk)
+        if len(buffer) > max_bytes:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="File is too large")
+    return bytes(buffer)
+
+
+def process_image(data: bytes, size: int, fmt: str, quality: int) -> bytes:
+    """Crop to a centred square, resize to ``size`` x ``size`` and re-encode."""
+    with Image.open(io.BytesIO(data)) as image:
+        # JPEG can decode straight to a reduced scale, which is much cheaper for large photos
+        image.draft('RGB', (size * 2, size * 2))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        if fmt.lower() in ('jpeg', 'jpg') and image.mode == 'RGBA':
+            image = image.convert('RGB')
+        image = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+        out = io.BytesIO()
+        image.save(out, format=fmt.upper().replace('JPG', 'JPEG'), quality=quality)
+        return out.getvalue()
+
+
+class AvatarService:
+    """Reads, resizes and stores avatars without blocking the event loop."""
+
+    def __init__(self, storage=None, size: int = settings.avatar_size, fmt: str = settings.avatar_format,
+                 quality: int = settings.avatar_quality, max_bytes: int = settings.avatar_max_bytes,
+                 workers: int = settings.avatar_workers):
+        self.storage = storage or get_storage()
+        self.size = size
+        self.fmt = fmt
+        self.quality = quality
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self._executor: ThreadPoolExecutor | None = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="avatar")
+        return self._executor
+
+    async def upload(self, file: UploadFile, public_id: str) -> str:
+        data = await read_limited(file, self.max_bytes)
+        try:
+            image = await asyncio.get_running_loop().run_in_executor(self.executor, process_image, data, self.size,
+                                                                     self.fmt, self.quality)
+        except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+            raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Invalid image")
+        return await self.storage.save(public_id, image, self.fmt)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+avatar_service = AvatarService()
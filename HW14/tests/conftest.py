@@ -1,18 +1,143 @@
+import time
+from contextlib import contextmanager
+from unittest.mock import patch
+
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
 from main import app
 from src.database.models import Base
 from src.database.db import get_db
+from src.services.cache import contacts_cache
+from src.services.gravatar import gravatar_checker
+from src.services.sessions import refresh_sessions
 
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+SQLALCHEMY_ASYNC_DATABASE_URL = "sqlite+aiosqlite:///./test.db"
 
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(SQLALCHEMY_ASYNC_DATABASE_URL, poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False,
+                                              expire_on_commit=False)
+
+
+class FakeRedis(dict):
+    """Just enough of redis.asyncio for the session store and contacts cache, usable across TestClient loops."""
+
+    async def get(self, key):
+        return super().get(key)
+
+    async def set(self, key, value, ex=None, nx=False):
+        if nx and key in self:
+            return None
+        self[key] = value.encode() if isinstance(value, str) else value
+        return True
+
+    async def getdel(self, key):
+        return self.pop(key, None)
+
+    async def exists(self, *keys):
+        return sum(key in self for key in keys)
+
+    async def mget(self, keys):
+        return [dict.get(self, key) for key in keys]
+
+    async def delete(self, *keys):
+        return sum(self.pop(key, None) is not None for key in keys)
+
+    async def sadd(self, key, *values):
+        self.setdefault(key, set()).update(value.encode() for value in values)
+
+    async def srem(self, key, *values):
+        super().get(key, set()).difference_update(value.encode() for value in values)
+
+    async def smembers(self, key):
+        return set(super().get(key, set()))
+
+    async def expire(self, key, ttl):
+        return key in self
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis: FakeRedis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((getattr(self.redis, name), args, kwargs))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self):
+        return [await command(*args, **kwargs) for command, args, kwargs in self.commands]
+
+
+class QueryRecorder:
+    """
+    Statements the app runs on the test engine, with their duration.
+
+    ``budget`` fails the test when the code in its block issues more statements (or spends
+    longer in the database) than allowed, and lists the SQL that ran:
+
+        with queries.budget(1):
+            client.get("/api/contacts", headers=headers)
+    """
+
+    def __init__(self):
+        self.statements: list[tuple[str, float]] = []
+
+    def attach(self, engine):
+        event.listen(engine, 'before_cursor_execute', self.before_execute)
+        event.listen(engine, 'after_cursor_execute', self.after_execute)
+
+    def detach(self, engine):
+        event.remove(engine, 'before_cursor_execute', self.before_execute)
+        event.remove(engine, 'after_cursor_execute', self.after_execute)
+
+    def before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append((statement, time.perf_counter() - conn.info['query_started'].pop()))
+
+    @staticmethod
+    def report(statements: list[tuple[str, float]]) -> str:
+        return '\n'.join(f"  {i}. [{seconds * 1000:.2f} ms] {' '.join(statement.split())}"
+                         for i, (statement, seconds) in enumerate(statements, start=1))
+
+    @contextmanager
+    def budget(self, statements: int, ms: float | None = None):
+        start = len(self.statements)
+        yield
+        issued = self.statements[start:]
+        if len(issued) > statements:
+            pytest.fail(f"{len(issued)} SQL statements, budget is {statements}:\n{self.report(issued)}", pytrace=False)
+        spent = sum(seconds for _, seconds in issued) * 1000
+        if ms is not None and spent > ms:
+            pytest.fail(f"{spent:.2f} ms in SQL, budget is {ms} ms:\n{self.report(issued)}", pytrace=False)
+
+
+@pytest.fixture()
+def queries():
+    recorder = QueryRecorder()
+    recorder.attach(async_engine.sync_engine)
+    yield recorder
+    recorder.detach(async_engine.sync_engine)
+
 
 @pytest.fixture(scope="module")
 def session():
@@ -30,15 +155,15 @@ def session():
 @pytest.fixture(scope="module")
 def client(session):
 
-    def override_get_db():
-        try:
-            yield session
-        finally:
-            session.close()
+    async def override_get_db():
+        async with TestingAsyncSessionLocal() as db:
+            yield db
 
     app.dependency_overrides[get_db] = override_get_db
 
-    yield TestClient(app)
+    with patch.object(refresh_sessions, 'redis', FakeRedis()), patch.object(contacts_cache, 'redis', FakeRedis()), \
+            patch.object(gravatar_checker, 'enabled', False):
+        yield TestClient(app)
 
 
 @pytest.fixture(scope="module")
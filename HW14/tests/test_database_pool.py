@@ -0,0 +1,46 @@
+import unittest
+
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.database.pool import PoolMetrics, TimedAsyncAdaptedQueuePool
+
+
+class TestPoolMetrics(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=TimedAsyncAdaptedQueuePool,
+                                          pool_size=1, max_overflow=0, pool_timeout=0.05)
+        self.metrics = PoolMetrics().attach(self.engine.pool)
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+
+    async def test_checkout_counters(self):
+        async with self.engine.connect() as conn:
+            await conn.execute(text('SELECT 1'))
+            snapshot = self.metrics.snapshot()
+            self.assertEqual(snapshot['checked_out'], 1)
+            self.assertEqual(snapshot['size'], 1)
+        snapshot = self.metrics.snapshot()
+        self.assertEqual(snapshot['checked_out'], 0)
+        self.assertEqual(snapshot['max_checked_out'], 1)
+        self.assertEqual(snapshot['checkouts'], 1)
+        self.assertEqual(snapshot['connects'], 1)
+        self.assertEqual(snapshot['checkout_latency_seconds']['count'], 1)
+
+    async def test_checkout_timeout_is_counted(self):
+        async with self.engine.connect():
+            with self.assertRaises(exc.TimeoutError):
+                async with self.engine.connect():
+                    pass
+        snapshot = self.metrics.snapshot()
+        self.assertEqual(snapshot['timeouts'], 1)
+        self.assertEqual(snapshot['checkout_latency_seconds']['count'], 2)
+        self.assertGreaterEqual(snapshot['checkout_latency_seconds']['sum'], 0.05)
+
+    async def test_metrics_survive_dispose(self):
+        await self.engine.dispose()
+        async with self.engine.connect() as conn:
+            await conn.execute(text('SELECT 1'))
+        self.assertIs(self.engine.pool.metrics, self.metrics)
+        self.assertEqual(self.metrics.checkouts, 1)
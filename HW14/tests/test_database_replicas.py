@@ -0,0 +1,138 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from datetime import date
+from unittest.mock import patch
+
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from src.database.db import use_primary_if_recent_write
+from src.database.models import Base, Contact, User, get_birthday_key
+from src.database.replicas import RecentWrites, ReplicaSet, RoutingSession
+from src.repository.contacts import get_contacts, search_contact
+from src.repository.users import get_user_by_email
+
+
+def new_contact() -> Contact:
+    return Contact(first_name='a', last_name='b', email='a@example.com', phone_number='1', user_id=1,
+                   birthday=date(1990, 1, 1), birthday_key=get_birthday_key(date(1990, 1, 1)))
+
+
+class ReplicasTestCase(unittest.IsolatedAsyncioTestCase):
+    """A primary and two replicas, each its own SQLite file holding a differently named copy of the user."""
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.primary = await self.database('primary')
+        self.replica_engines = [await self.database('replica1'), await self.database('replica2')]
+        self.replicas = ReplicaSet(self.replica_engines)
+        self.recent_writes = RecentWrites(window=5)
+        self.recent_writes.redis = FakeRedis(server=FakeServer())
+        self.session = async_sessionmaker(self.primary, class_=AsyncSession, sync_session_class=RoutingSession,
+                                          replicas=self.replicas, recent_writes=self.recent_writes,
+                                          expire_on_commit=False)
+
+    async def asyncTearDown(self):
+        await self.primary.dispose()
+        await self.replicas.dispose()
+        self.tmp.cleanup()
+
+    async def database(self, name: str):
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(self.tmp.name, name)}.db")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(User.__table__.insert().values(id=1, username=name, email='user@example.com',
+                                                              password='x'))
+        return engine
+
+    async def read_user(self, db) -> str:
+        return (await get_user_by_email('user@example.com', db, replica=True)).username
+
+
+class TestRouting(ReplicasTestCase):
+    async def test_reads_round_robin_over_replicas(self):
+        async with self.session() as db:
+            names = [await self.read_user(db) for _ in range(4)]
+        self.assertEqual(names, ['replica1', 'replica2', 'replica1', 'replica2'])
+
+    async def test_plain_reads_and_writes_use_primary(self):
+        async with self.session() as db:
+            user = await get_user_by_email('user@example.com', db)
+            self.assertEqual(user.username, 'primary')
+            db.add(new_contact())
+            await db.commit()
+        async with self.primary.connect() as conn:
+            self.assertEqual((await conn.execute(text('SELECT count(*) FROM contacts'))).scalar(), 1)
+
+    async def test_repository_reads_go_to_replica(self):
+        async with self.session() as db:
+            db.add(new_contact())
+            await db.commit()
+        async with self.session() as db:
+            user = User(id=1, email='user@example.com')
+            self.assertEqual(await get_contacts(user, db), [])
+            self.assertEqual(await search_contact(user, 'a', db), [])
+
+    async def test_session_sticks_to_primary_after_write(self):
+        async with self.session() as db:
+            db.add(new_contact())
+            await db.commit()
+            self.assertEqual(await self.read_user(db), 'primary')
+
+    async def test_read_your_writes_across_sessions(self):
+        async with self.session() as db:
+            db.info['user'] = 'user@example.com'
+            db.add(new_contact())
+            await db.commit()
+        await asyncio.sleep(0)
+        self.assertTrue(await self.recent_writes.redis.exists(RecentWrites.key('user@example.com')))
+
+        self.recent_writes.local.clear()  # as seen from another worker
+        self.assertTrue(await self.recent_writes.contains('user@example.com'))
+        self.assertFalse(await self.recent_writes.contains('other@example.com'))
+
+    async def test_auth_path_reads_primary_after_recent_write(self):
+        with patch('src.database.db.replicas', self.replicas), \
+                patch('src.database.db.recent_writes', self.recent_writes):
+            async with self.session() as db:
+                await use_primary_if_recent_write('user@example.com', db)
+                self.assertEqual(await self.read_user(db), 'replica1')
+
+            self.recent_writes.mark('user@example.com')
+            async with self.session() as db:
+                await use_primary_if_recent_write('user@example.com', db)
+                self.assertEqual(await self.read_user(db), 'primary')
+
+    async def test_no_replicas_leaves_session_alone(self):
+        with patch('src.database.db.replicas', ReplicaSet([])):
+            # callers without a session, such as the auth benchmark, pass None
+            await use_primary_if_recent_write('user@example.com', None)
+
+    async def test_primary_flag(self):
+        async with self.session() as db:
+            db.info['primary'] = True
+            self.assertEqual(await self.read_user(db), 'primary')
+
+
+class TestHealthChecks(ReplicasTestCase):
+    async def test_unreachable_replica_is_skipped(self):
+        broken = create_async_engine('sqlite+aiosqlite:///file:missing.db?mode=ro&uri=true')
+        replicas = ReplicaSet([broken, self.replica_engines[0]])
+        await replicas.check()
+        self.assertEqual(replicas.healthy, [False, True])
+        self.assertEqual([replicas.choose() for _ in range(3)], [self.replica_engines[0].sync_engine] * 3)
+        await broken.dispose()
+
+    async def test_all_down_falls_back_to_primary(self):
+        self.replicas.healthy = [False, False]
+        async with self.session() as db:
+            self.assertEqual(await self.read_user(db), 'primary')
+
+    async def test_recovers_on_next_check(self):
+        self.replicas.healthy = [False, False]
+        await self.replicas.check()
+        self.assertEqual(self.replicas.healthy, [True, True])
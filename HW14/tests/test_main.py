@@ -1,7 +1,16 @@
+import asyncio
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock
+
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
 from fastapi.testclient import TestClient
 
+from src.conf.config import settings
 from src.database.db import get_db
-from main import app
+from src.repository import contacts as repository_contacts
+from src.services.password import password_hasher
+from main import app, purge_tombstones_once
 
 client = TestClient(app)
 
@@ -25,3 +34,68 @@ def test_healthchecker_database_error():
     assert response.json() == {'detail': 'Error connecting to the database'}
 
     app.dependency_overrides.pop(get_db)
+
+
+def test_pool_metrics():
+    response = client.get("/api/metrics/pool")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["size"] >= 1
+    assert "checkout_latency_seconds" in data
+
+
+def test_prometheus_metrics():
+    client.get("/")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'http_requests_total{method="GET",route="/",status="200"}' in response.text
+    assert "db_pool_checkouts_total" in response.text
+
+
+def test_password_hashing_metrics(monkeypatch):
+    monkeypatch.setattr(password_hasher, 'in_flight', password_hasher.workers + 2)
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert "# TYPE password_hash_queue_depth gauge\npassword_hash_queue_depth 2\n" in response.text
+    assert f"password_hash_in_flight {password_hasher.workers + 2}\n" in response.text
+    assert "# TYPE password_hash_rejected_total counter" in response.text
+
+
+def test_lifespan(monkeypatch):
+    calls = []
+
+    async def warm_pool(connections):
+        calls.append(('warm_pool', connections))
+        return connections
+
+    async def dispose_engines():
+        calls.append(('dispose_engines',))
+
+    monkeypatch.setattr('main.warm_pool', warm_pool)
+    monkeypatch.setattr('main.dispose_engines', dispose_engines)
+    with TestClient(app) as lifespan_client:
+        assert lifespan_client.get("/").status_code == 200
+        assert calls == [('warm_pool', settings.db_pool_warm)]
+        metrics = lifespan_client.get("/metrics").text
+        assert 'app_startup_duration_seconds{step="db_pool"}' in metrics
+        assert 'app_startup_duration_seconds{step="total"}' in metrics
+    assert calls[-1] == ('dispose_engines',)
+
+
+def test_tombstones_are_purged_by_one_worker(monkeypatch):
+    session = MagicMock()
+    session.return_value.__aenter__ = AsyncMock()
+    session.return_value.__aexit__ = AsyncMock(return_value=False)
+    purge = AsyncMock(return_value=0)
+    monkeypatch.setattr('main.redis_client', FakeRedis(server=FakeServer()))
+    monkeypatch.setattr('main.AsyncSessionLocal', session)
+    monkeypatch.setattr(repository_contacts, 'database_now', AsyncMock(return_value=datetime(2023, 6, 14)))
+    monkeypatch.setattr(repository_contacts, 'purge_tombstones', purge)
+
+    async def workers():
+        return await asyncio.gather(*(purge_tombstones_once(3600) for _ in range(3)))
+
+    assert sorted(asyncio.run(workers())) == [False, False, True]
+    purge.assert_awaited_once()
+    assert purge.await_args.args[1] == datetime(2023, 6, 14) - timedelta(days=settings.contacts_tombstone_retention_days)
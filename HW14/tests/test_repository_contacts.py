@@ -1,25 +1,31 @@
 import datetime
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 from datetime import date
 
-from sqlalchemy.orm import Session
+from sqlalchemy import update as update_
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 
-from src.database.models import Contact, User
-from src.schemas import ContactModel
+from src.database.models import Base, Contact, ContactTombstone, User
+from src.schemas import ContactFilter, ContactModel, ContactResponse
 from src.repository.contacts import (
     get_contacts,
     search_contact,
     get_contact_by_email,
     get_contact_by_id,
     get_contact_by_phone,
-    upcoming_birthdays, remove, update, create
+    upcoming_birthdays, remove, update, create, conflict_field, stream_contacts, update_many, remove_many,
+    ChangesCursor, database_now, get_changes, purge_tombstones
 )
+from src.routes.contacts import serialize
 
 
 class TestContacts(unittest.IsolatedAsyncioTestCase):
     def setUp(self):
-        self.session = MagicMock(spec=Session)
+        self.session = MagicMock(spec=AsyncSession)
+        self.session.execute.return_value = MagicMock()
         self.user = User(id=1)
         self.contact_test = Contact(
             id=1,
@@ -33,7 +39,8 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
 
     async def test_get_contacts(self):
         user = User(id=1)
-        session = MagicMock(spec=Session)
+        session = MagicMock(spec=AsyncSession)
+        session.execute.return_value = MagicMock()
 
         expected_contacts = [
             Contact(id=1, user_id=1, first_name='Test1', last_name='Test1', email='test1@example.com',
@@ -42,13 +49,7 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
                     birthday=date.today())
         ]
 
-        query_mock = MagicMock()
-        session.query.return_value = query_mock
-
-        filter_mock = MagicMock()
-        query_mock.filter.return_value = filter_mock
-
-        filter_mock.all.return_value = expected_contacts
+        session.execute.return_value.scalars.return_value.all.return_value = expected_contacts
 
         contacts = await get_contacts(user, session)
 
@@ -57,9 +58,7 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
     async def test_get_contact_by_id(self):
         expected_contact = self.contact_test
 
-        query_mock = self.session.query.return_value
-        filter_mock = query_mock.filter.return_value
-        filter_mock.first.return_value = expected_contact
+        self.session.execute.return_value.scalars.return_value.first.return_value = expected_contact
 
         contact = await get_contact_by_id(self.user, 1, self.session)
 
@@ -68,9 +67,7 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
     async def test_get_contact_by_email(self):
         expected_contact = self.contact_test
 
-        query_mock = self.session.query.return_value
-        filter_mock = query_mock.filter.return_value
-        filter_mock.first.return_value = expected_contact
+        self.session.execute.return_value.scalars.return_value.first.return_value = expected_contact
 
         contact = await get_contact_by_email(self.user, 'test1@example.com', self.session)
 
@@ -79,9 +76,7 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
     async def test_get_contact_by_phone(self):
         expected_contact = self.contact_test
 
-        query_mock = self.session.query.return_value
-        filter_mock = query_mock.filter.return_value
-        filter_mock.first.return_value = expected_contact
+        self.session.execute.return_value.scalars.return_value.first.return_value = expected_contact
 
         contact = await get_contact_by_phone(self.user, '0988888877', self.session)
 
@@ -90,44 +85,31 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
     async def test_create(self):
         expected_contact = self.contact_test
 
-        add_mock = self.session.add
+        self.session.execute.return_value.scalars.return_value.one.return_value = expected_contact
         commit_mock = self.session.commit
 
         contact = await create(self.user, ContactModel(**expected_contact.__dict__), self.session)
 
-        self.assertEqual(contact.first_name, expected_contact.first_name)
-        self.assertEqual(contact.last_name, expected_contact.last_name)
-        self.assertEqual(contact.email, expected_contact.email)
-        self.assertEqual(contact.phone_number, expected_contact.phone_number)
-        self.assertEqual(str(contact.birthday), str(expected_contact.birthday))
-        self.assertEqual(contact.other_data, expected_contact.other_data)
-        add_mock.assert_called_once_with(contact)
+        self.assertEqual(contact, expected_contact)
+        self.session.execute.assert_awaited_once()
+        self.session.add.assert_not_called()
         commit_mock.assert_called_once()
 
     async def test_update(self):
         expected_contact = self.contact_test
 
-        query_mock = self.session.query.return_value
-        filter_mock = query_mock.filter.return_value
-        filter_mock.first.return_value = self.contact_test
+        self.session.execute.return_value.scalars.return_value.first.return_value = self.contact_test
 
         commit_mock = self.session.commit
 
-        contact = await update(self.user, 1, expected_contact, self.session)
+        contact = await update(self.user, 1, ContactModel(**expected_contact.__dict__), self.session)
 
         self.assertEqual(contact, self.contact_test)
-        self.assertEqual(contact.first_name, expected_contact.first_name)
-        self.assertEqual(contact.last_name, expected_contact.last_name)
-        self.assertEqual(contact.email, expected_contact.email)
-        self.assertEqual(contact.phone_number, expected_contact.phone_number)
-        self.assertEqual(contact.birthday, expected_contact.birthday)
-        self.assertEqual(contact.other_data, expected_contact.other_data)
+        self.session.execute.assert_awaited_once()
         commit_mock.assert_called_once()
 
     async def test_remove(self):
-        query_mock = self.session.query.return_value
-        filter_mock = query_mock.filter.return_value
-        filter_mock.first.return_value = self.contact_test
+        self.session.execute.return_value.scalars.return_value.first.return_value = self.contact_test
 
         delete_mock = self.session.delete
         commit_mock = self.session.commit
@@ -135,15 +117,15 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         contact = await remove(self.user, 1, self.session)
 
         self.assertEqual(contact, self.contact_test)
-        delete_mock.assert_called_once_with(contact)
+        # the DELETE and the tombstone for the change feed
+        self.assertEqual(self.session.execute.await_count, 2)
+        delete_mock.assert_not_called()
         commit_mock.assert_called_once()
 
     async def test_search_contact(self):
         keyword = 'test'
 
-        query_mock = self.session.query.return_value
-        filter_mock = query_mock.filter.return_value
-        filter_mock.all.return_value = [self.contact_test]
+        self.session.execute.return_value.scalars.return_value.all.return_value = [self.contact_test]
 
         contacts = await search_contact(self.user, keyword, self.session)
 
@@ -156,7 +138,7 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
             Contact(id=1, first_name='John', last_name='Doe', email='john@example.com', birthday=today),
             Contact(id=2, first_name='Jane', last_name='Smith', email='jane@example.com', birthday=today),
         ]
-        self.session.query.return_value.filter.return_value.all.return_value = contacts
+        self.session.execute.return_value.scalars.return_value.all.return_value = contacts
 
         result = await upcoming_birthdays(self.user, days, self.session)
 
@@ -168,3 +150,224 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
             self.assertEqual(result[i].last_name, contacts[i].last_name)
             self.assertEqual(result[i].email, contacts[i].email)
             self.assertEqual(result[i].birthday, contacts[i].birthday)
+
+
+class SqliteRepositoryTestCase(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session = AsyncSession(self.engine, expire_on_commit=False)
+        self.user = User(id=1, username='user', email='user@example.com', password='password')
+        self.session.add(self.user)
+        birthdays = [date(1990, 12, 30), date(1985, 1, 3), date(1992, 2, 29), date(1970, 6, 1), date(2000, 12, 20)]
+        for i, birthday in enumerate(birthdays, start=1):
+            self.session.add(Contact(id=i, first_name=f'Name{i}', last_name='Last', email=f'c{i}@example.com',
+                                     phone_number=f'09900000{i}', birthday=birthday, user_id=1))
+        await self.session.commit()
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.engine.dispose()
+
+
+class TestUpcomingBirthdaysQuery(SqliteRepositoryTestCase):
+    async def upcoming(self, today, days):
+        with patch('src.repository.contacts.date') as date_mock:
+            date_mock.today.return_value = today
+            contacts = await upcoming_birthdays(self.user, days, self.session)
+        return [contact.id for contact in contacts]
+
+    async def test_window_wraps_over_new_year(self):
+        self.assertEqual(await self.upcoming(date(2023, 12, 28), 7), [1, 2])
+
+    async def test_window_includes_feb_29(self):
+        self.assertEqual(await self.upcoming(date(2023, 2, 27), 3), [3])
+
+    async def test_window_excludes_past_birthdays(self):
+        self.assertEqual(await self.upcoming(date(2023, 12, 21), 5), [])
+
+
+class TestSearchContactQuery(SqliteRepositoryTestCase):
+    async def test_substring_match(self):
+        contacts = await search_contact(self.user, 'ame3', self.session)
+        self.assertEqual([contact.id for contact in contacts], [3])
+
+    async def test_pagination(self):
+        first = await search_contact(self.user, 'example', self.session, limit=2)
+        second = await search_contact(self.user, 'example', self.session, limit=2, offset=2)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 2)
+        self.assertFalse({c.id for c in first} & {c.id for c in second})
+
+    async def test_short_keyword_falls_back_to_ilike(self):
+        contacts = await search_contact(self.user, 'c5', self.session)
+        self.assertEqual([contact.id for contact in contacts], [5])
+
+    async def test_postgres_query_uses_indexed_expression(self):
+        session = MagicMock(spec=AsyncSession)
+        session.execute.return_value = MagicMock()
+        session.get_bind.return_value.dialect.name = 'postgresql'
+        await search_contact(self.user, 'ame3', session)
+        sql = str(session.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+        # the expression of ix_contacts_search_trgm, so the planner can match it even in generic plans
+        document = "contacts.first_name || ' ' || contacts.last_name || ' ' || contacts.email"
+        self.assertIn(f"({document}) ILIKE %(param_1)s", sql)
+        # <% binds as tightly as ||, so the document has to be parenthesized
+        self.assertIn(f"%(param_2)s <%% ({document})", sql)
+        self.assertIn(f"word_similarity(%(word_similarity_1)s, {document})", sql)
+
+
+class TestWriteStatements(SqliteRepositoryTestCase):
+    def body(self, **fields):
+        data = dict(first_name='New', last_name='Contact', email='new@example.com', phone_number='0991111111',
+                    birthday=date(1990, 5, 17), other_data=None)
+        data.update(fields)
+        return ContactModel(**data)
+
+    async def test_create_returns_row(self):
+        contact = await create(self.user, self.body(), self.session)
+        self.assertIsNotNone(contact.id)
+        self.assertEqual(contact.birthday_key, 517)
+        self.assertIsNotNone(contact.created_at)
+
+    async def test_duplicates_are_scoped_per_user(self):
+        # a detached user, like the one get_current_user returns from the cache
+        user = User(id=1)
+        with self.assertRaises(IntegrityError) as error:
+            await create(user, self.body(email='c1@example.com'), self.session)
+        self.assertEqual(conflict_field(error.exception), 'email')
+        with self.assertRaises(IntegrityError) as error:
+            await create(user, self.body(phone_number='099000001'), self.session)
+        self.assertEqual(conflict_field(error.exception), 'phone_number')
+
+        other_user = User(id=2, username='other', email='other@example.com', password='password')
+        self.session.add(other_user)
+        await self.session.commit()
+        contact = await create(other_user, self.body(email='c1@example.com', phone_number='099000001'), self.session)
+        self.assertEqual(contact.user_id, 2)
+
+    async def test_update_and_remove_other_users_contact(self):
+        other_user = User(id=2, username='other', email='other@example.com', password='password')
+        self.assertIsNone(await update(other_user, 1, self.body(), self.session))
+        self.assertIsNone(await remove(other_user, 1, self.session))
+
+        contact = await update(self.user, 1, self.body(), self.session)
+        self.assertEqual((contact.id, contact.email, contact.birthday_key), (1, 'new@example.com', 517))
+        self.assertEqual((await remove(self.user, 1, self.session)).id, 1)
+        self.assertIsNone(await get_contact_by_id(self.user, 1, self.session))
+
+
+class TestBatchStatements(SqliteRepositoryTestCase):
+    async def test_update_many_by_ids(self):
+        updated = await update_many(self.user, {'other_data': 'batch', 'birthday': date(1990, 5, 17)}, self.session,
+                                    ids=[1, 2, 99])
+        self.assertEqual(sorted(updated), [1, 2])
+        contact = await get_contact_by_id(self.user, 1, self.session)
+        await self.session.refresh(contact)
+        self.assertEqual((contact.other_data, contact.birthday_key), ('batch', 517))
+        self.assertIsNone((await get_contact_by_id(self.user, 3, self.session)).other_data)
+
+    async def test_update_many_conflict_rolls_back(self):
+        user = User(id=1)
+        with self.assertRaises(IntegrityError):
+            await update_many(user, {'email': 'same@example.com'}, self.session, ids=[1, 2])
+        self.assertEqual(await update_many(user, {'other_data': 'x'}, self.session, ids=[1]), [1])
+        self.assertEqual((await get_contact_by_id(user, 2, self.session)).email, 'c2@example.com')
+
+    async def test_remove_many_by_filter(self):
+        other_user = User(id=2, username='other', email='other@example.com', password='password')
+        self.session.add(Contact(id=10, first_name='Name10', last_name='Last', email='c10@example.com',
+                                 phone_number='099000010', birthday=date(1990, 1, 1), user=other_user))
+        await self.session.commit()
+
+        deleted = await remove_many(self.user, self.session, contact_filter=ContactFilter(keyword='name1'))
+        self.assertEqual(deleted, [1])
+        self.assertIsNotNone(await get_contact_by_id(other_user, 10, self.session))
+
+    async def test_other_users_contacts_are_untouched(self):
+        other_user = User(id=2)
+        self.assertEqual(await remove_many(other_user, self.session, ids=[1, 2]), [])
+        self.assertEqual(len(await get_contacts(self.user, self.session)), 5)
+
+
+class TestChangeFeed(SqliteRepositoryTestCase):
+    T0 = datetime.datetime(2023, 1, 1, 12, 0, 0)
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        await self.session.execute(update_(Contact).values(updated_at=self.T0))
+        await self.session.commit()
+
+    async def sync(self, since, until, limit=100):
+        changed, deleted, cursor, has_more = await get_changes(self.user, self.session, since, until, limit)
+        return [row.id for row in changed], deleted, cursor, has_more
+
+    async def test_only_changes_after_cursor(self):
+        until = self.T0 + datetime.timedelta(seconds=1)
+        changed, deleted, cursor, has_more = await self.sync(None, until)
+        self.assertEqual((changed, deleted, has_more), ([1, 2, 3, 4, 5], [], False))
+        self.assertEqual(await self.sync(cursor, until), ([], [], cursor, False))
+
+        await self.session.execute(update_(Contact).filter(Contact.id == 2)
+                                   .values(other_data='new', updated_at=self.T0 + datetime.timedelta(seconds=5)))
+        await self.session.commit()
+        await remove(User(id=1), 3, self.session)
+
+        until = await database_now(self.session) + datetime.timedelta(seconds=1)
+        changed, deleted, cursor, has_more = await self.sync(cursor, until)
+        self.assertEqual((changed, deleted, has_more), ([2], [3], False))
+        self.assertEqual(await self.sync(cursor, until), ([], [], cursor, False))
+
+    async def test_changes_not_settled_yet_are_left_for_next_sync(self):
+        changed, _, cursor, _ = await self.sync(None, self.T0)
+        self.assertEqual(changed, [])
+        changed, _, _, _ = await self.sync(cursor, self.T0 + datetime.timedelta(seconds=1))
+        self.assertEqual(changed, [1, 2, 3, 4, 5])
+
+    async def test_pages_through_rows_with_the_same_timestamp(self):
+        until = self.T0 + datetime.timedelta(seconds=1)
+        seen, cursor, has_more = [], None, True
+        while has_more:
+            changed, _, cursor, has_more = await self.sync(cursor, until, limit=2)
+            seen.append(changed)
+        self.assertEqual(seen, [[1, 2], [3, 4], [5]])
+
+    async def test_cursor_encoding(self):
+        cursor = ChangesCursor(self.T0, 7, self.T0 + datetime.timedelta(seconds=1), 3)
+        self.assertEqual(ChangesCursor.decode(cursor.encode()), cursor)
+        for broken in ('', 'bm9wZQ', '!!!'):
+            with self.assertRaises(ValueError):
+                ChangesCursor.decode(broken)
+
+    async def test_purge_tombstones(self):
+        await remove_many(User(id=1), self.session, ids=[1, 2])
+        self.session.add(ContactTombstone(contact_id=9, user_id=1, deleted_at=self.T0))
+        await self.session.commit()
+        self.assertEqual(await purge_tombstones(self.session, self.T0 + datetime.timedelta(days=1)), 1)
+        _, deleted, _, _ = await self.sync(None, await database_now(self.session) + datetime.timedelta(seconds=1))
+        self.assertEqual(sorted(deleted), [1, 2])
+
+
+class TestResponseRows(SqliteRepositoryTestCase):
+    async def test_rows_serialize_like_orm_objects(self):
+        self.session.add(Contact(id=6, first_name='Ім\'я', last_name='Last', email='c6@example.com',
+                                 phone_number='099000006', birthday=date(1990, 1, 1), other_data=None, user_id=1))
+        await self.session.commit()
+
+        contacts = await get_contacts(self.user, self.session)
+        rows = await get_contacts(self.user, self.session, as_rows=True)
+
+        self.assertEqual(rows[0]._fields, tuple(ContactResponse.__fields__))
+        self.assertEqual(serialize(rows), serialize(contacts))
+        self.assertEqual(serialize(rows[5]), serialize(contacts[5]))
+
+    async def test_search_and_birthdays_rows(self):
+        rows = await search_contact(self.user, 'ame3', self.session, as_rows=True)
+        self.assertEqual([row.id for row in rows], [3])
+        rows = await upcoming_birthdays(self.user, 365, self.session, as_rows=True)
+        self.assertEqual(len(rows), 5)
+
+    async def test_stream_rows(self):
+        rows = [row async for row in stream_contacts(self.user, self.session, after=2, batch_size=2, as_rows=True)]
+        self.assertEqual([row.id for row in rows], [3, 4, 5])
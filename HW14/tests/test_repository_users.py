@@ -1,7 +1,7 @@
 import unittest
 from unittest.mock import MagicMock
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import User
 from src.schemas import UserModel
@@ -9,13 +9,13 @@ from src.repository.users import (
     get_user_by_email,
     create_user,
     confirmed_email,
-    update_token
     )
 
 
 class TestContacts(unittest.IsolatedAsyncioTestCase):
     def setUp(self):
-        self.session = MagicMock(spec=Session)
+        self.session = MagicMock(spec=AsyncSession)
+        self.session.execute.return_value = MagicMock()
         self.user = User(id=1)
         self.user_test = User(
             id=1,
@@ -30,9 +30,7 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
     async def test_get_contact_by_email(self):
         expected_contact = self.user_test
 
-        query_mock = self.session.query.return_value
-        filter_mock = query_mock.filter.return_value
-        filter_mock.first.return_value = expected_contact
+        self.session.execute.return_value.scalars.return_value.first.return_value = expected_contact
 
         user = await get_user_by_email('test2@gmail.com', self.session)
 
@@ -61,24 +59,13 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         commit_mock.assert_called_once()
         refresh_mock.assert_called_once()
 
-    async def test_update_token(self):
-        expected_contact = self.user_test
-        token = 'new token'
-
-        self.session.commit = MagicMock()
-        await update_token(expected_contact, token, self.session)
-
-        self.assertEqual(expected_contact.refresh_token, token)
-        self.session.commit.assert_called_once()
-
     async def test_confirmed_email(self):
         email = 'test@example.com'
 
         user_mock = MagicMock(spec=User)
         user_mock.confirmed = True
 
-        self.session.query().filter().one_or_none.return_value = user_mock
-        self.session.commit = MagicMock()
+        self.session.execute.return_value.scalars.return_value.first.return_value = user_mock
 
         await confirmed_email(email, self.session)
 
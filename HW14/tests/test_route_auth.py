@@ -1,8 +1,9 @@
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock
 
 import pytest
 
 from src.database.models import User
+from src.services.gravatar import gravatar_url
 
 
 @pytest.fixture()
@@ -31,6 +32,7 @@ def test_create_user(client, user, monkeypatch):
     assert response.status_code == 201, response.text
     data = response.json()
     assert data["user"]["email"] == user.get("email")
+    assert data["user"]["avatar"] == gravatar_url(user.get("email"))
     assert "id" in data["user"]
 
 
@@ -108,3 +110,85 @@ def test_confirmed_email_is_confirmed(client, token):
     assert response.status_code == 200, response.text
     data = response.json()
     assert data["message"] == "Your email is already confirmed"
+
+
+def login(client, user):
+    response = client.post(
+        "/api/auth/login",
+        data={"username": user.get('email'), "password": user.get('password')},
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_refresh_token_rotation(client, user):
+    tokens = login(client, user)
+    response = client.get(
+        "/api/auth/refresh_token",
+        headers={"Authorization": f"Bearer {tokens['refresh_token']}"}
+    )
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["refresh_token"] != tokens["refresh_token"]
+
+    response = client.get(
+        "/api/auth/refresh_token",
+        headers={"Authorization": f"Bearer {data['refresh_token']}"}
+    )
+    assert response.status_code == 200, response.text
+
+
+def test_refresh_token_reuse_revokes_session(client, user):
+    tokens = login(client, user)
+    rotated = client.get(
+        "/api/auth/refresh_token",
+        headers={"Authorization": f"Bearer {tokens['refresh_token']}"}
+    ).json()
+
+    response = client.get(
+        "/api/auth/refresh_token",
+        headers={"Authorization": f"Bearer {tokens['refresh_token']}"}
+    )
+    assert response.status_code == 401, response.text
+    assert response.json()["detail"] == "Invalid refresh token"
+
+    response = client.get(
+        "/api/auth/refresh_token",
+        headers={"Authorization": f"Bearer {rotated['refresh_token']}"}
+    )
+    assert response.status_code == 401, response.text
+
+
+def test_refresh_token_wrong_scope(client, user):
+    tokens = login(client, user)
+    response = client.get(
+        "/api/auth/refresh_token",
+        headers={"Authorization": f"Bearer {tokens['access_token']}"}
+    )
+    assert response.status_code == 401, response.text
+    assert response.json()["detail"] == "Invalid scope for token"
+
+
+def test_logout(client, user):
+    first, second = login(client, user), login(client, user)
+    response = client.post("/api/auth/logout", headers={"Authorization": f"Bearer {first['refresh_token']}"})
+    assert response.status_code == 200, response.text
+
+    response = client.get("/api/auth/refresh_token", headers={"Authorization": f"Bearer {first['refresh_token']}"})
+    assert response.status_code == 401, response.text
+    response = client.get("/api/auth/refresh_token", headers={"Authorization": f"Bearer {second['refresh_token']}"})
+    assert response.status_code == 200, response.text
+
+
+def test_logout_all(client, user, monkeypatch):
+    sessions = [login(client, user) for _ in range(2)]
+    monkeypatch.setattr("src.services.auth.user_cache.redis", AsyncMock(get=AsyncMock(return_value=None)))
+    response = client.post("/api/auth/logout_all",
+                           headers={"Authorization": f"Bearer {sessions[0]['access_token']}"})
+    assert response.status_code == 200, response.text
+    assert response.json()["sessions"] >= 2
+
+    for tokens in sessions:
+        response = client.get("/api/auth/refresh_token",
+                              headers={"Authorization": f"Bearer {tokens['refresh_token']}"})
+        assert response.status_code == 401, response.text
@@ -1,9 +1,14 @@
+import json
+from datetime import datetime, timezone
 from unittest.mock import MagicMock, patch, AsyncMock
 
 import pytest
 
 from src.database.models import User
-from src.services.auth import auth_service
+from src.repository import contacts as repository_contacts
+from src.services.cache import LRUCache, contacts_cache, user_cache
+from src.services.rate_limit import rate_limiter
+
 
 CONTACT = {
     "id": 1,
@@ -53,11 +58,9 @@ def token(client, user, session, monkeypatch):
 
 
 def test_create_contact_success(client, token, monkeypatch):
-    with patch.object(auth_service, 'r') as redis_mock:
+    with patch.object(user_cache, 'redis', new_callable=AsyncMock) as redis_mock:
         redis_mock.get.return_value = None
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
+        monkeypatch.setattr(rate_limiter, 'enabled', False)
         response = client.post("/api/contacts", json=CONTACT, headers={"Authorization": f"Bearer {token}"})
         assert response.status_code == 201, response.text
         data = response.json()
@@ -71,11 +74,9 @@ def test_create_contact_success(client, token, monkeypatch):
 
 
 def test_create_contact_email_exist(client, token, monkeypatch):
-    with patch.object(auth_service, 'r') as redis_mock:
+    with patch.object(user_cache, 'redis', new_callable=AsyncMock) as redis_mock:
         redis_mock.get.return_value = None
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
+        monkeypatch.setattr(rate_limiter, 'enabled', False)
         response = client.post("/api/contacts", json=CONTACT_2, headers={"Authorization": f"Bearer {token}"})
         assert response.status_code == 409, response.text
         data = response.json()
@@ -83,11 +84,9 @@ def test_create_contact_email_exist(client, token, monkeypatch):
 
 
 def test_update_contact_success(client, token, monkeypatch):
-    with patch.object(auth_service, "r") as redis_mock:
+    with patch.object(user_cache, "redis", new_callable=AsyncMock) as redis_mock:
         redis_mock.get.return_value = None
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
+        monkeypatch.setattr(rate_limiter, 'enabled', False)
         put_response = client.put(f"/api/contacts/{CONTACT['id']}",
                                   json=CONTACT,
                                   headers={"Authorization": f"Bearer {token}"})
@@ -97,11 +96,9 @@ def test_update_contact_success(client, token, monkeypatch):
 
 
 def test_update_contact_not_found(client, token, monkeypatch):
-    with patch.object(auth_service, "r") as redis_mock:
+    with patch.object(user_cache, "redis", new_callable=AsyncMock) as redis_mock:
         redis_mock.get.return_value = None
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
+        monkeypatch.setattr(rate_limiter, 'enabled', False)
         put_response = client.put(f"/api/contacts/{CONTACT_2['id']}",
                                   json=CONTACT_2,
                                   headers={"Authorization": f"Bearer {token}"})
@@ -111,11 +108,9 @@ def test_update_contact_not_found(client, token, monkeypatch):
 
 
 def test_get_contacts(client, token, monkeypatch):
-    with patch.object(auth_service, "r") as redis_mock:
+    with patch.object(user_cache, "redis", new_callable=AsyncMock) as redis_mock:
         redis_mock.get.return_value = None
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
+        monkeypatch.setattr(rate_limiter, 'enabled', False)
         response = client.get("/api/contacts", headers={"Authorization": f"Bearer {token}"})
         assert response.status_code == 200, response.text
         data = response.json()
@@ -124,13 +119,39 @@ def test_get_contacts(client, token, monkeypatch):
         assert CONTACT["first_name"] == data[0]["first_name"]
 
 
+def test_get_contacts_keyset_page(client, token, monkeypatch):
+    with patch.object(user_cache, "redis", new_callable=AsyncMock) as redis_mock:
+        redis_mock.get.return_value = None
+        monkeypatch.setattr(rate_limiter, 'enabled', False)
+        response = client.get("/api/contacts", params={"limit": 1}, headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200, response.text
+        assert len(response.json()) == 1
+        cursor = response.headers["X-Next-Cursor"]
+        assert cursor == str(CONTACT["id"])
+        response = client.get("/api/contacts", params={"limit": 1, "after": cursor},
+                              headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200, response.text
+        assert response.json() == []
+        assert "X-Next-Cursor" not in response.headers
+
+
+def test_get_contacts_stream(client, token, monkeypatch):
+    with patch.object(user_cache, "redis", new_callable=AsyncMock) as redis_mock:
+        redis_mock.get.return_value = None
+        monkeypatch.setattr(rate_limiter, 'enabled', False)
+        response = client.get("/api/contacts", params={"stream": True}, headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200, response.text
+        assert response.headers["content-type"] == "application/x-ndjson"
+        lines = response.text.splitlines()
+        assert len(lines) == 1
+        assert json.loads(lines[0])["first_name"] == CONTACT["first_name"]
+
+
 def test_get_contact_success(client, token, monkeypatch):
     contact_id = 1
-    with patch.object(auth_service, "r") as redis_mock:
+    with patch.object(user_cache, "redis", new_callable=AsyncMock) as redis_mock:
         redis_mock.get.return_value = None
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
+        monkeypatch.setattr(rate_limiter, 'enabled', False)
         get_response = client.get(f"/api/contacts/{contact_id}", headers={"Authorization": f"Bearer {token}"})
         assert get_response.status_code == 200, get_response.text
         data = get_response.json()
@@ -141,11 +162,9 @@ def test_get_contact_success(client, token, monkeypatch):
 
 def test_get_contact_not_found(client, token, monkeypatch):
     contact_id = 2
-    with patch.object(auth_service, "r") as redis_mock:
+    with patch.object(user_cache, "redis", new_callable=AsyncMock) as redis_mock:
         redis_mock.get.return_value = None
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
+        monkeypatch.setattr(rate_limiter, 'enabled', False)
         response = client.get(f"/api/contacts/{contact_id}", headers={"Authorization": f"Bearer {token}"})
         assert response.status_code == 404, response.text
         data = response.json()
@@ -153,12 +172,10 @@ def test_get_contact_not_found(client, token, monkeypatch):
 
 
 def test_search_success(client, token, monkeypatch):
-    with patch.object(auth_service, 'r') as redis_mock:
+    with patch.object(user_cache, 'redis', new_callable=AsyncMock) as redis_mock:
         keyword = 'Name'
         redis_mock.get.return_value = None
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
+        monkeypatch.setattr(rate_limiter, 'enabled', False)
         response = client.get(f"/api/contacts/search/keyword={keyword}", headers={"Authorization": f"Bearer {token}"})
         assert response.status_code == 200, response.text
         data = response.json()
@@ -167,12 +184,10 @@ def test_search_success(client, token, monkeypatch):
 
 
 def test_search_not_found(client, token, monkeypatch):
-    with patch.object(auth_service, 'r') as redis_mock:
+    with patch.object(user_cache, 'redis', new_callable=AsyncMock) as redis_mock:
         keyword = 'Ararat'
         redis_mock.get.return_value = None
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
+        monkeypatch.setattr(rate_limiter, 'enabled', False)
         response = client.get(f"/api/contacts/search/keyword={keyword}", headers={"Authorization": f"Bearer {token}"})
         assert response.status_code == 404, response.text
         data = response.json()
@@ -180,12 +195,10 @@ def test_search_not_found(client, token, monkeypatch):
 
 
 def test_upcoming_birthdays_list_success(client, token, monkeypatch):
-    with patch.object(auth_service, 'r') as redis_mock:
+    with patch.object(user_cache, 'redis', new_callable=AsyncMock) as redis_mock:
         days = 30
         redis_mock.get.return_value = None
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
+        monkeypatch.setattr(rate_limiter, 'enabled', False)
         response = client.get(f"/api/contacts/birthdays/{int(days)}", headers={"Authorization": f"Bearer {token}"})
         assert response.status_code == 200, response.text
         data = response.json()
@@ -194,12 +207,10 @@ def test_upcoming_birthdays_list_success(client, token, monkeypatch):
 
 
 def test_upcoming_birthdays_list_not_found(client, token, monkeypatch):
-    with patch.object(auth_service, 'r') as redis_mock:
+    with patch.object(user_cache, 'redis', new_callable=AsyncMock) as redis_mock:
         days = 1
         redis_mock.get.return_value = None
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
+        monkeypatch.setattr(rate_limiter, 'enabled', False)
         response = client.get(f"/api/contacts/birthdays/{int(days)}", headers={"Authorization": f"Bearer {token}"})
         assert response.status_code == 404, response.text
         data = response.json()
@@ -207,23 +218,248 @@ def test_upcoming_birthdays_list_not_found(client, token, monkeypatch):
 
 
 def test_delete_contact_success(client, token, monkeypatch):
-    with patch.object(auth_service, 'r') as redis_mock:
+    with patch.object(user_cache, 'redis', new_callable=AsyncMock) as redis_mock:
         redis_mock.get.return_value = None
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
+        monkeypatch.setattr(rate_limiter, 'enabled', False)
         response = client.delete(f"/api/contacts/{CONTACT['id']}", headers={"Authorization": f"Bearer {token}"})
         assert response.status_code == 200, response.text
 
 
 def test_delete_contact_not_found(client, token, monkeypatch):
-    with patch.object(auth_service, 'r') as redis_mock:
+    with patch.object(user_cache, 'redis', new_callable=AsyncMock) as redis_mock:
         contact_id = 3
         redis_mock.get.return_value = None
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.redis', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.identifier', AsyncMock())
-        monkeypatch.setattr('fastapi_limiter.FastAPILimiter.http_callback', AsyncMock())
+        monkeypatch.setattr(rate_limiter, 'enabled', False)
         response = client.delete(f"/api/contacts/{contact_id}", headers={"Authorization": f"Bearer {token}"})
         assert response.status_code == 404, response.text
         data = response.json()
         assert data["detail"] == "Contact not found!"
+
+
+def test_batch_update_contacts(client, token, monkeypatch):
+    with patch.object(user_cache, 'redis', new_callable=AsyncMock) as redis_mock:
+        redis_mock.get.return_value = None
+        monkeypatch.setattr(rate_limiter, 'enabled', False)
+        headers = {"Authorization": f"Bearer {token}"}
+        response = client.post("/api/contacts", json={**CONTACT, "email": "batch@gmail.com",
+                                                      "phone_number": "0500000077"}, headers=headers)
+        contact_id = response.json()["id"]
+
+        response = client.patch("/api/contacts/batch", json={"ids": [contact_id, 999],
+                                                             "values": {"other_data": "batch"}}, headers=headers)
+        assert response.status_code == 200, response.text
+        assert response.json() == {"matched": 1, "results": [{"id": contact_id, "status": "updated"},
+                                                             {"id": 999, "status": "not_found"}]}
+        assert client.get(f"/api/contacts/{contact_id}", headers=headers).json()["other_data"] == "batch"
+
+        response = client.patch("/api/contacts/batch", json={"filter": {"email": "batch@gmail.com"},
+                                                             "values": {"first_name": None}}, headers=headers)
+        assert response.status_code == 422, response.text
+        response = client.patch("/api/contacts/batch", json={"values": {"other_data": "x"}}, headers=headers)
+        assert response.status_code == 422, response.text
+
+
+def test_batch_delete_contacts(client, token, monkeypatch):
+    with patch.object(user_cache, 'redis', new_callable=AsyncMock) as redis_mock:
+        redis_mock.get.return_value = None
+        monkeypatch.setattr(rate_limiter, 'enabled', False)
+        headers = {"Authorization": f"Bearer {token}"}
+        response = client.request("DELETE", "/api/contacts/batch", json={"filter": {"email": "batch@gmail.com"}},
+                                   headers=headers)
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data["matched"] == 1
+        assert data["results"][0]["status"] == "deleted"
+
+        response = client.request("DELETE", "/api/contacts/batch", json={"filter": {}}, headers=headers)
+        assert response.status_code == 422, response.text
+
+
+def test_contact_changes(client, token, monkeypatch):
+    with patch.object(user_cache, 'redis', new_callable=AsyncMock) as redis_mock:
+        redis_mock.get.return_value = None
+        monkeypatch.setattr(rate_limiter, 'enabled', False)
+        headers = {"Authorization": f"Bearer {token}"}
+        response = client.get("/api/contacts/changes", headers=headers)
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert set(data) == {"changed", "deleted", "cursor", "has_more"}
+
+        response = client.get("/api/contacts/changes", params={"since": data["cursor"]}, headers=headers)
+        assert response.status_code == 200, response.text
+
+        response = client.get("/api/contacts/changes", params={"since": "broken"}, headers=headers)
+        assert response.status_code == 400, response.text
+
+        aware = datetime(2030, 1, 1, tzinfo=timezone.utc)
+        for cursor in (repository_contacts.ChangesCursor(aware, 0, datetime(2030, 1, 1), 0),
+                       repository_contacts.ChangesCursor(datetime(2030, 1, 1), 0, aware, 0)):
+            response = client.get("/api/contacts/changes", params={"since": cursor.encode()}, headers=headers)
+            assert response.status_code == 400, response.text
+
+        expired = repository_contacts.ChangesCursor(datetime(2000, 1, 1), 0, datetime(2000, 1, 1), 0).encode()
+        response = client.get("/api/contacts/changes", params={"since": expired}, headers=headers)
+        assert response.status_code == 410, response.text
+
+
+def test_query_budgets(client, token, queries, monkeypatch):
+    # the user is cached after the first request, so the budgets count only the route's own statements
+    with patch.object(user_cache, 'redis', new_callable=AsyncMock) as redis_mock, \
+            patch.object(user_cache, 'local', LRUCache(maxsize=16, ttl=60)):
+        redis_mock.get.return_value = None
+        monkeypatch.setattr(rate_limiter, 'enabled', False)
+        headers = {"Authorization": f"Bearer {token}"}
+        client.get("/api/contacts", headers=headers)
+
+        with queries.budget(1):
+            response = client.post("/api/contacts", json={**CONTACT, "email": "budget@gmail.com",
+                                                          "phone_number": "0500000055"}, headers=headers)
+        assert response.status_code == 201, response.text
+        contact_id = response.json()["id"]
+        with queries.budget(1):
+            assert client.get("/api/contacts", headers=headers).status_code == 200
+        with queries.budget(1):
+            assert client.get(f"/api/contacts/{contact_id}", headers=headers).status_code == 200
+        with queries.budget(1):
+            assert client.get("/api/contacts/search/keyword=budget", headers=headers).status_code == 200
+        with queries.budget(1):
+            client.get("/api/contacts/birthdays/7", headers=headers)
+        with queries.budget(1):
+            response = client.put(f"/api/contacts/{contact_id}", json={**CONTACT, "email": "budget@gmail.com",
+                                                                       "phone_number": "0500000055"}, headers=headers)
+        assert response.status_code == 200, response.text
+        # the DELETE and one multi-row tombstone INSERT
+        with queries.budget(2):
+            response = client.request("DELETE", "/api/contacts/batch", json={"ids": [contact_id]}, headers=headers)
+        assert response.json()["matched"] == 1
+
+
+def test_import_contacts_csv(client, token, monkeypatch):
+    with patch.object(user_cache, 'redis', new_callable=AsyncMock) as redis_mock:
+        redis_mock.get.return_value = None
+        monkeypatch.setattr(rate_limiter, 'enabled', False)
+        body = ("first_name,last_name,email,phone_number,birthday,other_data\n"
+                "Import,One,import1@gmail.com,0500000001,1990-03-10,\n"
+                "Import,Two,import1@gmail.com,0500000002,1990-03-11,dup email\n"
+                "Import,Three,not-an-email,0500000003,1990-03-12,\n")
+        response = client.post("/api/contacts/import", content=body,
+                               headers={"Authorization": f"Bearer {token}", "Content-Type": "text/csv"})
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data["imported"] == 1
+        assert [error["row"] for error in data["errors"]] == [2, 3]
+        assert data["errors"][0]["detail"] == "Email is exists"
+
+
+def test_import_contacts_ndjson(client, token, monkeypatch):
+    with patch.object(user_cache, 'redis', new_callable=AsyncMock) as redis_mock:
+        redis_mock.get.return_value = None
+        monkeypatch.setattr(rate_limiter, 'enabled', False)
+        rows = [
+            {"first_name": "Import", "last_name": "Four", "email": "import4@gmail.com",
+             "phone_number": "0500000004", "birthday": "1990-03-13"},
+            {"first_name": "Import", "last_name": "Five", "email": "import5@gmail.com",
+             "phone_number": "0500000001", "birthday": "1990-03-14"},
+        ]
+        body = "\n".join(json.dumps(row) for row in rows) + "\n{broken"
+        response = client.post("/api/contacts/import", content=body,
+                               headers={"Authorization": f"Bearer {token}", "Content-Type": "application/x-ndjson"})
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data["imported"] == 1
+        assert [error["row"] for error in data["errors"]] == [2, 3]
+        assert data["errors"][0]["detail"] == "Phone number is exists"
+
+
+def test_export_contacts(client, token, monkeypatch):
+    with patch.object(user_cache, 'redis', new_callable=AsyncMock) as redis_mock:
+        redis_mock.get.return_value = None
+        monkeypatch.setattr(rate_limiter, 'enabled', False)
+        response = client.get("/api/contacts/export", params={"format": "csv"},
+                              headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200, response.text
+        assert response.headers["content-type"].startswith("text/csv")
+        lines = response.text.splitlines()
+        assert lines[0] == "first_name,last_name,email,phone_number,birthday,other_data"
+        assert lines[1:] == ["Import,One,import1@gmail.com,0500000001,1990-03-10,",
+                             "Import,Four,import4@gmail.com,0500000004,1990-03-13,"]
+        response = client.get("/api/contacts/export", headers={"Authorization": f"Bearer {token}"})
+        assert [json.loads(line)["email"] for line in response.text.splitlines()] == ["import1@gmail.com",
+                                                                                        "import4@gmail.com"]
+
+
+def test_import_contacts_csv_quoted_newlines_and_bad_bytes(client, token, monkeypatch):
+    with patch.object(user_cache, 'redis', new_callable=AsyncMock) as redis_mock:
+        redis_mock.get.return_value = None
+        monkeypatch.setattr(rate_limiter, 'enabled', False)
+        headers = {"Authorization": f"Bearer {token}", "Content-Type": "text/csv"}
+        body = ("first_name,last_name,email,phone_number,birthday,other_data\n"
+                'Import,Six,import6@gmail.com,0500000006,1990-03-15,"line one\nline, ""two"""\n').encode()
+        body += b"Import,S\xe9ven,import7@gmail.com,0500000007,1990-03-16,\n"
+        body += b"Import,Eight,import8@gmail.com,0500000008,1990-03-17,\n"
+        response = client.post("/api/contacts/import", content=body, headers=headers)
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data["imported"] == 2
+        assert data["errors"] == [{"row": 2, "detail": "Invalid UTF-8"}]
+
+        # a file exported with multi-line fields reads back record by record
+        exported = client.get("/api/contacts/export", params={"format": "csv"},
+                              headers={"Authorization": f"Bearer {token}"}).content
+        assert b'"line one\nline, ""two"""' in exported.replace(b"\r\n", b"\n")
+        response = client.post("/api/contacts/import", content=exported, headers=headers)
+        data = response.json()
+        assert data["imported"] == 0
+        assert [error["row"] for error in data["errors"]] == [1, 2, 3, 4]
+        assert {error["detail"] for error in data["errors"]} == {"Email is exists"}
+
+
+def test_get_contacts_cached_with_etag(client, token, monkeypatch):
+    with patch.object(user_cache, 'redis', new_callable=AsyncMock) as redis_mock, \
+            patch.object(contacts_cache, 'local', LRUCache(maxsize=16, ttl=60)):
+        redis_mock.get.return_value = None
+        monkeypatch.setattr(rate_limiter, 'enabled', False)
+        get_contacts = AsyncMock(wraps=repository_contacts.get_contacts)
+        monkeypatch.setattr(repository_contacts, 'get_contacts', get_contacts)
+        headers = {"Authorization": f"Bearer {token}"}
+
+        first = client.get("/api/contacts", headers=headers)
+        second = client.get("/api/contacts", headers=headers)
+        assert first.status_code == second.status_code == 200
+        assert first.json() == second.json()
+        assert first.headers["ETag"] == second.headers["ETag"]
+        assert get_contacts.await_count == 1
+
+        not_modified = client.get("/api/contacts", headers={**headers, "If-None-Match": first.headers["ETag"]})
+        assert not_modified.status_code == 304
+        assert get_contacts.await_count == 1
+
+        response = client.post("/api/contacts", json={**CONTACT, "email": "cached@gmail.com",
+                                                      "phone_number": "0500000099"}, headers=headers)
+        assert response.status_code == 201, response.text
+        changed = client.get("/api/contacts", headers={**headers, "If-None-Match": first.headers["ETag"]})
+        assert changed.status_code == 200
+        assert changed.headers["ETag"] != first.headers["ETag"]
+        assert len(changed.json()) == len(first.json()) + 1
+
+
+def test_search_served_from_redis_cache(client, token, monkeypatch):
+    # no in-process tier: the second response has to come from the Redis fake of the client fixture
+    with patch.object(user_cache, 'redis', new_callable=AsyncMock) as redis_mock, \
+            patch.object(contacts_cache, 'local', LRUCache(maxsize=0, ttl=60)):
+        redis_mock.get.return_value = None
+        monkeypatch.setattr(rate_limiter, 'enabled', False)
+        search_contact = AsyncMock(wraps=repository_contacts.search_contact)
+        monkeypatch.setattr(repository_contacts, 'search_contact', search_contact)
+        headers = {"Authorization": f"Bearer {token}"}
+
+        first = client.get("/api/contacts/search/keyword=cached", headers=headers)
+        second = client.get("/api/contacts/search/keyword=cached", headers=headers)
+        assert first.status_code == second.status_code == 200
+        assert first.json() == second.json() != []
+        assert search_contact.await_count == 1
+
+        not_modified = client.get("/api/contacts/search/keyword=cached",
+                                  headers={**headers, "If-None-Match": second.headers["ETag"]})
+        assert not_modified.status_code == 304
+        assert search_contact.await_count == 1
@@ -0,0 +1,43 @@
+import asyncio
+import unittest
+
+from src.services.background import BackgroundTasks
+
+
+class TestBackgroundTasks(unittest.IsolatedAsyncioTestCase):
+    async def test_keeps_tasks_until_done(self):
+        tasks = BackgroundTasks()
+        done = asyncio.Event()
+        task = tasks.spawn(done.wait())
+        self.assertIn(task, tasks.tasks)
+
+        done.set()
+        await task
+        await asyncio.sleep(0)
+        self.assertFalse(tasks.tasks)
+
+    async def test_failed_task_is_logged(self):
+        tasks = BackgroundTasks()
+
+        async def fail():
+            raise ValueError('boom')
+
+        with self.assertLogs(level='ERROR'):
+            task = tasks.spawn(fail())
+            await asyncio.gather(task, return_exceptions=True)
+            await asyncio.sleep(0)
+        self.assertFalse(tasks.tasks)
+
+    async def test_drain_waits_then_cancels(self):
+        tasks = BackgroundTasks()
+        finished = tasks.spawn(asyncio.sleep(0.01))
+        stuck = tasks.spawn(asyncio.sleep(60))
+
+        cancelled = await tasks.drain(timeout=0.1)
+
+        self.assertEqual(cancelled, 1)
+        self.assertTrue(finished.done() and not finished.cancelled())
+        self.assertTrue(stuck.cancelled())
+
+    async def test_drain_without_tasks(self):
+        self.assertEqual(await BackgroundTasks().drain(timeout=1), 0)
@@ -0,0 +1,98 @@
+import unittest
+from datetime import datetime
+from unittest.mock import AsyncMock, patch
+
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+from redis.exceptions import RedisError
+
+from src.database.models import User
+from src.services.cache import ContactsCache, LRUCache, UserCache
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_entry_expires(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        with patch('src.services.cache.time.monotonic', return_value=100):
+            cache.set('a', 1)
+        with patch('src.services.cache.time.monotonic', return_value=161):
+            self.assertIsNone(cache.get('a'))
+
+
+class TestUserCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.cache = UserCache()
+        self.cache.local = LRUCache(maxsize=10, ttl=60)
+        self.cache.redis = AsyncMock()
+        self.user = User(id=1, username='username', email='test@example.com', password='secret',
+                         refresh_token='token', avatar='https://example.com/avatar.jpg', confirmed=True,
+                         created_at=datetime(2023, 5, 20, 13, 25))
+
+    async def test_snapshot_round_trip(self):
+        await self.cache.set(self.user)
+        self.cache.redis.set.assert_awaited_once()
+        self.assertNotIn(b'secret', self.cache.redis.set.call_args.args[1])
+
+        user = await self.cache.get('test@example.com')
+        self.cache.redis.get.assert_not_awaited()
+        self.assertEqual(user.id, 1)
+        self.assertEqual(user.email, 'test@example.com')
+        self.assertEqual(user.created_at, self.user.created_at)
+        self.assertIsNone(user.password)
+
+    async def test_redis_tier_fills_local(self):
+        self.cache.redis.get.return_value = self.cache.dumps(self.user)
+        await self.cache.get('test@example.com')
+        await self.cache.get('test@example.com')
+        self.cache.redis.get.assert_awaited_once_with('user:test@example.com')
+
+    async def test_invalidate(self):
+        await self.cache.set(self.user)
+        self.cache.redis.get.return_value = None
+        await self.cache.invalidate('test@example.com')
+        self.cache.redis.delete.assert_awaited_once_with('user:test@example.com')
+        self.assertIsNone(await self.cache.get('test@example.com'))
+
+
+class TestContactsCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.cache = ContactsCache(ttl=60)
+        self.cache.redis = FakeRedis(server=FakeServer())
+
+    async def test_bump_changes_version(self):
+        version = await self.cache.version(1)
+        self.assertEqual(await self.cache.version(1), version)
+        self.assertLessEqual(await self.cache.redis.ttl(self.cache.version_key(1)), 60)
+
+        await self.cache.bump(1)
+        self.assertNotIn(await self.cache.version(1), (None, version))
+
+    async def test_failed_bump_bypasses_cache_until_retried(self):
+        version = await self.cache.version(1)
+        redis = self.cache.redis
+        failing = AsyncMock()
+        failing.set.side_effect = RedisError('down')
+        self.cache.redis = failing
+
+        with self.assertLogs(level='WARNING'), patch('src.services.cache.background_tasks') as tasks:
+            await self.cache.bump(1)
+            await self.cache.bump(1)
+        retry = tasks.spawn.call_args.args[0]
+        tasks.spawn.assert_called_once()
+        self.assertIsNone(await self.cache.version(1))
+
+        # Redis comes back: the retry replaces the version, so old entries and ETags are never reused
+        self.cache.redis = redis
+        await retry
+        self.assertFalse(self.cache.pending_bumps)
+        self.assertNotIn(await self.cache.version(1), (None, version))
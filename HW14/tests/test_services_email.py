@@ -1,9 +1,31 @@
 import asyncio
+import json
+import socket
+import unittest
+from unittest.mock import AsyncMock
 
+from aiosmtpd.controller import Controller
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
 from fastapi_mail import FastMail
+from redis.exceptions import ConnectionError
 
+from src.conf.config import settings
 from src.services.auth import auth_service
-from src.services.email import send_email
+from src.services.email import EmailOutbox, outbox, send_email
+from src.services.email_worker import EmailWorker
+
+
+def test_send_email_is_queued(monkeypatch):
+    redis_mock = AsyncMock()
+    monkeypatch.setattr(outbox, "redis", redis_mock)
+
+    asyncio.run(send_email("test@example.com", "testuser", "example.com"))
+
+    queue, payload = redis_mock.rpush.call_args.args
+    assert queue == outbox.queue
+    assert json.loads(payload) == {"email": "test@example.com", "username": "testuser", "host": "example.com",
+                                   "attempts": 0}
 
 
 def test_send_email(monkeypatch):
@@ -24,5 +46,100 @@ def test_send_email(monkeypatch):
         "create_email_token",
         lambda payload: "mocked_token"
     )
+    monkeypatch.setattr(outbox, "redis", AsyncMock(rpush=AsyncMock(side_effect=ConnectionError())))
+
+    asyncio.run(send_email("test@example.com", "testuser", "example.com"))
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.messages = []
+        self.sessions = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        self.sessions.add(id(session))
+        self.messages.append(envelope)
+        return '250 OK'
+
+
+class TestEmailWorker(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.handler = RecordingHandler()
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            self.port = sock.getsockname()[1]
+        self.controller = Controller(self.handler, hostname='127.0.0.1', port=self.port)
+        self.controller.start()
+
+    def tearDown(self):
+        self.controller.stop()
+
+    def worker(self, redis, port=None, **kwargs):
+        return EmailWorker(redis=redis, hostname='127.0.0.1', port=port or self.port, use_tls=False,
+                           start_tls=False, use_credentials=False, validate_certs=False, **kwargs)
+
+    async def test_batch_is_sent_over_one_connection(self):
+        redis = FakeRedis()
+        queue = EmailOutbox()
+        queue.redis = redis
+        for i in range(3):
+            await queue.enqueue({"email": f"user{i}@example.com", "username": f"user{i}", "host": "http://test/",
+                                 "attempts": 0})
+        worker = self.worker(redis, batch_size=10)
+        items = await worker.fetch_batch()
+        self.assertEqual(len(items), 3)
+        self.assertEqual(await redis.llen(worker.processing_queue), 3)
+        self.assertEqual(await worker.process_batch(items), 3)
+        await worker.close()
+        self.assertEqual(await redis.llen(worker.processing_queue), 0)
+
+        self.assertEqual([envelope.rcpt_tos for envelope in self.handler.messages],
+                         [["user0@example.com"], ["user1@example.com"], ["user2@example.com"]])
+        self.assertEqual(len(self.handler.sessions), 1)
+        self.assertIn(b'http://test/api/auth/confirmed_email/', self.handler.messages[0].content)
+
+    async def test_failed_delivery_is_retried_then_dead_lettered(self):
+        redis = FakeRedis()
+        worker = self.worker(redis, port=1, max_attempts=2, backoff=0)
+        message = {"email": "user@example.com", "username": "user", "host": "http://test/", "attempts": 0}
+
+        self.assertEqual(await worker.process_batch([json.dumps(message)]), 0)
+        await worker.promote_due_retries()
+        retried = await worker.fetch_batch()
+        self.assertEqual(json.loads(retried[0])["attempts"], 1)
+
+        await worker.process_batch(retried)
+        self.assertEqual(await redis.llen(worker.dead_queue), 1)
+        self.assertEqual(await redis.zcard(worker.retry_queue), 0)
+        self.assertEqual(await redis.llen(worker.processing_queue), 0)
+
+    async def test_bad_job_is_dead_lettered_and_batch_continues(self):
+        redis = FakeRedis(server=FakeServer())
+        good = {"email": "user@example.com", "username": "user", "host": "http://test/", "attempts": 0}
+        await redis.rpush(settings.email_queue, b'{not json', json.dumps({"email": "x@example.com"}),
+                          json.dumps(good))
+        worker = self.worker(redis, batch_size=10)
+
+        with self.assertLogs(level='ERROR'):
+            self.assertEqual(await worker.process_batch(await worker.fetch_batch()), 1)
+        await worker.close()
+
+        self.assertEqual([envelope.rcpt_tos for envelope in self.handler.messages], [["user@example.com"]])
+        self.assertEqual(await redis.lrange(worker.dead_queue, 0, -1),
+                         [b'{not json', json.dumps({"email": "x@example.com"}).encode()])
+        self.assertEqual(await redis.llen(worker.processing_queue), 0)
+
+    async def test_unfinished_jobs_are_requeued_on_start(self):
+        redis = FakeRedis(server=FakeServer())
+        for i in range(3):
+            await redis.rpush(settings.email_queue, json.dumps({"email": f"user{i}@example.com", "username": "u",
+                                                                "host": "http://test/", "attempts": 0}))
+        crashed = self.worker(redis, batch_size=2)
+        await crashed.fetch_batch()
 
-    asyncio.run(send_email("test@example.com", "testuser", "example.com"))
\ No newline at end of file
+        worker = self.worker(redis, batch_size=10)
+        self.assertEqual(await worker.recover(), 2)
+        self.assertEqual(await worker.process_batch(await worker.fetch_batch()), 3)
+        await worker.close()
+        self.assertEqual([envelope.rcpt_tos for envelope in self.handler.messages],
+                         [["user0@example.com"], ["user1@example.com"], ["user2@example.com"]])
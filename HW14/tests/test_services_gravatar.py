@@ -0,0 +1,114 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import AsyncMock, patch
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from src.database.models import Base, User
+from src.schemas import UserDb
+from src.services.cache import user_cache
+from src.services.gravatar import GravatarChecker, gravatar_hash, gravatar_url
+
+KNOWN = 'known@example.com'
+UNKNOWN = 'unknown@example.com'
+SLOW = 'slow@example.com'
+
+
+class FakeGravatar(BaseHTTPRequestHandler):
+    """Stands in for gravatar.com: 200 for KNOWN, 404 for everyone else, and a stall for SLOW."""
+    requests = []
+
+    def do_GET(self):
+        digest = self.path.split('?')[0].rsplit('/', 1)[-1]
+        self.requests.append(self.path)
+        if digest == gravatar_hash(SLOW):
+            time.sleep(1)
+        self.send_response(200 if digest == gravatar_hash(KNOWN) else 404)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class TestGravatarUrl(unittest.TestCase):
+    def test_normalises_email(self):
+        self.assertEqual(gravatar_url(' Known@Example.com '), gravatar_url(KNOWN))
+        self.assertEqual(gravatar_url(KNOWN, 'http://avatars/'),
+                         f"http://avatars/{gravatar_hash(KNOWN)}")
+
+
+class TestGravatarChecker(unittest.IsolatedAsyncioTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeGravatar)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}/avatar"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    async def asyncSetUp(self):
+        FakeGravatar.requests = []
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(self.tmp.name, 'db')}.db")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            for i, email in enumerate((KNOWN, UNKNOWN, SLOW), 1):
+                await conn.execute(User.__table__.insert().values(id=i, username=email, email=email, password='x',
+                                                                  avatar=gravatar_url(email)))
+        self.checker = GravatarChecker(base_url=self.base_url, timeout=0.2, default='mp')
+        self.checker.session_factory = async_sessionmaker(self.engine, class_=AsyncSession)
+        patcher = patch.object(user_cache, 'redis', new_callable=AsyncMock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self):
+        await self.checker.close()
+        await self.engine.dispose()
+        self.tmp.cleanup()
+
+    async def avatar(self, email: str) -> str:
+        async with self.checker.session_factory() as db:
+            user = (await db.execute(select(User).where(User.email == email))).scalar_one()
+        # whatever the check stores must still serialize in responses
+        UserDb.from_orm(user)
+        return user.avatar
+
+    async def test_existing_gravatar_is_kept(self):
+        await self.checker.check(KNOWN, gravatar_url(KNOWN))
+        self.assertEqual(await self.avatar(KNOWN), gravatar_url(KNOWN))
+        self.assertEqual(FakeGravatar.requests, [f"/avatar/{gravatar_hash(KNOWN)}?d=404"])
+
+    async def test_missing_gravatar_gets_explicit_default(self):
+        await self.checker.check(UNKNOWN, gravatar_url(UNKNOWN))
+        self.assertEqual(await self.avatar(UNKNOWN), f"{gravatar_url(UNKNOWN)}?d=mp")
+        user_cache.redis.delete.assert_awaited_once_with(user_cache.key(UNKNOWN))
+
+    async def test_result_is_remembered(self):
+        self.assertFalse(await self.checker.exists(UNKNOWN))
+        self.assertFalse(await self.checker.exists(UNKNOWN.upper()))
+        self.assertEqual(len(FakeGravatar.requests), 1)
+
+    async def test_uploaded_avatar_is_not_overwritten(self):
+        await self.checker.check(UNKNOWN, 'https://example.com/uploaded.png')
+        self.assertEqual(await self.avatar(UNKNOWN), gravatar_url(UNKNOWN))
+        user_cache.redis.delete.assert_not_awaited()
+
+    async def test_timeout_leaves_avatar(self):
+        with self.assertLogs(level='WARNING'):
+            await self.checker.check(SLOW, gravatar_url(SLOW))
+        self.assertEqual(await self.avatar(SLOW), gravatar_url(SLOW))
+        self.assertIsNone(self.checker.results.get(gravatar_hash(SLOW)))
+
+    async def test_unreachable_service(self):
+        self.checker.base_url = 'http://127.0.0.1:1/avatar'
+        with self.assertLogs(level='WARNING'):
+            self.assertIsNone(await self.checker.exists(UNKNOWN))
@@ -0,0 +1,100 @@
+import unittest
+
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.services import metrics
+from src.services.metrics import (Counter, LabeledHistogram, MetricsMiddleware, RequestStats, current_stats,
+                                  instrument_engine, instrument_redis)
+
+
+class TestExposition(unittest.TestCase):
+    def test_counter(self):
+        counter = Counter('requests_total', 'Requests.', ('route',))
+        counter.inc('/a')
+        counter.inc('/a')
+        counter.inc('/"b"\n')
+
+        self.assertEqual(counter.render(), [
+            '# HELP requests_total Requests.',
+            '# TYPE requests_total counter',
+            'requests_total{route="/\\"b\\"\\n"} 1',
+            'requests_total{route="/a"} 2',
+        ])
+
+    def test_histogram(self):
+        histogram = LabeledHistogram('latency_seconds', 'Latency.', ('route',), buckets=(0.1, 1))
+        histogram.observe(0.05, '/a')
+        histogram.observe(0.5, '/a')
+
+        self.assertEqual(histogram.render()[2:], [
+            'latency_seconds_bucket{route="/a",le="0.1"} 1',
+            'latency_seconds_bucket{route="/a",le="1"} 2',
+            'latency_seconds_bucket{route="/a",le="+Inf"} 2',
+            'latency_seconds_sum{route="/a"} 0.55',
+            'latency_seconds_count{route="/a"} 2',
+        ])
+
+
+class TestInstrumentation(unittest.IsolatedAsyncioTestCase):
+    async def test_db_queries_are_counted(self):
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        instrument_engine(engine.sync_engine)
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        try:
+            async with engine.connect() as conn:
+                await conn.execute(text('SELECT 1'))
+                await conn.execute(text('SELECT 2'))
+                with self.assertRaises(Exception):
+                    await conn.execute(text('SELECT * FROM missing'))
+        finally:
+            current_stats.reset(token)
+            await engine.dispose()
+
+        self.assertEqual(stats.db_queries, 2)
+        self.assertGreater(stats.db_time, 0)
+
+    async def test_redis_calls_are_counted(self):
+        redis = instrument_redis(FakeRedis(server=FakeServer()))
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        try:
+            await redis.set('key', 'value')
+            self.assertEqual(await redis.get('key'), b'value')
+        finally:
+            current_stats.reset(token)
+
+        self.assertEqual(stats.redis_calls, 2)
+
+
+class TestMetricsMiddleware(unittest.TestCase):
+    def setUp(self):
+        app = FastAPI()
+        app.add_middleware(MetricsMiddleware, server_timing=True)
+
+        @app.get('/items/{item_id}')
+        async def item(item_id: int):
+            stats = current_stats.get()
+            stats.db_queries += 3
+            return {'id': item_id}
+
+        self.client = TestClient(app)
+
+    def test_server_timing_and_route_labels(self):
+        response = self.client.get('/items/42')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('db;dur=', response.headers['Server-Timing'])
+        self.assertIn('desc="3 queries"', response.headers['Server-Timing'])
+        self.assertGreaterEqual(metrics.http_requests.series[('GET', '/items/{item_id}', '200')], 1)
+        self.assertGreaterEqual(metrics.db_queries_per_request.series[('GET', '/items/{item_id}')].sum, 3)
+
+    def test_unmatched_route(self):
+        self.client.get('/missing/1')
+
+        self.assertIn(('GET', 'unmatched', '404'), metrics.http_requests.series)
@@ -0,0 +1,46 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+from src.services.password import PasswordHasher
+
+
+class TestPasswordHasher(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.hasher = PasswordHasher(workers=2, max_queue=1)
+
+    def tearDown(self):
+        self.hasher.shutdown()
+
+    async def test_hash_and_verify(self):
+        hashed = await self.hasher.hash('123456789')
+        self.assertEqual(await self.hasher.verify_and_update('123456789', hashed), (True, None))
+        self.assertEqual(await self.hasher.verify_and_update('wrong', hashed), (False, None))
+
+    async def test_deprecated_hash_is_upgraded(self):
+        context = CryptContext(schemes=['bcrypt', 'md5_crypt'], deprecated='auto')
+        with patch('src.services.password.pwd_context', context):
+            old_hash = context.handler('md5_crypt').hash('123456789')
+            valid, new_hash = await self.hasher.verify_and_update('123456789', old_hash)
+        self.assertTrue(valid)
+        self.assertTrue(new_hash.startswith('$2b$'))
+
+    async def test_rejects_when_queue_is_full(self):
+        release = asyncio.Event()
+        loop = asyncio.get_running_loop()
+
+        def blocking():
+            asyncio.run_coroutine_threadsafe(release.wait(), loop).result()
+
+        running = [asyncio.create_task(self.hasher.run(blocking)) for _ in range(3)]
+        await asyncio.sleep(0)
+        self.assertEqual(self.hasher.queue_depth, 1)
+        with self.assertRaises(HTTPException) as error:
+            await self.hasher.run(blocking)
+        self.assertEqual(error.exception.status_code, 503)
+        release.set()
+        await asyncio.gather(*running)
+        self.assertEqual(self.hasher.queue_depth, 0)
@@ -0,0 +1,149 @@
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import httpx
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+from fastapi import Depends, FastAPI
+from redis.exceptions import ConnectionError
+
+from src.conf.config import settings
+from src.database.models import User
+from src.services.auth import auth_service
+from src.services.rate_limit import (Limit, RateLimit, RateLimitHeadersMiddleware, RateLimiter, get_limit,
+                                     parse_limit)
+
+USER = User(id=1, username='user', email='user@example.com')
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class RateLimiterTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.server = FakeServer()
+        self.clock = FakeClock()
+        patcher = patch('src.services.rate_limit.time')
+        time_mock = patcher.start()
+        time_mock.time.side_effect = self.clock
+        time_mock.monotonic.side_effect = self.clock
+        self.addCleanup(patcher.stop)
+
+    def limiter(self, **kwargs) -> RateLimiter:
+        limiter = RateLimiter(**kwargs)
+        limiter.redis = FakeRedis(server=self.server)
+        return limiter
+
+
+class TestExactMode(RateLimiterTestCase):
+    async def test_bucket_empties_and_refills(self):
+        limiter = self.limiter()
+        limit = Limit(2, 10)
+
+        first = await limiter.hit_exact('write:1', limit)
+        second = await limiter.hit_exact('write:1', limit)
+        denied = await limiter.hit_exact('write:1', limit)
+
+        self.assertEqual((first.allowed, first.remaining), (True, 1))
+        self.assertEqual((second.allowed, second.remaining), (True, 0))
+        self.assertFalse(denied.allowed)
+        self.assertEqual(denied.retry_after, 5)
+
+        self.clock.now += 5
+        self.assertTrue((await limiter.hit_exact('write:1', limit)).allowed)
+
+    async def test_shared_between_workers(self):
+        first, second = self.limiter(), self.limiter()
+        limit = Limit(1, 10)
+
+        self.assertTrue((await first.hit_exact('write:1', limit)).allowed)
+        self.assertFalse((await second.hit_exact('write:1', limit)).allowed)
+
+    async def test_redis_unavailable_fails_open(self):
+        limiter = self.limiter()
+        limiter.redis = AsyncMock(evalsha=AsyncMock(side_effect=ConnectionError()))
+
+        self.assertTrue((await limiter.hit_exact('write:1', Limit(1, 10))).allowed)
+
+
+class TestApproximateMode(RateLimiterTestCase):
+    async def test_hits_between_syncs_stay_local(self):
+        limiter = self.limiter(sync_interval=60, sync_batch=100)
+        limit = Limit(5, 10)
+        with patch.object(limiter, 'take', wraps=limiter.take) as take:
+            results = [await limiter.hit('read:1', limit) for _ in range(6)]
+
+        self.assertEqual([r.allowed for r in results], [True] * 5 + [False])
+        self.assertEqual(take.await_count, 1)
+
+    async def test_sync_pushes_local_hits(self):
+        limiter = self.limiter(sync_interval=60, sync_batch=3)
+        limit = Limit(10, 10)
+        for _ in range(4):
+            await limiter.hit('read:1', limit)
+
+        tokens = float(await limiter.redis.hget(limiter.key('read:1'), 'tokens'))
+        self.assertEqual(tokens, 6)
+
+    async def test_sees_other_workers_after_sync(self):
+        first, second = self.limiter(sync_interval=1, sync_batch=100), self.limiter(sync_interval=1, sync_batch=100)
+        limit = Limit(4, 400)
+
+        await second.hit('read:1', limit)
+        for _ in range(3):
+            await first.hit('read:1', limit)
+        self.clock.now += 1
+        await first.hit('read:1', limit)
+
+        self.clock.now += 1
+        result = await second.hit('read:1', limit)
+        self.assertFalse(result.allowed)
+        self.assertEqual(result.remaining, 0)
+
+
+class TestLimits(unittest.TestCase):
+    def test_parse_limit(self):
+        self.assertEqual(parse_limit('10/60'), Limit(10, 60))
+        self.assertAlmostEqual(parse_limit('10/60').rate, 1 / 6)
+
+    def test_plan_per_user(self):
+        with patch.object(settings, 'rate_limit_users', {'vip@example.com': 'pro'}):
+            self.assertEqual(get_limit(USER, 'write'), parse_limit(settings.rate_limit_plans['free']['write']))
+            vip = User(id=2, email='vip@example.com')
+            self.assertEqual(get_limit(vip, 'write'), parse_limit(settings.rate_limit_plans['pro']['write']))
+
+
+class TestRateLimitDependency(RateLimiterTestCase):
+    def setUp(self):
+        super().setUp()
+        app = FastAPI()
+        app.add_middleware(RateLimitHeadersMiddleware)
+        limiter = self.limiter()
+
+        @app.post('/items', dependencies=[Depends(RateLimit('write', exact=True, limiter=limiter))])
+        async def create_item():
+            return {'ok': True}
+
+        app.dependency_overrides[auth_service.get_current_user] = lambda: USER
+        self.client = httpx.AsyncClient(app=app, base_url='http://test')
+
+    async def asyncTearDown(self):
+        await self.client.aclose()
+
+    async def test_headers_and_429(self):
+        limit = get_limit(USER, 'write')
+        for remaining in reversed(range(limit.times)):
+            response = await self.client.post('/items')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers['X-RateLimit-Limit'], str(limit.times))
+            self.assertEqual(response.headers['X-RateLimit-Remaining'], str(remaining))
+
+        response = await self.client.post('/items')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['X-RateLimit-Remaining'], '0')
+        self.assertGreaterEqual(int(response.headers['Retry-After']), 1)
@@ -0,0 +1,75 @@
+import unittest
+from unittest.mock import AsyncMock
+
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+from fastapi import HTTPException
+from redis.exceptions import ConnectionError
+
+from src.services.sessions import RefreshSessionStore
+
+EMAIL = "test@example.com"
+TTL = 60
+
+
+class TestRefreshSessionStore(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.store = RefreshSessionStore()
+        self.store.redis = FakeRedis(server=FakeServer())
+
+    async def test_start_sets_ttl(self):
+        jti, family = await self.store.start(EMAIL, TTL)
+
+        self.assertEqual(await self.store.redis.get(self.store.token_key(jti)), family.encode())
+        self.assertEqual(await self.store.redis.get(self.store.session_key(family)), jti.encode())
+        self.assertTrue(0 < await self.store.redis.ttl(self.store.token_key(jti)) <= TTL)
+        self.assertEqual(await self.store.redis.smembers(self.store.user_key(EMAIL)), {family.encode()})
+
+    async def test_rotate(self):
+        jti, family = await self.store.start(EMAIL, TTL)
+
+        new_jti = await self.store.rotate(EMAIL, jti, family, TTL)
+
+        self.assertIsNotNone(new_jti)
+        self.assertNotEqual(new_jti, jti)
+        self.assertIsNone(await self.store.redis.get(self.store.token_key(jti)))
+        self.assertEqual(await self.store.redis.get(self.store.session_key(family)), new_jti.encode())
+
+    async def test_reuse_revokes_session(self):
+        jti, family = await self.store.start(EMAIL, TTL)
+        new_jti = await self.store.rotate(EMAIL, jti, family, TTL)
+
+        self.assertIsNone(await self.store.rotate(EMAIL, jti, family, TTL))
+        self.assertIsNone(await self.store.rotate(EMAIL, new_jti, family, TTL))
+        self.assertEqual(await self.store.redis.smembers(self.store.user_key(EMAIL)), set())
+
+    async def test_rotate_wrong_family(self):
+        jti, family = await self.store.start(EMAIL, TTL)
+        _, other_family = await self.store.start(EMAIL, TTL)
+
+        self.assertIsNone(await self.store.rotate(EMAIL, jti, other_family, TTL))
+
+    async def test_revoke_keeps_other_sessions(self):
+        first_jti, first = await self.store.start(EMAIL, TTL)
+        second_jti, second = await self.store.start(EMAIL, TTL)
+
+        await self.store.revoke(EMAIL, first)
+
+        self.assertIsNone(await self.store.rotate(EMAIL, first_jti, first, TTL))
+        self.assertIsNotNone(await self.store.rotate(EMAIL, second_jti, second, TTL))
+
+    async def test_revoke_all(self):
+        sessions = [await self.store.start(EMAIL, TTL) for _ in range(3)]
+
+        self.assertEqual(await self.store.revoke_all(EMAIL), 3)
+
+        for jti, family in sessions:
+            self.assertIsNone(await self.store.rotate(EMAIL, jti, family, TTL))
+        self.assertEqual(await self.store.redis.keys('refresh:*'), [])
+
+    async def test_redis_unavailable(self):
+        self.store.redis = AsyncMock(getdel=AsyncMock(side_effect=ConnectionError()))
+
+        with self.assertRaises(HTTPException) as context:
+            await self.store.rotate(EMAIL, 'jti', 'family', TTL)
+        self.assertEqual(context.exception.status_code, 503)
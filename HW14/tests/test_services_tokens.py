@@ -0,0 +1,87 @@
+import base64
+import hashlib
+import hmac
+import time
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from jose import jwt
+from jose.exceptions import JWTError, ExpiredSignatureError
+
+from src.database.models import User
+from src.services.auth import Auth
+from src.services.cache import LRUCache
+from src.services.tokens import HMACJWT, get_jwt_backend
+
+SECRET = 'secret'
+
+
+class TestHMACJWT(unittest.TestCase):
+    def setUp(self):
+        self.backend = HMACJWT()
+
+    def test_decodes_like_jose(self):
+        token = jwt.encode({'sub': 'test@example.com', 'exp': time.time() + 60, 'scope': 'access_token'},
+                           SECRET, algorithm='HS256')
+        self.assertEqual(self.backend.decode(token, SECRET, algorithms=['HS256']),
+                         jwt.decode(token, SECRET, algorithms=['HS256']))
+
+    def test_rejects_tampered_token(self):
+        token = jwt.encode({'sub': 'test@example.com'}, SECRET, algorithm='HS256')
+        forged = jwt.encode({'sub': 'admin@example.com'}, 'other', algorithm='HS256')
+        with self.assertRaises(JWTError):
+            self.backend.decode(forged.rsplit('.', 1)[0] + '.' + token.rsplit('.', 1)[1], SECRET, ['HS256'])
+        with self.assertRaises(JWTError):
+            self.backend.decode('not a token', SECRET, ['HS256'])
+
+    def test_rejects_disallowed_algorithm(self):
+        token = jwt.encode({'sub': 'test@example.com'}, SECRET, algorithm='HS512')
+        with self.assertRaises(JWTError):
+            self.backend.decode(token, SECRET, algorithms=['HS256'])
+
+    def test_rejects_expired_token(self):
+        token = jwt.encode({'sub': 'test@example.com', 'exp': time.time() - 1}, SECRET, algorithm='HS256')
+        with self.assertRaises(ExpiredSignatureError):
+            self.backend.decode(token, SECRET, algorithms=['HS256'])
+
+    def test_rejects_malformed_claims_like_jose(self):
+        def b64encode(data: bytes) -> str:
+            return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+        def sign(header: bytes, payload: bytes) -> str:
+            segments = b64encode(header) + '.' + b64encode(payload)
+            return segments + '.' + b64encode(hmac.new(SECRET.encode(), segments.encode(), hashlib.sha256).digest())
+
+        header = b'{"alg": "HS256", "typ": "JWT"}'
+        tokens = [
+            sign(b'[]', b'{}'),
+            sign(b'{"alg": ["HS256"]}', b'{}'),
+            sign(header, b'["test@example.com"]'),
+            sign(header, b'{"exp": "tomorrow"}'),
+            sign(header, b'{"nbf": "soon"}'),
+        ]
+        for token in tokens:
+            with self.subTest(token=token):
+                with self.assertRaises(JWTError):
+                    jwt.decode(token, SECRET, algorithms=['HS256'])
+                with self.assertRaises(JWTError):
+                    self.backend.decode(token, SECRET, algorithms=['HS256'])
+
+    def test_backend_selection(self):
+        self.assertIsInstance(get_jwt_backend('HS256'), HMACJWT)
+        self.assertIs(get_jwt_backend('HS256', fast_path=False), jwt)
+        self.assertIs(get_jwt_backend('RS256'), jwt)
+
+
+class TestTokenCache(unittest.IsolatedAsyncioTestCase):
+    async def test_cached_token_skips_verification(self):
+        auth = Auth()
+        auth.token_cache = LRUCache(maxsize=10, ttl=0)
+        auth.jwt_backend = MagicMock(wraps=HMACJWT())
+        token = await auth.create_access_token({'sub': 'test@example.com'})
+        user = User(id=1, email='test@example.com')
+        with patch('src.services.auth.user_cache') as user_cache:
+            user_cache.get = AsyncMock(return_value=user)
+            self.assertIs(await auth.get_current_user(token, MagicMock()), user)
+            self.assertIs(await auth.get_current_user(token, MagicMock()), user)
+        auth.jwt_backend.decode.assert_called_once()
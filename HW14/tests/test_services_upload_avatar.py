@@ -1,9 +1,17 @@
+import io
+import tempfile
+import threading
+from pathlib import Path
+
 import cloudinary.uploader
 
-from unittest import TestCase
+from unittest import IsolatedAsyncioTestCase, TestCase
 from unittest.mock import patch
 
-from src.services.upload_avatar import UploadService
+from fastapi import HTTPException, UploadFile
+from PIL import Image
+
+from src.services.upload_avatar import AvatarService, CloudinaryStorage, LocalStorage, UploadService, process_image
 
 
 class MockedUploader:
@@ -42,3 +50,72 @@ class TestUploadService(TestCase):
 
         url = UploadService.get_url_avatar(public_id, version)
         self.assertEqual(url, expected_url)
+
+
+def make_image(size=(800, 600), fmt='JPEG', mode='RGB'):
+    out = io.BytesIO()
+    Image.new(mode, size, 'red').save(out, format=fmt)
+    return out.getvalue()
+
+
+def make_upload(data: bytes):
+    return UploadFile(filename='avatar.jpg', file=io.BytesIO(data))
+
+
+class TestProcessImage(TestCase):
+    def test_resized_to_square(self):
+        result = process_image(make_image(), 250, 'webp', 85)
+        with Image.open(io.BytesIO(result)) as image:
+            self.assertEqual(image.size, (250, 250))
+            self.assertEqual(image.format, 'WEBP')
+
+    def test_transparent_png_to_jpeg(self):
+        result = process_image(make_image(fmt='PNG', mode='RGBA'), 100, 'jpeg', 85)
+        with Image.open(io.BytesIO(result)) as image:
+            self.assertEqual(image.mode, 'RGB')
+            self.assertEqual(image.size, (100, 100))
+
+
+class TestAvatarService(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.service = AvatarService(storage=LocalStorage(self.tmp.name, '/static/avatars/'), size=64, fmt='webp',
+                                     max_bytes=1024 * 1024, workers=1)
+
+    def tearDown(self):
+        self.service.shutdown()
+        self.tmp.cleanup()
+
+    async def test_upload_stores_resized_image(self):
+        url = await self.service.upload(make_upload(make_image()), 'web10/abc123')
+
+        self.assertTrue(url.startswith('/static/avatars/web10/abc123.webp?v='))
+        with Image.open(Path(self.tmp.name) / 'web10' / 'abc123.webp') as image:
+            self.assertEqual(image.size, (64, 64))
+
+    async def test_upload_too_large(self):
+        self.service.max_bytes = 1000
+        with self.assertRaises(HTTPException) as context:
+            await self.service.upload(make_upload(b'0' * 200_000), 'web10/abc123')
+        self.assertEqual(context.exception.status_code, 413)
+
+    async def test_upload_not_an_image(self):
+        with self.assertRaises(HTTPException) as context:
+            await self.service.upload(make_upload(b'not an image'), 'web10/abc123')
+        self.assertEqual(context.exception.status_code, 415)
+
+    async def test_cloudinary_upload_runs_in_thread(self):
+        calls = []
+
+        def upload(file, public_id, overwrite=True):
+            calls.append((threading.current_thread() is threading.main_thread(), file.read()))
+            return {"version": "1"}
+
+        service = AvatarService(storage=CloudinaryStorage(), size=32, workers=1)
+        with patch.object(cloudinary.uploader, "upload", upload):
+            url = await service.upload(make_upload(make_image()), 'web10/abc123')
+        service.shutdown()
+
+        self.assertFalse(calls[0][0])
+        self.assertTrue(calls[0][1].startswith(b'RIFF'))
+        self.assertIn('web10/abc123', url)